@@ -0,0 +1,43 @@
+import secrets
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from app.core.config import settings
+from app.core.loop_monitor import LoopMonitor, MAX_PROFILE_SECONDS
+
+
+def require_admin_token(x_admin_token: str | None = Header(default=None)):
+    """校验管理令牌；未配置 ADMIN_API_TOKEN 时管理接口整体关闭。"""
+    if not settings.ADMIN_API_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, settings.ADMIN_API_TOKEN):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["Admin"],
+    dependencies=[Depends(require_admin_token)],
+)
+
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def profile(
+    seconds: float = Query(default=10, gt=0, le=MAX_PROFILE_SECONDS),
+    interval_ms: float = Query(default=5, ge=1, le=1000),
+):
+    """
+    对所有线程做一次限时采样分析，返回折叠格式的调用栈 (每行 '栈 次数')，
+    可直接交给 flamegraph.pl 或 speedscope 生成火焰图。
+    """
+    folded = await LoopMonitor.profile(seconds, interval_ms / 1000)
+    if folded is None:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    return PlainTextResponse(folded)
+
+
+@router.get("/stalls")
+async def stalls():
+    """最近几次事件循环阻塞时抓取到的调用栈。"""
+    return {"threshold_seconds": settings.LOOP_STALL_THRESHOLD_SECONDS, "stalls": LoopMonitor.recent_stalls()}
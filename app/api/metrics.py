@@ -0,0 +1,23 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from app.core.metrics import MetricsRegistry
+from app.core.supervisor import TaskSupervisor
+
+router = APIRouter(tags=["Metrics"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """以 Prometheus 文本格式导出运行指标。"""
+    return PlainTextResponse(await MetricsRegistry.render(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/health")
+async def health():
+    """后台任务的存活状态；有任务处于崩溃后等待重启的状态时返回 503。"""
+    healthy = TaskSupervisor.healthy()
+    return JSONResponse(
+        {"status": "ok" if healthy else "degraded", "workers": TaskSupervisor.status()},
+        status_code=200 if healthy else 503,
+    )
@@ -0,0 +1,40 @@
+import logging
+import secrets
+
+from fastapi import APIRouter, Header, HTTPException, Request
+from telegram import Update
+
+from app.core.config import settings
+
+TELEGRAM_WEBHOOK_PATH = "/telegram/webhook"
+
+router = APIRouter(tags=["Telegram"])
+
+
+@router.post(TELEGRAM_WEBHOOK_PATH)
+async def telegram_webhook(
+    request: Request,
+    x_telegram_bot_api_secret_token: str | None = Header(default=None),
+):
+    """
+    接收 Telegram 推送的 update，校验密钥后放入 ptb_app.update_queue 立即返回，
+    实际处理由 PTB 的 update 处理器异步完成。
+    """
+    if not settings.WEBHOOK_SECRET_TOKEN or not x_telegram_bot_api_secret_token or not secrets.compare_digest(
+        x_telegram_bot_api_secret_token, settings.WEBHOOK_SECRET_TOKEN
+    ):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    ptb_app = getattr(request.app.state, "ptb_app", None)
+    if ptb_app is None or not ptb_app.running:
+        # 让 Telegram 稍后重试
+        raise HTTPException(status_code=503, detail="Bot is not ready")
+
+    try:
+        update = Update.de_json(await request.json(), ptb_app.bot)
+    except Exception as e:
+        logging.warning(f"无法解析 Telegram webhook 推送: {e}")
+        raise HTTPException(status_code=400, detail="Bad Request")
+
+    await ptb_app.update_queue.put(update)
+    return {"ok": True}
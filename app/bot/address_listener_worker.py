@@ -1,90 +1,98 @@
 import asyncio
 import logging
+import time
 from datetime import datetime
 from telegram.ext import Application
-from pymongo.errors import DuplicateKeyError # 1. 导入 DuplicateKeyError 异常
 
-from app.db.models import StreamState
 from app.services.monitoring_service import MonitoringService
-from app.services.tron_service import TronService
-from app.bot.utils import PROCESSED_TX_CACHE_ADDRESS as PROCESSED_TX_CACHE, clear_expired_cache
+from app.services.event_bus import TransactionEventBus
+from app.services.stream_state_service import ConsumerCursors
+from app.services.dedup_service import ProcessedTxStore
+from app.services.lease_service import LeaseService
+from app.core.config import settings
+from app.core.metrics import WORKER_CYCLE_SECONDS
 
 LISTENER_POLL_INTERVAL_SECONDS = 6
+# 监听进度的落盘间隔。重启后最多重放这段时间内的交易，由去重缓存兜底
+LISTENER_CHECKPOINT_INTERVAL_SECONDS = 30
+# 首次监听一个地址时，从多久以前开始处理
+LISTENER_INITIAL_LOOKBACK_SECONDS = 300
+
 
 async def address_listener_worker(ptb_app: Application):
     """
-    后台轮询任务，用于监听所有用户添加的地址。
-    增加了对数据库并发写入冲突的健壮处理。
+    后台任务，消费事件总线上用户监听地址的新交易并发送收支提醒。
+    本任务定期刷新需要监听的地址集合，链上数据由 chain_ingest_worker 统一拉取。
+    多副本部署时只监听本副本持有租约的分片中的地址。
     """
     logging.info("--- Address Listener Worker Started ---")
 
+    cursors = ConsumerCursors(
+        "monitor",
+        lease_for=LeaseService.shard_lease_name,
+        checkpoint_interval=LISTENER_CHECKPOINT_INTERVAL_SECONDS,
+        initial_lookback_seconds=LISTENER_INITIAL_LOOKBACK_SECONDS,
+    )
+    subscription = TransactionEventBus.subscribe(
+        "monitor", cursors, poll_interval=LISTENER_POLL_INTERVAL_SECONDS, priority=1
+    )
+    max_age_ms = settings.BACKFILL_MAX_LOOKBACK_HOURS * 3600 * 1000
+    processed_txs = ProcessedTxStore("monitor")
+    await processed_txs.warm_up()
+    next_refresh = 0.0
+
     while True:
         try:
-            # 清理过期的内存缓存
-            clear_expired_cache()
+            if time.monotonic() >= next_refresh:
+                unique_addresses = await MonitoringService.get_all_unique_addresses()
+                owned_addresses = {a for a in unique_addresses if LeaseService.owns_address(a)}
+                if owned_addresses != subscription.addresses:
+                    logging.info(
+                        f"地址监听器正在监听 {len(owned_addresses)}/{len(unique_addresses)} 个地址 "
+                        f"(分片 {sorted(LeaseService.owned_shards())})..."
+                    )
+                subscription.watch(owned_addresses)
+                next_refresh = time.monotonic() + LISTENER_POLL_INTERVAL_SECONDS
 
-            unique_addresses = await MonitoringService.get_all_unique_addresses()
-            if not unique_addresses:
-                await asyncio.sleep(LISTENER_POLL_INTERVAL_SECONDS)
+            event = await subscription.get(timeout=LISTENER_POLL_INTERVAL_SECONDS)
+            if event is None:
+                await cursors.checkpoint()
                 continue
-            
-            logging.info(f"地址监听器正在检查 {len(unique_addresses)} 个地址...")
 
-            for address in unique_addresses:
-                # --- 2. 使用更健壮的“查找或创建”逻辑 ---
-                process_state = await StreamState.find_one(StreamState.address == address)
-                
-                if not process_state:
-                    # 如果数据库中不存在此地址的进度记录，我们尝试创建它
-                    try:
-                        last_timestamp = int((datetime.now().timestamp() - 300) * 1000)
-                        process_state = StreamState(address=address, last_processed_timestamp=last_timestamp)
-                        await process_state.insert()
-                        logging.info(f"为地址 {address} 首次创建处理状态。")
-                    except DuplicateKeyError:
-                        # 如果在我们尝试插入的瞬间，payment_worker 已经抢先插入了，
-                        # 那么 insert() 会失败。这没关系，我们只需要再查一次就能拿到它。
-                        logging.warning(f"为地址 {address} 创建状态时发生竞争，将重新查询。")
-                        process_state = await StreamState.find_one(StreamState.address == address)
-                        if not process_state:
-                            # 这种情况极少发生，但作为最终保险
-                            logging.error(f"在竞争后仍无法找到地址 {address} 的状态！")
-                            continue # 跳过此地址的本次处理
+            try:
+                if not LeaseService.owns_address(event.address):
+                    # 排队期间该分片已经转交给其他副本
+                    continue
+                with WORKER_CYCLE_SECONDS.time(worker="address_listener"):
+                    last_timestamp = await cursors.ensure(event.address)
+                    for tx in event.transactions:
+                        if tx.timestamp <= last_timestamp or processed_txs.contains(tx.tx_id):
+                            logging.debug(f"跳过已处理的交易 {tx.tx_id} (Timestamp: {tx.timestamp})")
+                            continue
 
-                # 从有效的 process_state 对象中获取时间戳
-                last_timestamp = process_state.last_processed_timestamp
-                
-                # 为了安全，我们查询时可以稍微回退一点点时间
-                query_timestamp = last_timestamp - 1000
-                new_transactions = await TronService.get_new_transactions(address, query_timestamp)
-                
-                if new_transactions:
-                    latest_tx_timestamp_in_batch = last_timestamp
+                        logging.info(f"发现一笔新的、未处理过的交易 {tx.tx_id} for address {event.address}")
 
-                    for tx in new_transactions:
-                        if tx.timestamp > last_timestamp and tx.tx_id not in PROCESSED_TX_CACHE:
-                            logging.info(f"发现一笔新的、未处理过的交易 {tx.tx_id} for address {address}")
-                            
-                            if (datetime.now().timestamp() * 1000) - tx.timestamp > 3600 * 1000:
-                                continue
-                            
-                            await MonitoringService.handle_webhook_transaction(tx)
-                            
-                            PROCESSED_TX_CACHE[tx.tx_id] = datetime.now().timestamp()
-                            
-                            if tx.timestamp > latest_tx_timestamp_in_batch:
-                                latest_tx_timestamp_in_batch = tx.timestamp
-                        else:
-                            logging.debug(f"跳过已处理或过时的交易 {tx.tx_id} (Timestamp: {tx.timestamp})")
+                        # 补数可能带来较早的交易，超过补数上限的过旧交易不再提醒
+                        if (datetime.now().timestamp() * 1000) - tx.timestamp <= max_age_ms:
+                            if await processed_txs.claim(tx.tx_id):
+                                try:
+                                    await MonitoringService.handle_webhook_transaction(tx)
+                                except Exception:
+                                    # 处理失败时撤销认领，这笔交易稍后会被重新投递
+                                    await processed_txs.release(tx.tx_id)
+                                    raise
 
-                    if latest_tx_timestamp_in_batch > last_timestamp:
-                        process_state.last_processed_timestamp = latest_tx_timestamp_in_batch
-                        await process_state.save()
-                        logging.info(f"地址 {address} 的处理进度已更新至时间戳: {latest_tx_timestamp_in_batch}")
+                        cursors.advance(event.address, tx.timestamp)
+                    if event.watermark is not None:
+                        cursors.advance(event.address, event.watermark)
+                    await cursors.checkpoint()
+            except Exception:
+                # 进度停在失败的交易之前，让摄取任务从这里重新投递
+                subscription.rewind(event.address)
+                raise
+            finally:
+                subscription.task_done()
 
-                await asyncio.sleep(1) 
-                
         except Exception as e:
             logging.error(f"地址监听任务发生错误: {e}", exc_info=True)
-        
-        await asyncio.sleep(LISTENER_POLL_INTERVAL_SECONDS)
\ No newline at end of file
+            await asyncio.sleep(LISTENER_POLL_INTERVAL_SECONDS)
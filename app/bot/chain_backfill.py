@@ -0,0 +1,152 @@
+import asyncio
+import itertools
+import logging
+from datetime import datetime, timezone
+from typing import List, Optional, Set
+
+from app.core.config import settings
+from app.core.rate_limit import TokenBucket
+from app.services.event_bus import TransactionEventBus
+from app.services.tron_service import TronService
+
+# 每次补数拉取的时间窗口
+BACKFILL_WINDOW_SECONDS = 600
+# 距离当前时间在该范围内即视为追上，交还给常规的低延迟轮询
+BACKFILL_HANDOFF_SECONDS = 60
+# 补数出错后的重试间隔
+BACKFILL_RETRY_SECONDS = 10
+
+
+def _now_ms() -> int:
+    return int(datetime.now(timezone.utc).timestamp() * 1000)
+
+
+class ChainBackfill:
+    """
+    停机后的追赶补数。
+    常规轮询每次只拉取最新的一页交易，落后太多时永远追不上。
+    当某个地址的进度远远落后于当前时间时，摄取任务把它交给这里：
+    按时间窗口正序翻页拉取历史交易并投递给消费者，追上后交还给常规轮询。
+    - 收款地址 (优先级 0) 立即开始补数，不受并发名额限制；
+    - 监听地址排队，由有限个补数协程处理，并在收款地址补数期间暂停让路；
+    - 所有补数请求共享一个速率预算，避免挤占实时轮询的额度。
+    """
+    _active: Set[str] = set()
+    _queue: Optional[asyncio.PriorityQueue] = None
+    _sequence = itertools.count()
+    _workers: List[asyncio.Task] = []
+    # 收款地址的补数不经过协程池，单独记录以便停止
+    _priority_tasks: Set[asyncio.Task] = set()
+    _priority_running = 0
+    _priority_idle: Optional[asyncio.Event] = None
+    _rate_limiter = TokenBucket(settings.BACKFILL_REQUESTS_PER_SECOND)
+
+    @staticmethod
+    def start():
+        """启动补数协程池 (由摄取任务在事件循环中调用)。"""
+        if ChainBackfill._queue is not None:
+            return
+        ChainBackfill._queue = asyncio.PriorityQueue()
+        ChainBackfill._priority_idle = asyncio.Event()
+        ChainBackfill._priority_idle.set()
+        ChainBackfill._workers = [
+            asyncio.create_task(ChainBackfill._pool_worker())
+            for _ in range(settings.BACKFILL_CONCURRENCY)
+        ]
+
+    @staticmethod
+    async def stop():
+        """
+        停止所有补数 (摄取任务停止时调用)。
+        补数过程中的进度只在消费者处理完投递的事件后才推进，下次启动时会由摄取任务重新安排。
+        """
+        tasks = ChainBackfill._workers + list(ChainBackfill._priority_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        ChainBackfill._workers = []
+        ChainBackfill._priority_tasks.clear()
+        ChainBackfill._queue = None
+        ChainBackfill._active.clear()
+        ChainBackfill._priority_running = 0
+
+    @staticmethod
+    def is_active(address: str) -> bool:
+        return address in ChainBackfill._active
+
+    @staticmethod
+    def needs_backfill(since_timestamp: int) -> bool:
+        return _now_ms() - since_timestamp > settings.CATCHUP_THRESHOLD_SECONDS * 1000
+
+    @staticmethod
+    def schedule(address: str, priority: int):
+        """为地址安排一次补数；已在补数中的地址会被忽略。"""
+        if address in ChainBackfill._active:
+            return
+        ChainBackfill._active.add(address)
+        logging.info(f"地址 {address[:10]}... 进度落后较多，进入补数模式 (优先级 {priority})。")
+
+        if priority == 0:
+            task = asyncio.create_task(ChainBackfill._run(address, priority))
+            ChainBackfill._priority_tasks.add(task)
+            task.add_done_callback(ChainBackfill._priority_tasks.discard)
+        else:
+            ChainBackfill._queue.put_nowait((priority, next(ChainBackfill._sequence), address))
+
+    @staticmethod
+    async def _pool_worker():
+        while True:
+            priority, _, address = await ChainBackfill._queue.get()
+            try:
+                await ChainBackfill._run(address, priority)
+            finally:
+                ChainBackfill._queue.task_done()
+
+    @staticmethod
+    async def _run(address: str, priority: int):
+        if priority == 0:
+            ChainBackfill._priority_running += 1
+            ChainBackfill._priority_idle.clear()
+        try:
+            await ChainBackfill._backfill_address(address, priority)
+        except Exception as e:
+            logging.error(f"地址 {address[:10]}... 补数失败，稍后由摄取任务重新安排: {e}", exc_info=True)
+            await asyncio.sleep(BACKFILL_RETRY_SECONDS)
+        finally:
+            ChainBackfill._active.discard(address)
+            if priority == 0:
+                ChainBackfill._priority_running -= 1
+                if ChainBackfill._priority_running == 0:
+                    ChainBackfill._priority_idle.set()
+
+    @staticmethod
+    async def _backfill_address(address: str, priority: int):
+        delivered = 0
+        while True:
+            subscriptions = TransactionEventBus.subscribers_for(address)
+            if not subscriptions:
+                return
+
+            now_ms = _now_ms()
+            positions = {sub.name: await sub.resume_position(address) for sub in subscriptions}
+            # 不会往回补超过上限的历史
+            since = max(min(positions.values()), now_ms - settings.BACKFILL_MAX_LOOKBACK_HOURS * 3600 * 1000)
+            if now_ms - since <= BACKFILL_HANDOFF_SECONDS * 1000:
+                logging.info(f"地址 {address[:10]}... 补数完成，共投递 {delivered} 笔交易，交还常规轮询。")
+                return
+
+            if priority > 0:
+                # 收款地址补数期间，监听地址的补数暂停让路
+                await ChainBackfill._priority_idle.wait()
+
+            until = min(since + BACKFILL_WINDOW_SECONDS * 1000, now_ms)
+            transactions = await TronService.get_transactions_in_range(
+                address, since + 1, until, rate_limiter=ChainBackfill._rate_limiter
+            )
+            for sub in subscriptions:
+                sub.mark_scanned(address, until)
+                batch = [tx for tx in transactions if tx.timestamp > positions[sub.name]]
+                # 即使窗口内没有交易也投递水位线，让消费者的进度向前推进
+                await sub.deliver(address, batch, watermark=max(until, positions[sub.name]))
+                delivered += len(batch)
+            await TransactionEventBus.deliver_passive(address, transactions, covered=(since + 1, until))
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+from telegram.ext import Application
+
+from app.services.event_bus import Subscription, TransactionEventBus
+from app.services.tron_service import TronService
+from app.bot.chain_backfill import ChainBackfill
+from app.core.metrics import WORKER_CYCLE_SECONDS
+
+# 没有到期地址时的空转间隔
+INGEST_TICK_SECONDS = 0.5
+# 两个地址之间的间隔，避免瞬间打满 TronGrid 的速率限制
+INGEST_ADDRESS_DELAY_SECONDS = 0.2
+
+
+async def ingest_address(address: str, subscriptions: List[Subscription]):
+    """拉取单个地址的新交易并发布到事件总线。"""
+    # 从所有关心该地址的消费者中最落后的位置开始拉取，保证谁都不会漏掉交易
+    positions = {sub.name: await sub.resume_position(address) for sub in subscriptions}
+    since = min(positions.values())
+
+    # 落后太多时 (例如停机之后)，常规轮询只能拿到最新一页，交给补数任务翻页追赶
+    if ChainBackfill.needs_backfill(since):
+        ChainBackfill.schedule(address, min(sub.priority for sub in subscriptions))
+        return
+
+    # 为了安全，我们查询时可以稍微回退一点点时间
+    query_timestamp = since - 1000
+    scanned_at = int(time.time() * 1000)
+    new_transactions, complete = await TronService.poll_transactions(address, query_timestamp)
+    if not complete:
+        # 这一页被截断 (交易太多) 或有接口出错：不能投递这部分结果，
+        # 否则消费者的进度会越过没拿到的较早交易。改为翻页拉取整个区间，出错时抛出，下一轮重试
+        logging.info(f"地址 {address[:10]}... 的常规轮询结果不完整，翻页拉取 {query_timestamp} 之后的全部交易。")
+        new_transactions = await TronService.get_transactions_in_range(address, query_timestamp, scanned_at)
+    for sub in subscriptions:
+        sub.mark_scanned(address, scanned_at)
+    # 到这里 [query_timestamp, scanned_at] 内的交易已全部拿到，交易流水据此记录覆盖范围
+    covered = (query_timestamp, scanned_at)
+    if new_transactions:
+        logging.debug(f"摄取任务在地址 {address[:10]}... 拉取到 {len(new_transactions)} 笔交易")
+        # 每个订阅者只收到它还没有收到过的交易
+        for sub in subscriptions:
+            await sub.deliver(address, [tx for tx in new_transactions if tx.timestamp > positions[sub.name]])
+    await TransactionEventBus.deliver_passive(address, new_transactions, covered=covered)
+
+
+def _pick_due_address(next_due: Dict[str, float]) -> Optional[Tuple[str, List[Subscription]]]:
+    """
+    选出下一个需要拉取的地址：优先级最高 (数值最小) 的订阅者优先，
+    同优先级中到期最早的优先。没有到期地址时返回 None。
+    """
+    now = time.monotonic()
+    watched = TransactionEventBus.watched_addresses()
+    best_key = None
+    best = None
+    for address in watched:
+        due = next_due.get(address, 0.0)
+        if due > now and TransactionEventBus.poll_requested(address):
+            due = 0.0
+        if due > now or ChainBackfill.is_active(address):
+            continue
+        subscriptions = TransactionEventBus.subscribers_for(address)
+        key = (min(sub.priority for sub in subscriptions), due)
+        if best_key is None or key < best_key:
+            best_key = key
+            best = (address, subscriptions)
+
+    # 清理已经没有订阅者关心的地址
+    for address in list(next_due):
+        if address not in watched:
+            del next_due[address]
+
+    return best
+
+
+async def chain_ingest_worker(ptb_app: Application):
+    """
+    后台摄取任务：按各订阅者声明的轮询间隔拉取它们关心的地址，
+    每个地址每轮只拉取一次，统一发布到事件总线，由支付监听和地址监听等消费者各自处理。
+    """
+    logging.info("--- Chain Ingest Worker Started ---")
+    ChainBackfill.start()
+    next_due: Dict[str, float] = {}
+
+    try:
+        while True:
+            try:
+                picked = _pick_due_address(next_due)
+                if picked is None:
+                    await asyncio.sleep(INGEST_TICK_SECONDS)
+                    continue
+
+                address, subscriptions = picked
+                TransactionEventBus.take_poll_request(address)
+                # 同一地址被多个消费者关心时，按最短的轮询间隔拉取
+                next_due[address] = time.monotonic() + min(sub.poll_interval for sub in subscriptions)
+                try:
+                    with WORKER_CYCLE_SECONDS.time(worker="chain_ingest"):
+                        await ingest_address(address, subscriptions)
+                except Exception as e:
+                    logging.error(f"摄取地址 {address[:10]}... 的交易时出错: {e}", exc_info=True)
+                await asyncio.sleep(INGEST_ADDRESS_DELAY_SECONDS)
+
+            except Exception as e:
+                logging.error(f"链上摄取任务发生错误: {e}", exc_info=True)
+                await asyncio.sleep(INGEST_TICK_SECONDS)
+    finally:
+        # 补数协程也是生产者，随摄取任务一起停止 (关闭或被监管者重启时)
+        await ChainBackfill.stop()
@@ -1,7 +1,12 @@
+import asyncio
+import csv
+import io
 import logging
 import textwrap
 import functools
-from telegram import Update
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from telegram import InputFile, Update
 from telegram.ext import (
     ContextTypes,
     CallbackQueryHandler,
@@ -12,12 +17,16 @@ from telegram.ext import (
     ApplicationHandlerStop,
 )
 from telegram.constants import ParseMode
+from telegram.error import BadRequest
+from telegram.helpers import escape_markdown
 
 from app.bot import keyboards
 from app.bot import constants as const
 from app.core.config import settings
+from app.core.tron_address import is_valid_tron_address
 from app.bot.utils import clear_pending_actions, reply, cancel_conversation
 from app.services.monitoring_service import MonitoringService
+from app.services.statement_service import StatementService, spool_csv
 from app.bot.keyboards import build_monitor_this_address_keyboard
 from app.services.tron_service import TronService, TronAccountDetails
 
@@ -35,50 +44,86 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 # --- 监听列表功能处理器 ---
 
 # 状态定义 (用于添加地址和设置备注的会话)
-(ASK_ADDRESS, ASK_NICKNAME_FOR_NEW, ASK_NICKNAME_FOR_EXISTING) = range(3)
+(ASK_ADDRESS, ASK_NICKNAME_FOR_NEW, ASK_NICKNAME_FOR_EXISTING, ASK_IMPORT_ADDRESSES) = range(4)
 
+# 批量导入时允许上传的文件大小上限
+MONITOR_IMPORT_MAX_FILE_BYTES = 512 * 1024
+# 导出 CSV 的列，导入时只读取前两列 (地址, 备注)
+MONITOR_EXPORT_COLUMNS = [
+    "address", "nickname", "notify_on_incoming", "notify_on_outgoing", "notify_trx", "notify_usdt", "created_at",
+]
 
-async def handle_monitor_list(
+
+async def _render_monitor_list(user_id: int, page: int):
+    """查询一页监听地址，返回 (文本, 键盘, 实际页码)。"""
+    addresses, total, page = await MonitoringService.get_user_addresses_page(user_id, page)
+    if total == 0:
+        text = "您的监听列表是空的。\n点击下方“➕ 添加新地址”按钮来添加一个吧！"
+    else:
+        text = f"已添加地址共 {total} 个\n\n点击下方对应按钮可进行操作。"
+    return text, keyboards.build_monitor_list_keyboard(addresses, page, total), page
+
+
+async def send_monitor_list(
     update: Update, context: ContextTypes.DEFAULT_TYPE
-) -> None:
+) -> int:
     """
-    处理 "🛎️监听列表" 按钮
+    发送监听列表的第一页，返回地址总数。
+    会话中的处理器在结束会话前用它显示列表，它不会抛出 ApplicationHandlerStop，
+    否则 PTB 会忽略处理器返回的 ConversationHandler.END，让会话停留在原状态。
     """
-    clear_pending_actions(context)
-
     user_id = update.effective_user.id
-    addresses = await MonitoringService.get_user_addresses(user_id)
+    addresses, total, _ = await MonitoringService.get_user_addresses_page(user_id, 0)
+    context.user_data["monitor_list_page"] = 0
 
-    if not addresses:
-        # 如果列表为空，只发送提示文本
+    if not total:
+        # 如果列表为空，发送提示文本和添加/导入按钮
         text = "你没有绑定过监听地址"
-        await reply(update, text)
-        return
+        await reply(update, text, reply_markup=keyboards.build_monitor_list_keyboard([]))
+        return 0
 
-    # 如果列表不为空，显示带有按钮的列表 (逻辑保持不变)
-    text = f"已添加地址共 {len(addresses)} 个\n点击按钮可对地址进行操作"
-    keyboard = keyboards.build_monitor_list_keyboard(addresses)
+    text = f"已添加地址共 {total} 个\n点击按钮可对地址进行操作"
+    keyboard = keyboards.build_monitor_list_keyboard(addresses, 0, total)
     await reply(update, text, reply_markup=keyboard, parse_mode="Markdown")
-    raise ApplicationHandlerStop
+    return total
+
+
+async def handle_monitor_list(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+) -> None:
+    """
+    处理 "🛎️监听列表" 按钮
+    """
+    clear_pending_actions(context)
+
+    if await send_monitor_list(update, context):
+        raise ApplicationHandlerStop
 
 
 async def show_monitoring_list_callback(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ):
     """
-    处理内联键盘的回调，用于返回并显示地址列表 (第一层)
+    处理内联键盘的回调，用于返回并显示地址列表 (第一层)。
+    翻页按钮带有目标页码；其他入口 (返回列表、删除后刷新) 回到用户上次浏览的页。
     """
     query = update.callback_query
     await query.answer()
     user_id = update.effective_user.id
-    addresses = await MonitoringService.get_user_addresses(user_id)
 
-    text = f"已添加地址共 {len(addresses)} 个\n\n点击下方对应按钮可进行操作。"
-    if not addresses:
-        text = "您的监听列表是空的。\n点击下方“➕ 添加新地址”按钮来添加一个吧！"
+    if query.data.startswith("monitor_list_page:"):
+        page = int(query.data.split(":")[1])
+    else:
+        page = context.user_data.get("monitor_list_page", 0)
 
-    keyboard = keyboards.build_monitor_list_keyboard(addresses)
-    await query.edit_message_text(text, reply_markup=keyboard, parse_mode="Markdown")
+    text, keyboard, page = await _render_monitor_list(user_id, page)
+    context.user_data["monitor_list_page"] = page
+    try:
+        await query.edit_message_text(text, reply_markup=keyboard, parse_mode="Markdown")
+    except BadRequest as e:
+        # 点击当前页码刷新时内容可能没有变化
+        if "not modified" not in str(e):
+            raise
 
 
 async def show_monitor_actions_callback(
@@ -177,9 +222,9 @@ async def add_address_start_callback(
 async def ask_address_received(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """接收地址，并请求输入别名"""
     address = update.message.text.strip()
-    if not address.startswith("T") or len(address) != 34:
+    if not is_valid_tron_address(address):
         await update.message.reply_text(
-            "地址格式不正确，请重新发送一个T开头的TRON地址。"
+            "地址格式不正确或校验失败，请检查后重新发送一个T开头的TRON地址。"
         )
         return ASK_ADDRESS
 
@@ -204,7 +249,7 @@ async def ask_nickname_received(update: Update, context: ContextTypes.DEFAULT_TY
     )
 
     del context.user_data["new_monitor_address"]
-    await handle_monitor_list(update, context)  # 显示更新后的列表
+    await send_monitor_list(update, context)  # 显示更新后的列表
     return ConversationHandler.END
 
 
@@ -221,7 +266,7 @@ async def skip_nickname(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
     del context.user_data["new_monitor_address"]
-    await handle_monitor_list(update, context)
+    await send_monitor_list(update, context)
     return ConversationHandler.END
 
 
@@ -263,6 +308,218 @@ async def existing_nickname_received(
     del context.user_data["address_to_update"]
     return ConversationHandler.END
 
+def _parse_import_lines(text: str) -> Tuple[Dict[str, Optional[str]], List[str]]:
+    """
+    解析批量导入的内容：每行一个地址，可用逗号跟上备注 (与导出的 CSV 格式兼容)。
+    返回 (地址 -> 备注, 格式错误的行)，重复的地址只保留第一次出现的。
+    """
+    entries: Dict[str, Optional[str]] = {}
+    invalid: List[str] = []
+    for row in csv.reader(io.StringIO(text)):
+        if not row or not row[0].strip():
+            continue
+        address = row[0].strip().lstrip("\ufeff")
+        if address == "address":
+            # 跳过导出文件的表头
+            continue
+        if not is_valid_tron_address(address):
+            invalid.append(address)
+            continue
+        nickname = row[1].strip() if len(row) > 1 and row[1].strip() else None
+        entries.setdefault(address, nickname)
+    return entries, invalid
+
+
+async def import_addresses_start_callback(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+):
+    """会话入口：请求用户发送要批量导入的地址"""
+    query = update.callback_query
+    await query.answer()
+    await query.edit_message_text(
+        "请发送要导入的地址，每行一个，可以用逗号在地址后面加上备注，例如：\n"
+        "`TXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX,主钱包`\n\n"
+        f"也可以直接上传 .csv 或 .txt 文件 (格式相同，最多 {settings.MONITOR_IMPORT_MAX_ADDRESSES} 个地址)。\n\n"
+        "发送 /cancel 可以取消。",
+        parse_mode="Markdown",
+    )
+    return ASK_IMPORT_ADDRESSES
+
+
+async def import_addresses_received(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """接收批量导入的文本或文件，校验后一次性写入数据库"""
+    document = update.message.document
+    if document is not None:
+        if document.file_size and document.file_size > MONITOR_IMPORT_MAX_FILE_BYTES:
+            await update.message.reply_text(
+                f"文件过大，最多支持 {MONITOR_IMPORT_MAX_FILE_BYTES // 1024}KB，请分批导入。"
+            )
+            return ASK_IMPORT_ADDRESSES
+        telegram_file = await document.get_file()
+        content = bytes(await telegram_file.download_as_bytearray())
+        text = content.decode("utf-8-sig", errors="replace")
+    else:
+        text = update.message.text
+
+    entries, invalid = _parse_import_lines(text)
+    if not entries:
+        await update.message.reply_text("没有找到格式正确的TRON地址，请检查后重新发送。\n\n发送 /cancel 可以取消。")
+        return ASK_IMPORT_ADDRESSES
+    if len(entries) > settings.MONITOR_IMPORT_MAX_ADDRESSES:
+        await update.message.reply_text(
+            f"一次最多导入 {settings.MONITOR_IMPORT_MAX_ADDRESSES} 个地址 (本次 {len(entries)} 个)，请分批导入。"
+        )
+        return ASK_IMPORT_ADDRESSES
+
+    added, skipped = await MonitoringService.bulk_add_addresses(update.effective_user.id, entries)
+    text = f"✅ 批量导入完成\n新增: {added} 个\n已在列表中: {skipped} 个"
+    if invalid:
+        # 原样回显的内容可能含有 Markdown 符号，必须转义，否则整条回复会被 Telegram 拒绝。
+        # Markdown 的代码块内不支持转义，所以这里不再用反引号包裹
+        preview = "\n".join(escape_markdown(item[:40]) for item in invalid[:10])
+        more = f"\n... 等共 {len(invalid)} 个" if len(invalid) > 10 else ""
+        text += f"\n格式错误已跳过: {len(invalid)} 个\n{preview}{more}"
+    await update.message.reply_text(text, parse_mode="Markdown")
+
+    await send_monitor_list(update, context)
+    return ConversationHandler.END
+
+
+async def export_monitor_addresses_callback(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+):
+    """回调：把用户的监听列表导出为 CSV 文件"""
+    query = update.callback_query
+    await query.answer()
+    user_id = update.effective_user.id
+
+    async def rows():
+        async for entry in MonitoringService.iter_user_addresses(user_id):
+            yield [
+                entry.address, entry.nickname, entry.notify_on_incoming, entry.notify_on_outgoing,
+                entry.notify_trx, entry.notify_usdt, entry.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+            ]
+
+    # 与账单相同，逐行写入可溢出到磁盘的临时文件；导出的文件可以直接用于批量导入
+    output, count = await spool_csv(MONITOR_EXPORT_COLUMNS, rows())
+    try:
+        if count == 0:
+            await query.message.reply_text("您的监听列表是空的。")
+            return
+
+        filename = f"monitor_list_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        await query.message.reply_document(
+            document=InputFile(output, filename=filename),
+            caption=f"监听列表共 {count} 个地址",
+        )
+    finally:
+        output.close()
+
+
+# --- 账单导出 ---
+
+# 正在生成账单的后台任务 (用户ID -> 任务)，每个用户同一时间只生成一份
+_statement_tasks: Dict[int, asyncio.Task] = {}
+# /statement 命令未指定天数时的默认范围
+DEFAULT_STATEMENT_DAYS = 30
+
+
+async def _send_statement(context: ContextTypes.DEFAULT_TYPE, user_id: int, chat_id: int, address: str, days: int):
+    """生成并发送账单。链上拉取可能较慢，因此在后台任务中运行，不阻塞该用户的其他操作。"""
+    until = datetime.utcnow()
+    since = until - timedelta(days=days)
+    output = None
+    try:
+        output, count = await StatementService.build_csv(address, since, until)
+        filename = f"statement_{address[:6]}_{since:%Y%m%d}_{until:%Y%m%d}.csv"
+        await context.bot.send_document(
+            chat_id=chat_id,
+            document=InputFile(output, filename=filename),
+            caption=f"地址 {address[:6]}...{address[-4:]} 最近 {days} 天的账单，共 {count} 笔交易 (时间为 UTC)",
+        )
+    except Exception as e:
+        logging.error(f"为用户 {user_id} 生成地址 {address[:10]}... 的账单失败: {e}", exc_info=True)
+        await context.bot.send_message(chat_id=chat_id, text="❌ 生成账单失败，请稍后重试。")
+    finally:
+        if output is not None:
+            output.close()
+        _statement_tasks.pop(user_id, None)
+
+
+async def _start_statement(update: Update, context: ContextTypes.DEFAULT_TYPE, address: str, days: int) -> bool:
+    """启动账单生成任务；该用户已有账单在生成时返回 False。"""
+    user_id = update.effective_user.id
+    if user_id in _statement_tasks:
+        return False
+    _statement_tasks[user_id] = asyncio.create_task(
+        _send_statement(context, user_id, update.effective_chat.id, address, days)
+    )
+    return True
+
+
+async def statement_start_callback(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+):
+    """回调：选择账单的时间范围"""
+    query = update.callback_query
+    await query.answer()
+    address = query.data.split(":")[1]
+    await query.edit_message_text(
+        f"请选择地址\n`{address}`\n的账单时间范围：",
+        reply_markup=keyboards.build_statement_range_keyboard(address),
+        parse_mode="Markdown",
+    )
+
+
+async def statement_range_callback(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+):
+    """回调：按选择的时间范围生成账单"""
+    query = update.callback_query
+    _, days, address = query.data.split(":")
+    user_id = update.effective_user.id
+
+    if not await MonitoringService.get_monitor_entry(user_id, address):
+        await query.answer(text="该地址不在您的监听列表中。", show_alert=True)
+        return
+    if not await _start_statement(update, context, address, min(int(days), settings.STATEMENT_MAX_DAYS)):
+        await query.answer(text="已有账单正在生成，请稍候。", show_alert=True)
+        return
+
+    await query.answer(text="正在生成账单，完成后会以文件形式发送给您。")
+    await query.edit_message_text(
+        f"请对地址\n`{address}`\n进行操作",
+        reply_markup=keyboards.build_monitor_actions_keyboard(address),
+        parse_mode="Markdown",
+    )
+
+
+async def statement_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """处理 /statement <地址> [天数] 命令：导出监听地址的账单"""
+    usage = f"用法: /statement <地址> [天数]\n天数默认为 {DEFAULT_STATEMENT_DAYS}，最多 {settings.STATEMENT_MAX_DAYS}。"
+    if not context.args:
+        await update.message.reply_text(usage)
+        return
+    address = context.args[0]
+    try:
+        days = int(context.args[1]) if len(context.args) > 1 else DEFAULT_STATEMENT_DAYS
+    except ValueError:
+        await update.message.reply_text(usage)
+        return
+    if not is_valid_tron_address(address) or not 1 <= days <= settings.STATEMENT_MAX_DAYS:
+        await update.message.reply_text(usage)
+        return
+
+    user_id = update.effective_user.id
+    if not await MonitoringService.get_monitor_entry(user_id, address):
+        await update.message.reply_text("只能导出监听列表中的地址的账单，请先添加该地址。")
+        return
+    if not await _start_statement(update, context, address, days):
+        await update.message.reply_text("已有账单正在生成，请稍候。")
+        return
+    await update.message.reply_text("正在生成账单，完成后会以文件形式发送给您。")
+
+
 # 将所有会话处理器组合起来
 monitor_conv_handler = ConversationHandler(
     entry_points=[
@@ -272,6 +529,8 @@ monitor_conv_handler = ConversationHandler(
         ),
         # 入口2 处理 "📝 设置备注" 按钮点击
         CallbackQueryHandler(set_nickname_start_callback, pattern="^set_nickname:"),
+        # 入口3 处理 "📥 批量导入" 按钮点击
+        CallbackQueryHandler(import_addresses_start_callback, pattern="^import_monitor_addresses$"),
     ],
     states={
         # 状态：等待用户发送新地址
@@ -287,6 +546,12 @@ monitor_conv_handler = ConversationHandler(
         ASK_NICKNAME_FOR_EXISTING: [
             MessageHandler(filters.TEXT & ~filters.COMMAND, existing_nickname_received)
         ],
+        # 状态：等待用户发送批量导入的地址 (文本或文件)
+        ASK_IMPORT_ADDRESSES: [
+            MessageHandler(
+                (filters.TEXT & ~filters.COMMAND) | filters.Document.ALL, import_addresses_received
+            )
+        ],
     },
     # --- 在这里添加所有主菜单按钮作为 fallbacks ---
     fallbacks=[
@@ -294,12 +559,15 @@ monitor_conv_handler = ConversationHandler(
         CommandHandler(
             "cancel",
             functools.partial(
-                cancel_conversation, follow_up_action=handle_monitor_list
+                cancel_conversation, follow_up_action=send_monitor_list
             ),
         )
     ],
     # 允许用户通过点击其他按钮或发送命令来提前结束会话
     per_message=False,
+    # 会话状态保存在 MongoPersistence 中，重启后可以继续
+    name="monitor_conversation",
+    persistent=True,
 )
 
 
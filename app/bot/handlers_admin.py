@@ -0,0 +1,100 @@
+import logging
+from datetime import datetime, timedelta
+
+from telegram import Update
+from telegram.ext import ContextTypes
+from telegram.constants import ParseMode
+
+from app.core.config import settings
+from app.db.models import OrderStatus
+from app.services.order_latency_service import OrderLatencyService, LATENCY_PERCENTILES
+from app.services.order_stats_service import OrderStatsService
+
+# /latency 默认统计的时间窗口
+DEFAULT_LATENCY_WINDOW_HOURS = 24
+# /stats 可以查询的最长时间范围
+MAX_STATS_DAYS = 366
+MAX_STATS_HOURS = 24 * 7
+# /stats 展示的状态及顺序
+STATS_STATUSES = (
+    OrderStatus.PENDING_PAYMENT, OrderStatus.PAYMENT_SEEN, OrderStatus.PAID, OrderStatus.COMPLETED,
+    OrderStatus.EXPIRED, OrderStatus.CANCELED,
+)
+
+
+def is_admin(update: Update) -> bool:
+    """管理员命令只在管理员会话中生效。"""
+    return update.effective_chat is not None and update.effective_chat.id == settings.ADMIN_CHAT_ID
+
+
+async def latency_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    处理 /latency [小时数] 命令：按阶段显示最近一段时间内订单处理耗时的百分位数。
+    """
+    if not is_admin(update):
+        return
+
+    try:
+        hours = float(context.args[0]) if context.args else DEFAULT_LATENCY_WINDOW_HOURS
+    except ValueError:
+        await update.message.reply_text("用法: /latency [小时数]")
+        return
+
+    since = datetime.utcnow() - timedelta(hours=hours)
+    stages = await OrderLatencyService.stage_percentiles(since)
+    logging.info(f"管理员查询了最近 {hours} 小时的订单耗时统计。")
+
+    header = " / ".join(f"p{p}" for p in LATENCY_PERCENTILES)
+    lines = [f"⏱ 最近 {hours:g} 小时订单各阶段耗时 (秒, {header})", ""]
+    for stage in stages:
+        if stage.count == 0:
+            lines.append(f"{stage.description}: 无数据")
+            continue
+        values = " / ".join(f"{stage.percentiles[p]:.1f}" for p in LATENCY_PERCENTILES)
+        lines.append(f"{stage.description}: <code>{values}</code> (n={stage.count})")
+
+    await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML)
+
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    处理 /stats [天数 | 小时数h] 命令：按订单类型和币种显示下单、支付、收入等统计。
+    默认统计今天 (UTC)；例如 /stats 7 为最近 7 天，/stats 6h 为最近 6 小时。
+    """
+    if not is_admin(update):
+        return
+
+    usage = "用法: /stats [天数 | 小时数h]，例如 /stats、/stats 7、/stats 6h"
+    arg = context.args[0].lower() if context.args else "1"
+    try:
+        if arg.endswith("h"):
+            hours = int(arg[:-1])
+            if not 1 <= hours <= MAX_STATS_HOURS:
+                raise ValueError
+            since, granularity = OrderStatsService.window(hours=hours)
+            title = f"最近 {hours} 小时"
+        else:
+            days = int(arg)
+            if not 1 <= days <= MAX_STATS_DAYS:
+                raise ValueError
+            since, granularity = OrderStatsService.window(days=days)
+            title = "今天" if days == 1 else f"最近 {days} 天"
+    except ValueError:
+        await update.message.reply_text(usage)
+        return
+
+    rows = await OrderStatsService.summary(since, granularity=granularity)
+    lines = [f"📊 {title}订单统计 (UTC，自 {since:%Y-%m-%d %H:00} 起)", ""]
+    if not rows:
+        lines.append("暂无数据")
+    for row in rows:
+        lines.append(f"<b>{row.order_type} · {row.currency}</b>")
+        for status in STATS_STATUSES:
+            count, amount = row.statuses.get(status.value, (0, 0.0))
+            if status == OrderStatus.PAID:
+                lines.append(f"  {status.value}: {count} 单，收入 <code>{amount:.6f}</code> {row.currency}")
+            else:
+                lines.append(f"  {status.value}: {count} 单")
+        lines.append("")
+
+    await update.message.reply_text("\n".join(lines).rstrip(), parse_mode=ParseMode.HTML)
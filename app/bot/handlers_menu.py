@@ -13,6 +13,8 @@ from app.bot.keyboards import build_monitor_this_address_keyboard
 from app.services.tron_service import TronService
 from app.bot.utils import cleanup_order_message
 from app.db.models import Order, OrderType, OrderStatus
+from app.services.order_stats_service import OrderStatsService
+from app.bot.payment_worker import notify_order_created
 from app.bot import keyboards 
 
 # --- 主菜单按钮处理器 ---
@@ -80,6 +82,8 @@ async def handle_special_offer(
                 # details 为空，因为接收地址将是付款地址
             )
             await new_order.insert()
+            notify_order_created()
+            await OrderStatsService.record(new_order, OrderStatus.PENDING_PAYMENT)
             logging.info(f"为用户 {user_id} 创建了新的特价能量订单 {new_order.order_id}")
             
             # 构建“创建成功”的文案
@@ -21,8 +21,11 @@ from app.bot import keyboards
 from app.bot.utils import clear_pending_actions, reply, cancel_conversation
 from app.bot import constants as const
 from app.core.config import settings
+from app.core.tron_address import is_valid_tron_address
 from app.bot.utils import cleanup_order_message
 from app.db.models import Order, OrderType, OrderStatus
+from app.services.order_stats_service import OrderStatsService
+from app.bot.payment_worker import notify_order_created
 
 # --- "智能笔数" 购买会话 ---
 
@@ -120,9 +123,9 @@ async def smart_trx_address_received(
     """(状态1) 接收到地址，生成订单信息并结束会话"""
     receiver_address = update.message.text.strip()
 
-    if not receiver_address.startswith("T") or len(receiver_address) != 34:
+    if not is_valid_tron_address(receiver_address):
         await update.message.reply_text(
-            "❌ 地址格式不正确，请重新发送一个T开头的TRON地址（34个字符）。\n\n"
+            "❌ 地址格式不正确或校验失败，请检查后重新发送一个T开头的TRON地址（34个字符）。\n\n"
             "💡 提示：发送 /cancel 可以取消订单"
         )
         return RECEIVE_SMART_TRX_ADDRESS
@@ -170,7 +173,8 @@ async def generate_and_send_order_message(
     expiration_time = datetime.utcnow() + timedelta(minutes=30)
     expiration_str = expiration_time.strftime("%Y-%m-%d %H:%M:%S")
 
-    order_id = f"smart_{update.effective_user.id}_{int(datetime.now().timestamp())}"
+    # 毫秒级时间戳，避免同一秒内切换币种生成重复的订单号
+    order_id = f"smart_{update.effective_user.id}_{int(datetime.now().timestamp() * 1000)}"
 
     # Save order to database for payment detection
     try:
@@ -190,19 +194,13 @@ async def generate_and_send_order_message(
             }
         )
         await new_order.insert()
+        notify_order_created()
+        await OrderStatsService.record(new_order, OrderStatus.PENDING_PAYMENT)
         logging.info(f"创建智能笔数订单 {order_id}: {size}笔, {currency}, {total_amount}")
     except Exception as e:
         logging.error(f"保存智能笔数订单失败: {e}", exc_info=True)
         # Continue anyway, but payment detection won't work
 
-    # Also store in context for currency switching
-    context.chat_data[order_id] = {
-        "size": size,
-        "receiver_address": receiver_address,
-        "trx_amount": size * price_per_trx,
-        "usdt_amount": size * price_per_usdt
-    }
-
     # 能量代理地址：<code>{receiver_address}</code>
     response_text = textwrap.dedent(
         f"""
@@ -239,36 +237,23 @@ async def switch_currency_callback(
 
     _, order_id, new_currency = query.data.split(":")
 
-    # Try to get order data from database first, fallback to context
+    # 订单信息只从数据库读取 (order_id 有唯一索引)，不再缓存在 chat_data 中
     order = await Order.find_one(Order.order_id == order_id)
-    if order and order.status == OrderStatus.PENDING_PAYMENT:
-        order_data = {
-            "size": order.details.get("size"),
-            "receiver_address": order.details.get("receiver_address"),
-            "trx_amount": order.details.get("trx_amount"),
-            "usdt_amount": order.details.get("usdt_amount")
-        }
-        # Update order currency and amount in database
-        price_per_trx = settings.ENERGY_SMART_PRICE
-        price_per_usdt = settings.ENERGY_SMART_PRICE_USDT
-        size = order_data["size"]
-        
-        if new_currency == "TRX":
-            new_amount = size * price_per_trx
-        else:  # USDT
-            random_suffix = random.randint(1000, 9999) / 10000.0
-            new_amount = (size * price_per_usdt) + random_suffix
-        
-        order.currency = new_currency
-        order.expected_amount = new_amount
-        await order.save()
-        logging.info(f"订单 {order_id} 切换币种为 {new_currency}, 新金额: {new_amount}")
-    else:
-        # Fallback to context data
-        order_data = context.chat_data.get(order_id)
-        if not order_data:
-            await query.edit_message_text("订单信息已过期，请重新发起购买。")
-            return
+    if not order or order.status != OrderStatus.PENDING_PAYMENT:
+        await query.edit_message_text("订单信息已过期，请重新发起购买。")
+        return
+
+    # 切换币种会生成一笔新订单，原订单作废，避免两笔待支付订单同时匹配付款
+    result = await Order.find_one(
+        Order.id == order.id,
+        Order.status == OrderStatus.PENDING_PAYMENT,
+    ).update({"$set": {Order.status: OrderStatus.CANCELED}})
+    if result is None or result.modified_count == 0:
+        await query.edit_message_text("订单状态已变化，请重新发起购买。")
+        return
+    await OrderStatsService.record(order, OrderStatus.CANCELED)
+    logging.info(f"订单 {order_id} 切换币种为 {new_currency}，原订单已作废。")
+    order_data = order.details
 
     await generate_and_send_order_message(
         update,
@@ -297,6 +282,8 @@ smart_trx_conv_handler = ConversationHandler(
         )
     ],
     per_message=False,
+    name="smart_trx_conversation",
+    persistent=True,
 )
 
 # --- 取消订单的回调处理器 ---
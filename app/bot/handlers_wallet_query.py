@@ -1,6 +1,13 @@
+import asyncio
+import csv
+import io
 import logging
+import re
 import textwrap
-from telegram import Update
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+from telegram import InputFile, Message, Update
 from telegram.ext import (
     ContextTypes,
     CommandHandler,
@@ -13,9 +20,150 @@ from telegram.constants import ParseMode
 
 from app.bot import constants as const
 from app.bot.utils import clear_pending_actions, reply, cancel_conversation
-from app.services.tron_service import TronService
+from app.services.tron_service import TronAccountDetails
+from app.services.wallet_query_service import BulkWalletQuery, WalletQueryCache
 from app.bot.keyboards import build_monitor_this_address_keyboard
 from app.core.config import settings
+from app.core.tron_address import is_valid_tron_address
+
+# 批量查询超过该数量时以 CSV 文件返回结果，否则在消息中逐条展示
+BULK_QUERY_CSV_THRESHOLD = 20
+# 批量查询进度消息的最小编辑间隔，避免触发 Telegram 的编辑频率限制
+BULK_QUERY_EDIT_INTERVAL_SECONDS = 2.0
+# 地址之间允许的分隔符：空白、英文/中文逗号和分号
+ADDRESS_SEPARATORS = re.compile(r"[\s,;，；]+")
+
+# 后台刷新任务的引用，避免任务在完成前被回收
+_refresh_tasks: Set[asyncio.Task] = set()
+
+
+def format_account_details(details: TronAccountDetails, age_seconds: float) -> str:
+    """格式化钱包查询结果，附带数据的更新时间。"""
+    active_time_str = details.last_operation_time.strftime("%Y-%m-%d %H:%M:%S")
+    create_time_str = details.creation_time.strftime("%Y-%m-%d %H:%M:%S")
+    if age_seconds < 1:
+        age_str = "刚刚更新"
+    elif WalletQueryCache.is_fresh(age_seconds):
+        age_str = f"数据更新于 {age_seconds:.0f} 秒前"
+    else:
+        age_str = f"数据更新于 {age_seconds:.0f} 秒前，正在刷新..."
+    return textwrap.dedent(f"""
+    `{details.address}`
+    ——————————资源——————————
+    TRX余额:{details.trx_balance}
+    USDT余额:{details.usdt_balance}
+    能量: {details.energy_used} / {details.energy_limit}
+    质押资产: {details.total_staked}
+    免费带宽: {details.net_used} / {details.net_limit}
+    质押带宽: {details.staked_bandwidth_used} / {details.staked_bandwidth_limit}
+    活跃时间: {active_time_str}
+    创建时间: {create_time_str}
+    ⏱ {age_str}
+    """)
+
+
+async def _refresh_query_message(message: Message, address: str):
+    """后台刷新过期的查询结果，拿到新数据后编辑原消息。"""
+    try:
+        details = await WalletQueryCache.refresh(address)
+        if details is None:
+            return
+        await message.edit_text(
+            format_account_details(details, 0),
+            reply_markup=build_monitor_this_address_keyboard(address),
+            parse_mode="Markdown",
+        )
+    except Exception as e:
+        logging.warning(f"刷新地址 {address[:10]}... 的查询结果失败: {e}")
+
+
+def _split_addresses(text: str) -> Tuple[List[str], List[str]]:
+    """把一条消息拆分成多个地址并去重，返回 (格式正确的地址, 格式错误的片段)。"""
+    valid, invalid = [], []
+    for token in dict.fromkeys(t for t in ADDRESS_SEPARATORS.split(text) if t):
+        (valid if is_valid_tron_address(token) else invalid).append(token)
+    return valid, invalid
+
+
+def _format_bulk_line(address: str, details: Optional[TronAccountDetails]) -> str:
+    if details is None:
+        return f"`{address}`\n    ❌ 查询失败"
+    return (
+        f"`{address}`\n"
+        f"    TRX: {details.trx_balance} | USDT: {details.usdt_balance} | "
+        f"能量: {details.energy_used}/{details.energy_limit}"
+    )
+
+
+def _build_bulk_csv(results: Dict[str, Optional[TronAccountDetails]]) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([
+        "address", "status", "trx_balance", "usdt_balance", "energy_used", "energy_limit",
+        "net_used", "net_limit", "total_staked", "creation_time", "last_operation_time",
+    ])
+    for address, details in results.items():
+        if details is None:
+            writer.writerow([address, "failed"] + [""] * 9)
+            continue
+        writer.writerow([
+            address, "ok", details.trx_balance, details.usdt_balance, details.energy_used,
+            details.energy_limit, details.net_used, details.net_limit, details.total_staked,
+            details.creation_time.strftime("%Y-%m-%d %H:%M:%S"),
+            details.last_operation_time.strftime("%Y-%m-%d %H:%M:%S"),
+        ])
+    # 带 BOM，方便 Excel 直接打开
+    return buffer.getvalue().encode("utf-8-sig")
+
+
+async def _bulk_wallet_query(update: Update, addresses: List[str], invalid: List[str]):
+    """
+    批量查询多个地址。地址较少时在一条消息中逐条展示结果，
+    较多时只在消息中展示进度，完成后发送 CSV 文件。
+    """
+    total = len(addresses)
+    as_document = total > BULK_QUERY_CSV_THRESHOLD
+    header = f"正在批量查询 {total} 个地址..."
+    if invalid:
+        header += f"\n⚠️ 已跳过 {len(invalid)} 个格式不正确的地址"
+    progress_message = await reply(update, header, parse_mode="Markdown")
+
+    finished: Dict[str, Optional[TronAccountDetails]] = {}
+    last_edit = time.monotonic()
+
+    def _render(done: bool) -> str:
+        title = f"批量查询完成 ({len(finished)}/{total})" if done else f"正在批量查询 ({len(finished)}/{total})..."
+        if invalid:
+            title += f"\n⚠️ 已跳过 {len(invalid)} 个格式不正确的地址"
+        if as_document:
+            return title + ("\n结果见下方文件。" if done else "")
+        # 按用户发送的顺序展示已查完的地址
+        lines = [_format_bulk_line(a, finished[a]) for a in addresses if a in finished]
+        return title + "\n\n" + "\n".join(lines)
+
+    async def _edit(done: bool):
+        try:
+            await progress_message.edit_text(_render(done), parse_mode="Markdown")
+        except Exception as e:
+            logging.warning(f"更新批量查询进度失败: {e}")
+
+    async def _on_result(address: str, details: Optional[TronAccountDetails]):
+        nonlocal last_edit
+        finished[address] = details
+        if time.monotonic() - last_edit >= BULK_QUERY_EDIT_INTERVAL_SECONDS and len(finished) < total:
+            last_edit = time.monotonic()
+            await _edit(done=False)
+
+    results = await BulkWalletQuery.run(addresses, on_result=_on_result)
+    await _edit(done=True)
+
+    if as_document:
+        filename = f"wallet_query_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        await update.effective_chat.send_document(
+            document=InputFile(_build_bulk_csv(results), filename=filename),
+            caption=f"共 {total} 个地址，查询失败 {sum(1 for d in results.values() if d is None)} 个",
+        )
+
 
 # --- "钱包查询" 会话 ---
 
@@ -28,7 +176,7 @@ async def handle_wallet_query(update: Update, context: ContextTypes.DEFAULT_TYPE
     """(入口) 处理 "🔎钱包查询" 按钮，请求用户发送地址并进入会话状态"""
     clear_pending_actions(context)
     
-    text = "请发送您需要监听或查询的trc20地址"
+    text = "请发送您需要监听或查询的trc20地址\n(可一次发送多个地址，每行一个)"
     await reply(update, text, parse_mode="Markdown")
 
     # 进入等待地址的状态
@@ -37,34 +185,47 @@ async def handle_wallet_query(update: Update, context: ContextTypes.DEFAULT_TYPE
 async def wallet_query_address_received(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """(状态1) 接收到地址，进行查询或提示错误"""
     
-    address = update.message.text.strip()
-    
-    if not address.startswith("T") or len(address) != 34:
-        await reply(update, "地址格式不正确，请输入一个T开头的TRON地址。")
+    addresses, invalid = _split_addresses(update.message.text)
+
+    if len(addresses) + len(invalid) > 1:
+        # 一条消息中包含多个地址，进入批量查询
+        if not addresses:
+            await reply(update, "地址格式不正确或校验失败，请输入T开头的TRON地址。")
+            return RECEIVE_QUERY_ADDRESS
+        if len(addresses) > settings.WALLET_QUERY_BULK_MAX_ADDRESSES:
+            await reply(update, f"一次最多查询 {settings.WALLET_QUERY_BULK_MAX_ADDRESSES} 个地址，请分批发送。")
+            return RECEIVE_QUERY_ADDRESS
+        await _bulk_wallet_query(update, addresses, invalid)
+        return ConversationHandler.END
+
+    if not addresses:
+        await reply(update, "地址格式不正确或校验失败，请输入一个T开头的TRON地址。")
         # --- 关键修改：保持在当前状态，继续等待用户输入 ---
         return RECEIVE_QUERY_ADDRESS
+    address = addresses[0]
 
     # 地址格式正确，开始查询
+    cached = WalletQueryCache.peek(address)
+    if cached is not None:
+        # 有缓存时立即展示，过了新鲜期再在后台刷新
+        details, age = cached
+        message = await reply(
+            update, format_account_details(details, age),
+            reply_markup=build_monitor_this_address_keyboard(address), parse_mode="Markdown",
+        )
+        if not WalletQueryCache.is_fresh(age):
+            task = asyncio.create_task(_refresh_query_message(message, address))
+            _refresh_tasks.add(task)
+            task.add_done_callback(_refresh_tasks.discard)
+        return ConversationHandler.END
+
     wait_message = await reply(update, f"正在查询地址 `{address}` 的信息...", parse_mode="Markdown")
     
     try:
-        details = await TronService.get_account_details(address)
+        details = await WalletQueryCache.refresh(address)
 
         if details:
-            active_time_str = details.last_operation_time.strftime("%Y-%m-%d %H:%M:%S")
-            create_time_str = details.creation_time.strftime("%Y-%m-%d %H:%M:%S")
-            query_result_text = textwrap.dedent(f"""
-            `{details.address}`
-            ——————————资源——————————
-            TRX余额:{details.trx_balance}
-            USDT余额:{details.usdt_balance}
-            能量: {details.energy_used} / {details.energy_limit}
-            质押资产: {details.total_staked}
-            免费带宽: {details.net_used} / {details.net_limit}
-            质押带宽: {details.staked_bandwidth_used} / {details.staked_bandwidth_limit}
-            活跃时间: {active_time_str}
-            创建时间: {create_time_str}
-            """)
+            query_result_text = format_account_details(details, 0)
             try:
                 keyboard = build_monitor_this_address_keyboard(address)
                 await wait_message.edit_text(query_result_text, reply_markup=keyboard, parse_mode="Markdown")
@@ -113,5 +274,7 @@ wallet_query_conv_handler = ConversationHandler(
     fallbacks=[
         CommandHandler('cancel', cancel_conversation)
     ],
-    per_message=False
+    per_message=False,
+    name="wallet_query_conversation",
+    persistent=True,
 )
@@ -1,9 +1,15 @@
+import math
 from telegram import ReplyKeyboardMarkup, InlineKeyboardMarkup, InlineKeyboardButton
 from app.bot import constants as const
 from app.db.models import MonitorAddress
+from app.services.monitoring_service import MONITOR_LIST_PAGE_SIZE, MonitorListItem
 from typing import List
 from app.core.config import settings
 
+# 账单导出可选的时间范围 (天)
+STATEMENT_RANGE_DAYS = (1, 7, 30, 90)
+
+
 def get_main_keyboard() -> ReplyKeyboardMarkup:
     """
     创建并返回主菜单的ReplyKeyboard
@@ -22,38 +28,67 @@ def get_status_emoji(status: bool) -> str:
 
 
 def build_monitor_list_keyboard(
-    addresses: List[MonitorAddress],
+    addresses: List[MonitorListItem], page: int = 0, total: int = 0,
 ) -> InlineKeyboardMarkup:
     """
-    构建第一层：地址列表
+    构建第一层：地址列表 (分页，每页 MONITOR_LIST_PAGE_SIZE 个)
     """
     keyboard = []
-    # 使用 enumerate 来创建带序号的按钮
-    for i, item in enumerate(addresses):
+    offset = page * MONITOR_LIST_PAGE_SIZE
+    # 使用 enumerate 来创建带序号的按钮，序号在翻页后继续累加
+    for i, item in enumerate(addresses, start=offset):
         # 如果有备注，优先显示备注，否则显示地址
         label = f"{i + 1}. {item.nickname if item.nickname != '未设置备注' else item.address[:6] + '...' + item.address[-4:]}"
         callback_data = f"monitor_actions:{item.address}"
         keyboard.append([InlineKeyboardButton(label, callback_data=callback_data)])
 
+    page_count = math.ceil(total / MONITOR_LIST_PAGE_SIZE)
+    if page_count > 1:
+        nav_row = []
+        if page > 0:
+            nav_row.append(InlineKeyboardButton("◀️ 上一页", callback_data=f"monitor_list_page:{page - 1}"))
+        # 中间的页码按钮点击后刷新当前页
+        nav_row.append(InlineKeyboardButton(f"{page + 1}/{page_count}", callback_data=f"monitor_list_page:{page}"))
+        if page < page_count - 1:
+            nav_row.append(InlineKeyboardButton("下一页 ▶️", callback_data=f"monitor_list_page:{page + 1}"))
+        keyboard.append(nav_row)
+
     keyboard.append(
         [InlineKeyboardButton("➕ 添加新地址", callback_data="add_monitor_address")]
     )
+    bulk_row = [InlineKeyboardButton("📥 批量导入", callback_data="import_monitor_addresses")]
+    if total:
+        bulk_row.append(InlineKeyboardButton("📤 导出CSV", callback_data="export_monitor_addresses"))
+    keyboard.append(bulk_row)
     # keyboard.append([InlineKeyboardButton("🔙 返回主菜单", callback_data="main_menu")]) # 返回由物理键盘处理
     return InlineKeyboardMarkup(keyboard)
 
 
 def build_monitor_actions_keyboard(address: str) -> InlineKeyboardMarkup:
     """
-    构建第二层：操作选择 (修改设置 / 删除)
+    构建第二层：操作选择 (修改设置 / 导出账单 / 删除)
     """
     keyboard = [
         [InlineKeyboardButton("修改设置", callback_data=f"monitor_settings:{address}")],
+        [InlineKeyboardButton("📄 导出账单", callback_data=f"statement:{address}")],
         [InlineKeyboardButton("删除监控", callback_data=f"delete_monitor:{address}")],
         [InlineKeyboardButton("<< 返回钱包列表", callback_data="show_monitoring_list")],
     ]
     return InlineKeyboardMarkup(keyboard)
 
 
+def build_statement_range_keyboard(address: str) -> InlineKeyboardMarkup:
+    """
+    构建账单时间范围选择
+    """
+    ranges = [days for days in STATEMENT_RANGE_DAYS if days <= settings.STATEMENT_MAX_DAYS]
+    keyboard = [
+        [InlineKeyboardButton(f"最近 {days} 天", callback_data=f"statement_range:{days}:{address}") for days in ranges],
+        [InlineKeyboardButton("<< 返回", callback_data=f"monitor_actions:{address}")],
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+
 def build_monitor_settings_keyboard(
     monitor_entry: MonitorAddress,
 ) -> InlineKeyboardMarkup:
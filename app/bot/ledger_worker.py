@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from telegram.ext import Application
+
+from app.services.event_bus import TransactionEventBus
+from app.services.monitoring_service import MonitoringService
+from app.services.tron_service import TransactionData
+from app.core.metrics import WORKER_CYCLE_SECONDS
+
+# 空闲时的等待间隔
+LEDGER_IDLE_SECONDS = 30
+# 写入出错后的重试：第一次等待的时间 (之后每次翻倍) 和最多尝试的次数
+LEDGER_RETRY_SECONDS = 1
+LEDGER_MAX_ATTEMPTS = 6
+# 流水覆盖区间先在内存中合并，按该间隔写回数据库
+LEDGER_COVERAGE_FLUSH_SECONDS = 30
+
+# 每个地址还没有写回数据库的连续覆盖区间 (毫秒)
+_pending_coverage: Dict[str, Tuple[int, int]] = {}
+
+
+async def _record_with_retry(address: str, transactions: List[TransactionData]) -> bool:
+    """
+    写入一批流水，失败时按退避重试同一批交易。
+    这批交易不会再被重新投递 (摄取进度已经越过它们)，所以不能在第一次失败时就丢弃；
+    重试期间队列不再被消费，摄取任务会因背压放慢。返回是否最终写入成功。
+    """
+    delay = LEDGER_RETRY_SECONDS
+    for attempt in range(1, LEDGER_MAX_ATTEMPTS + 1):
+        try:
+            inserted = await MonitoringService.record_ledger_entries(address, transactions)
+            if inserted:
+                logging.debug(f"地址 {address[:10]}... 新增 {inserted} 条交易流水。")
+            return True
+        except Exception as e:
+            if attempt == LEDGER_MAX_ATTEMPTS:
+                logging.error(
+                    f"地址 {address[:10]}... 的 {len(transactions)} 条交易流水在 {attempt} 次尝试后仍写入失败，放弃: {e}",
+                    exc_info=True,
+                )
+                return False
+            logging.warning(f"写入地址 {address[:10]}... 的交易流水失败，{delay}s 后重试 (第 {attempt} 次): {e}")
+            await asyncio.sleep(delay)
+            delay *= 2
+    return False
+
+
+async def _flush_coverage(address: Optional[str] = None):
+    """把内存中的覆盖区间写回数据库。写入失败的区间直接丢弃，只会让账单多从链上拉取一段。"""
+    for addr in [address] if address else list(_pending_coverage):
+        pending = _pending_coverage.pop(addr, None)
+        if pending is None:
+            continue
+        try:
+            await MonitoringService.extend_ledger_coverage(addr, *pending)
+        except Exception as e:
+            logging.warning(f"保存地址 {addr[:10]}... 的流水覆盖区间失败: {e}")
+
+
+async def _note_covered(address: str, start: int, end: int):
+    """记录一段已经完整写入流水的区间，与内存中相接的区间合并。"""
+    pending = _pending_coverage.get(address)
+    if pending and start <= pending[1] + 1 and end >= pending[0] - 1:
+        _pending_coverage[address] = (min(start, pending[0]), max(end, pending[1]))
+        return
+    # 与之前的区间不相接 (中间有未确认的时间段)，先把之前的区间写回
+    if pending:
+        await _flush_coverage(address)
+    _pending_coverage[address] = (start, end)
+
+
+async def ledger_worker(ptb_app: Application):
+    """
+    后台任务，把摄取任务拉取到的所有交易 (监听地址和收款地址) 写入本地交易流水。
+    作为事件总线的被动订阅者，它不会让摄取任务多请求一次 TronGrid；
+    重复投递的交易由流水集合的唯一索引去重。
+    事件带有完整覆盖的区间时，写入成功后扩展该地址的流水覆盖区间 (LedgerCoverage)，
+    账单据此判断哪些时间段可以直接读流水。
+    """
+    logging.info("--- Ledger Worker Started ---")
+    subscription = TransactionEventBus.subscribe_passive("ledger")
+    last_flush = time.monotonic()
+
+    try:
+        while True:
+            try:
+                event = await subscription.get(timeout=LEDGER_IDLE_SECONDS)
+                if event is not None:
+                    try:
+                        recorded = True
+                        if event.transactions:
+                            with WORKER_CYCLE_SECONDS.time(worker="ledger"):
+                                recorded = await _record_with_retry(event.address, event.transactions)
+                        if recorded and event.covered:
+                            await _note_covered(event.address, *event.covered)
+                    finally:
+                        subscription.task_done()
+
+                if time.monotonic() - last_flush >= LEDGER_COVERAGE_FLUSH_SECONDS:
+                    await _flush_coverage()
+                    last_flush = time.monotonic()
+
+            except Exception as e:
+                logging.error(f"交易流水任务发生错误: {e}", exc_info=True)
+                await asyncio.sleep(LEDGER_RETRY_SECONDS)
+    finally:
+        # 停止时把已经确认的覆盖区间写回，下次启动时账单可以少从链上拉取一段
+        await _flush_coverage()
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Set, Tuple
+
+from telegram import Update
+
+from app.core.config import settings
+from app.core.metrics import Counter
+from app.core.rate_limit import TokenBucket
+
+# 最多为多少个用户保留令牌桶，超出时淘汰最久未活跃的用户
+FLOOD_MAX_TRACKED_USERS = 10_000
+# 同一用户两次 "请稍候" 提示之间的最小间隔，避免提示本身变成刷屏
+FLOOD_NOTICE_INTERVAL_SECONDS = 10
+
+FLOOD_REJECTED = Counter(
+    "bot_updates_rejected_total",
+    "Updates dropped by flood control, by reason.",
+    ["reason"],
+)
+
+FLOOD_NOTICE_TEXT = "⏳ 操作太频繁，请稍候再试。"
+DUPLICATE_NOTICE_TEXT = "⏳ 正在处理中，请稍候..."
+
+
+class FloodControl:
+    """
+    处理器前置的中间件，在 update 进入按用户排队之前执行：
+    - 每个用户一个令牌桶，超出速率的 update 直接丢弃；
+    - 同一用户相同的请求 (相同的按钮文字或回调数据) 还在排队或处理中时，
+      后来的请求并入第一个，不再重复执行；
+    - 被丢弃时给用户一个廉价的 "请稍候" 提示。
+    这样频繁点击按钮的用户无法耗尽 TronGrid 和数据库的请求预算。
+    """
+    _buckets: "OrderedDict[int, TokenBucket]" = OrderedDict()
+    # 正在排队或处理中的 (用户, 请求) 组合
+    _in_flight: Set[Tuple[int, Hashable]] = set()
+    _last_notice: Dict[int, float] = {}
+
+    @staticmethod
+    def _request_key(update: Update) -> Optional[Hashable]:
+        if update.callback_query and update.callback_query.data:
+            return ("callback", update.callback_query.data)
+        if update.message and update.message.text:
+            return ("text", update.message.text)
+        return None
+
+    @staticmethod
+    def _bucket_for(user_id: int) -> TokenBucket:
+        bucket = FloodControl._buckets.get(user_id)
+        if bucket is None:
+            bucket = TokenBucket(settings.FLOOD_RATE_PER_SECOND, capacity=settings.FLOOD_BURST)
+            FloodControl._buckets[user_id] = bucket
+            while len(FloodControl._buckets) > FLOOD_MAX_TRACKED_USERS:
+                evicted, _ = FloodControl._buckets.popitem(last=False)
+                FloodControl._last_notice.pop(evicted, None)
+        else:
+            FloodControl._buckets.move_to_end(user_id)
+        return bucket
+
+    @staticmethod
+    def admit(update: object) -> bool:
+        """
+        判断一个 update 是否放行。放行的 update 处理完后必须调用 release()。
+        """
+        if not isinstance(update, Update) or not update.effective_user:
+            return True
+        user_id = update.effective_user.id
+
+        request_key = FloodControl._request_key(update)
+        if request_key is not None and (user_id, request_key) in FloodControl._in_flight:
+            FLOOD_REJECTED.inc(reason="duplicate")
+            FloodControl._notify(update, DUPLICATE_NOTICE_TEXT)
+            return False
+
+        if not FloodControl._bucket_for(user_id).try_acquire():
+            FLOOD_REJECTED.inc(reason="rate_limited")
+            logging.info(f"用户 {user_id} 操作过于频繁，丢弃 update {update.update_id}")
+            FloodControl._notify(update, FLOOD_NOTICE_TEXT)
+            return False
+
+        if request_key is not None:
+            FloodControl._in_flight.add((user_id, request_key))
+        return True
+
+    @staticmethod
+    def release(update: object):
+        if not isinstance(update, Update) or not update.effective_user:
+            return
+        request_key = FloodControl._request_key(update)
+        if request_key is not None:
+            FloodControl._in_flight.discard((update.effective_user.id, request_key))
+
+    @staticmethod
+    def _notify(update: Update, text: str):
+        """在后台发送提示，不占用处理名额。回调查询总是需要应答，否则按钮会一直转圈。"""
+        if update.callback_query:
+            asyncio.create_task(FloodControl._send(update.callback_query.answer(text)))
+            return
+
+        user_id = update.effective_user.id
+        now = time.monotonic()
+        if now - FloodControl._last_notice.get(user_id, 0) < FLOOD_NOTICE_INTERVAL_SECONDS:
+            return
+        FloodControl._last_notice[user_id] = now
+        if update.effective_chat:
+            asyncio.create_task(FloodControl._send(update.effective_chat.send_message(text)))
+
+    @staticmethod
+    async def _send(coroutine):
+        try:
+            await coroutine
+        except Exception as e:
+            logging.debug(f"发送限流提示失败: {e}")
@@ -1,149 +1,348 @@
 import asyncio
 import logging
-from datetime import datetime, timezone
-from typing import Dict
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
 
 from telegram.ext import Application
-from pymongo.errors import DuplicateKeyError # 1. 导入 DuplicateKeyError 异常
 
-from app.db.models import Order, OrderStatus, OrderType, StreamState
-from app.services.tron_service import TronService
+from app.db.models import Order, OrderStatus, OrderType
+from app.services.tron_service import TronService, TransactionData
 from app.services.energy_service import EnergyService
+from app.services.order_stats_service import OrderStatsService
+from app.services.event_bus import TransactionEventBus
+from app.services.stream_state_service import ConsumerCursors
+from app.services.dedup_service import ProcessedTxStore
+from app.services.lease_service import LeaseService, LEADER_LEASE
 from app.core.config import settings
-from app.bot.utils import PROCESSED_TX_CACHE_PAYMENT as PROCESSED_TX_CACHE, clear_expired_cache
+from app.core.metrics import PENDING_ORDERS, WORKER_CYCLE_SECONDS, MetricsRegistry
+
+PAYMENT_POLL_INTERVAL_SECONDS = 3 # 订单较旧时的轮询间隔
+# 刚创建订单后收紧轮询，随订单年龄逐步放宽: (最新订单年龄上限秒, 轮询间隔秒)
+ADAPTIVE_POLL_SCHEDULE = [(60, 0.5), (300, 1.5)]
+# 没有待支付订单时不轮询链上数据，只按这个间隔检查一次数据库
+# (兜底由其他进程或副本创建、无法通过本进程事件唤醒的订单)
+PAYMENT_IDLE_RECHECK_SECONDS = 5
+# 支付进度最多只需保留到最早的待支付订单创建前这么久 (容忍时钟偏差)
+PAYMENT_CURSOR_MARGIN_SECONDS = 60
+
+# 检查待确认订单是否已固化的间隔 (TRON 约 19 个区块、1 分钟后固化)
+PAYMENT_CONFIRM_INTERVAL_SECONDS = 3
+# 超过这个时间仍未固化的付款视为被丢弃
+PAYMENT_CONFIRM_TIMEOUT_SECONDS = 300
+
+# 订单号 -> 固化状态查询从何时起一直正常应答 (超时从这里开始计算)。
+# 查询失败时重置，节点故障期间不会把有效的付款判定为超时
+_confirm_clock: Dict[str, datetime] = {}
+
+# 创建订单的处理器通过它立即唤醒支付监听
+_order_created = asyncio.Event()
+
+
+def notify_order_created():
+    """新的待支付订单已写入数据库，唤醒支付监听并收紧轮询。"""
+    _order_created.set()
+
+
+def adaptive_poll_interval(newest_order_age_seconds: float) -> float:
+    for max_age, interval in ADAPTIVE_POLL_SCHEDULE:
+        if newest_order_age_seconds < max_age:
+            return interval
+    return PAYMENT_POLL_INTERVAL_SECONDS
+
+
+async def collect_order_metrics():
+    for status in (OrderStatus.PENDING_PAYMENT, OrderStatus.PAYMENT_SEEN):
+        PENDING_ORDERS.set(await Order.find(Order.status == status).count(), status=status.name)
+
+
+MetricsRegistry.register_collector("orders", collect_order_metrics)
+
+
+async def expire_pending_orders():
+    """将已过期但仍处于待支付状态的订单标记为过期。"""
+    now_utc = datetime.now(timezone.utc)
+
+    candidates = await Order.find(
+        Order.status == OrderStatus.PENDING_PAYMENT,
+        Order.expires_at < now_utc
+    ).to_list()
+
+    # 逐个条件更新，只有真正由本次标记为过期的订单才计入统计
+    expired_count = 0
+    for order in candidates:
+        result = await Order.find_one(
+            Order.id == order.id,
+            Order.status == OrderStatus.PENDING_PAYMENT,
+        ).update({"$set": {Order.status: OrderStatus.EXPIRED}})
+        if result is not None and result.modified_count > 0:
+            expired_count += 1
+            await OrderStatsService.record(order, OrderStatus.EXPIRED)
+
+    if expired_count > 0:
+        logging.info(f"支付监听器清理了 {expired_count} 个过期订单。")
+
+
+async def match_payment(ptb_app: Application, address: str, currency: str, tx: TransactionData):
+    """
+    尝试将一笔收款交易匹配到待支付订单。
+    第一阶段：链上 (包括未固化的) 交易一出现就把订单标记为待确认并通知用户，
+    真正的支付确认和发放服务由 confirm_seen_payments 在交易固化后完成。
+    """
+    # Check if transaction matches any pending order for this address
+    # Handle both TRX and USDT payments (especially for smart transaction orders)
+    amount_buffer = 0.000001
+
+    # For smart transaction address, check both TRX and USDT orders
+    # For other addresses, only check the expected currency
+    if address == settings.ENERGY_SMART_ADDRESS or tx.token_symbol == currency:
+        matching_order = await Order.find_one(
+            Order.status == OrderStatus.PENDING_PAYMENT,
+            Order.currency == tx.token_symbol,
+            Order.expected_amount > tx.amount - amount_buffer,
+            Order.expected_amount < tx.amount + amount_buffer,
+        )
+    else:
+        matching_order = None
+
+    if matching_order:
+        seen_at = datetime.utcnow()
+        # 仅当订单仍处于待支付状态时才更新，避免多个副本重复确认同一订单
+        result = await Order.find_one(
+            Order.id == matching_order.id,
+            Order.status == OrderStatus.PENDING_PAYMENT,
+        ).update({"$set": {
+            Order.status: OrderStatus.PAYMENT_SEEN,
+            Order.payment_txid: tx.tx_id,
+            Order.paid_amount: tx.amount,
+            Order.block_time: datetime.utcfromtimestamp(tx.timestamp / 1000),
+            Order.payment_seen_at: seen_at,
+        }})
+        if result is None or result.modified_count == 0:
+            logging.warning(f"订单 {matching_order.order_id} 已被其他进程匹配，跳过。TxID: {tx.tx_id}")
+            return
+
+        await OrderStatsService.record(matching_order, OrderStatus.PAYMENT_SEEN, amount=tx.amount, at=seen_at)
+        logging.info(f"订单 {matching_order.order_id} 已看到付款，等待交易固化。TxID: {tx.tx_id}")
+        seen_message = f"👀 已收到您的付款！\n订单({matching_order.order_type.value})正在等待区块确认，约 1 分钟后自动处理..."
+        try:
+            await ptb_app.bot.send_message(chat_id=matching_order.chat_id, text=seen_message)
+        except Exception as e:
+            logging.error(f"发送付款已收到通知失败 (User: {matching_order.user_id}): {e}")
+    else:
+        # --- 金额不匹配！ ---
+        # 在这里，我们可以查找是否有金额范围部分匹配的订单，
+        # 以便给用户更友好的提示。
+        # 例如，用户可能忘记了输入小数。
+        # 查询所有待支付订单以便调试
+        pending_orders = await Order.find(
+            Order.status == OrderStatus.PENDING_PAYMENT,
+            Order.currency == tx.token_symbol
+        ).to_list()
+        expected_amounts = [o.expected_amount for o in pending_orders]
+        logging.warning(
+            f"收到一笔金额为 {tx.amount} {tx.token_symbol} 的新交易 (TxID: {tx.tx_id[:10]}...), "
+            f"但在待支付订单中找不到完全匹配的金额。待支付订单金额: {expected_amounts}"
+        )
+
+
+async def confirm_seen_payments(ptb_app: Application, started_at: datetime):
+    """
+    第二阶段：检查待确认订单的付款交易是否已固化。
+    started_at 为本副本开始确认付款的时间 (任务启动或成为 leader 时)。
+    - 已固化且成功：标记为已支付并发放服务；
+    - 已固化但失败，或节点持续正常应答但迟迟未固化：撤回到待支付 (已过期则标记为过期) 并通知用户；
+    - 查询失败：什么也不做，下一轮再查。
+    """
+    seen_orders = await Order.find(Order.status == OrderStatus.PAYMENT_SEEN).to_list()
+    for order_id in set(_confirm_clock) - {order.order_id for order in seen_orders}:
+        del _confirm_clock[order_id]
+
+    for order in seen_orders:
+        # 本副本开始确认之前的应答情况未知，从 started_at 开始计时
+        _confirm_clock.setdefault(order.order_id, max(order.payment_seen_at, started_at))
+        try:
+            solidified = await TronService.get_solidified_result(order.payment_txid)
+        except Exception:
+            _confirm_clock[order.order_id] = datetime.utcnow()
+            continue
+        now = datetime.utcnow()
+
+        if solidified:
+            result = await Order.find_one(
+                Order.id == order.id,
+                Order.status == OrderStatus.PAYMENT_SEEN,
+            ).update({"$set": {Order.status: OrderStatus.PAID, Order.paid_at: now}})
+            if result is None or result.modified_count == 0:
+                continue
+
+            order.status = OrderStatus.PAID
+            order.paid_at = now
+            await OrderStatsService.record(order, OrderStatus.PAID, amount=order.paid_amount)
+            logging.info(f"订单 {order.order_id} 支付成功！TxID: {order.payment_txid}")
+
+            success_message = f"✅ 支付成功！\n您的订单({order.order_type.value})已确认，正在为您处理..."
+            try:
+                await ptb_app.bot.send_message(chat_id=order.chat_id, text=success_message)
+            except Exception as e:
+                logging.error(f"发送支付成功通知失败 (User: {order.user_id}): {e}")
+
+            # 将已支付的订单对象和 bot 实例传递给 EnergyService 进行处理
+            await EnergyService.process_paid_order(order, ptb_app)
+            continue
+
+        timed_out = (now - _confirm_clock[order.order_id]).total_seconds() > PAYMENT_CONFIRM_TIMEOUT_SECONDS
+        if solidified is None and not timed_out:
+            continue
+
+        reverted_status = OrderStatus.EXPIRED if order.expires_at < now else OrderStatus.PENDING_PAYMENT
+        result = await Order.find_one(
+            Order.id == order.id,
+            Order.status == OrderStatus.PAYMENT_SEEN,
+        ).update({"$set": {
+            Order.status: reverted_status,
+            Order.payment_txid: None,
+            Order.paid_amount: None,
+            Order.block_time: None,
+            Order.payment_seen_at: None,
+        }})
+        if result is None or result.modified_count == 0:
+            continue
+
+        # 这笔付款不算数：从看到付款时计入的时间段中扣回，订单重新匹配时会再计一次
+        await OrderStatsService.retract(order, OrderStatus.PAYMENT_SEEN, order.paid_amount, order.payment_seen_at)
+        if reverted_status == OrderStatus.EXPIRED:
+            await OrderStatsService.record(order, OrderStatus.EXPIRED)
+        reason = "交易执行失败" if solidified is False else "交易长时间未被确认"
+        logging.warning(f"订单 {order.order_id} 的付款 {order.payment_txid} 未能确认 ({reason})，已撤回为{reverted_status.value}。")
+        try:
+            await ptb_app.bot.send_message(
+                chat_id=order.chat_id,
+                text=f"⚠️ 您的付款未能在链上确认 ({reason})，订单({order.order_type.value})未生效。\n如有疑问请联系客服。",
+            )
+        except Exception as e:
+            logging.error(f"发送付款未确认通知失败 (User: {order.user_id}): {e}")
+
+
+async def _refresh_poll_plan(subscription, cursors: ConsumerCursors, addresses) -> bool:
+    """
+    根据待支付订单调整轮询计划，返回是否存在待支付订单。
+    - 最新订单越新，轮询间隔越短；
+    - 早于最早待支付订单的交易不可能是它们的付款，直接把进度推进过去，
+      避免空闲一段时间后重新监听时还要回头翻历史。
+    """
+    oldest = await Order.find(Order.status == OrderStatus.PENDING_PAYMENT).sort("+created_at").first_or_none()
+    if oldest is None:
+        floor = datetime.utcnow()
+    else:
+        newest = await Order.find(Order.status == OrderStatus.PENDING_PAYMENT).sort("-created_at").first_or_none()
+        newest_age = (datetime.utcnow() - newest.created_at).total_seconds()
+        subscription.poll_interval = adaptive_poll_interval(newest_age)
+        floor = oldest.created_at - timedelta(seconds=PAYMENT_CURSOR_MARGIN_SECONDS)
+
+    floor_ms = int(floor.replace(tzinfo=timezone.utc).timestamp() * 1000)
+    for address in addresses:
+        await cursors.ensure(address)
+        cursors.advance(address, floor_ms)
+    await cursors.checkpoint()
+    return oldest is not None
 
-PAYMENT_POLL_INTERVAL_SECONDS = 3
 
 async def payment_polling_worker(ptb_app: Application):
     """
-    后台轮询任务，用于监听收款地址并确认支付。
-    增加了对数据库并发写入冲突的健壮处理。
+    后台任务，消费事件总线上收款地址的新交易并确认支付。
+    链上数据由 chain_ingest_worker 统一拉取，这里只负责匹配订单、确认固化和清理过期订单。
+    没有待支付订单时不轮询收款地址；新订单创建时通过 notify_order_created 立即唤醒。
+    多副本部署时只有持有 leader 租约的副本会监听收款地址。
     """
     logging.info("--- Payment Polling Worker Started ---")
 
     # Map addresses to currencies they accept
-    # Note: ENERGY_SMART_ADDRESS accepts both TRX and USDT, we check both in the loop
+    # Note: ENERGY_SMART_ADDRESS accepts both TRX and USDT, we check both in match_payment
     addresses_to_scan: Dict[str, str] = {
         settings.SPECIAL_OFFER_ADDRESS: "TRX",
         settings.ENERGY_SMART_ADDRESS: "TRX",  # Primary currency, but we also check USDT
     }
 
+    # 支付匹配每处理一批交易就保存进度，且优先于其他消费者被拉取
+    cursors = ConsumerCursors("payment", lease_for=lambda address: LEADER_LEASE, checkpoint_interval=0)
+    subscription = TransactionEventBus.subscribe(
+        "payment", cursors, poll_interval=PAYMENT_POLL_INTERVAL_SECONDS, priority=0
+    )
+    processed_txs = ProcessedTxStore("payment")
+    await processed_txs.warm_up()
+    next_order_check = 0.0
+    next_confirm_check = 0.0
+    has_pending_orders = False
+    # 本副本作为 leader 开始确认付款的时间，失去 leader 租约时清空
+    confirming_since: Optional[datetime] = None
+
     while True:
         try:
-            clear_expired_cache()
-            now_utc = datetime.now(timezone.utc)
-            
-            expired_orders_result = await Order.find(
-                Order.status == OrderStatus.PENDING_PAYMENT,
-                Order.expires_at < now_utc
-            ).update({"$set": {Order.status: OrderStatus.EXPIRED}})
-            
-            if expired_orders_result.modified_count > 0:
-                logging.info(f"支付监听器清理了 {expired_orders_result.modified_count} 个过期订单。")
-
-            for address, currency in addresses_to_scan.items():
-                # --- 2. 使用更健壮的“查找或创建”逻辑 ---
-                process_state = await StreamState.find_one(StreamState.address == address)
-                
-                if not process_state:
-                    try:
-                        last_timestamp = int(datetime.now(timezone.utc).timestamp() * 1000)
-                        process_state = StreamState(address=address, last_processed_timestamp=last_timestamp)
-                        await process_state.insert()
-                        logging.info(f"为收款地址 {address[:10]}... 首次创建处理状态。")
-                    except DuplicateKeyError:
-                        logging.warning(f"为收款地址 {address[:10]}... 创建状态时发生竞争，将重新查询。")
-                        process_state = await StreamState.find_one(StreamState.address == address)
-                        if not process_state:
-                            logging.error(f"在竞争后仍无法找到收款地址 {address[:10]} 的状态！")
-                            continue
+            is_leader = LeaseService.is_leader()
+            woken = _order_created.is_set()
+            _order_created.clear()
+
+            if is_leader and (woken or time.monotonic() >= next_order_check):
+                await expire_pending_orders()
+                has_pending_orders = await _refresh_poll_plan(subscription, cursors, addresses_to_scan.keys())
+                if woken and has_pending_orders:
+                    # 刚创建的订单不必等到下一个轮询间隔
+                    TransactionEventBus.request_poll(addresses_to_scan.keys())
+                next_order_check = time.monotonic() + (
+                    PAYMENT_POLL_INTERVAL_SECONDS if has_pending_orders else PAYMENT_IDLE_RECHECK_SECONDS
+                )
 
-                last_timestamp = process_state.last_processed_timestamp
-                
-                query_timestamp = last_timestamp - 1000
-                new_transactions = await TronService.get_new_transactions(address, query_timestamp)
-                
-                if not new_transactions:
+            if not is_leader:
+                confirming_since = None
+            elif confirming_since is None:
+                confirming_since = datetime.utcnow()
+                _confirm_clock.clear()
+
+            if is_leader and time.monotonic() >= next_confirm_check:
+                await confirm_seen_payments(ptb_app, confirming_since)
+                next_confirm_check = time.monotonic() + PAYMENT_CONFIRM_INTERVAL_SECONDS
+
+            # 不是 leader 或没有待支付订单时不再关心收款地址，摄取任务也就不会拉取它们
+            subscription.watch(addresses_to_scan.keys() if is_leader and has_pending_orders else [])
+
+            if is_leader:
+                timeout = max(min(next_order_check, next_confirm_check) - time.monotonic(), 0.1)
+            else:
+                timeout = PAYMENT_POLL_INTERVAL_SECONDS
+            event = await subscription.get(timeout=timeout, wake_event=_order_created)
+            if event is None:
+                continue
+
+            try:
+                if not LeaseService.is_leader():
+                    # 排队期间失去了 leader 租约，交给新的 leader 处理
                     continue
-                
-                logging.debug(f"支付监听器在地址 {address[:10]}... 找到 {len(new_transactions)} 笔新交易")
-                
-                latest_tx_timestamp_in_batch = last_timestamp
+                with WORKER_CYCLE_SECONDS.time(worker="payment"):
+                    currency = addresses_to_scan[event.address]
+                    last_timestamp = await cursors.ensure(event.address)
+                    for tx in event.transactions:
+                        if tx.timestamp <= last_timestamp or not await processed_txs.claim(tx.tx_id):
+                            continue
 
-                for tx in new_transactions:
-                    if tx.timestamp > last_timestamp and tx.tx_id not in PROCESSED_TX_CACHE:
                         logging.info(f"支付监听器发现新的、未处理的交易 {tx.tx_id}")
-                        
-                        PROCESSED_TX_CACHE[tx.tx_id] = datetime.now().timestamp()
-                        
-                        if tx.timestamp > latest_tx_timestamp_in_batch:
-                            latest_tx_timestamp_in_batch = tx.timestamp
-
-                        # Check if transaction matches any pending order for this address
-                        # Handle both TRX and USDT payments (especially for smart transaction orders)
-                        amount_buffer = 0.000001
-                        
-                        # For smart transaction address, check both TRX and USDT orders
-                        # For other addresses, only check the expected currency
-                        if address == settings.ENERGY_SMART_ADDRESS:
-                            # Smart transaction orders can be paid with TRX or USDT
-                            matching_order = await Order.find_one(
-                                Order.status == OrderStatus.PENDING_PAYMENT,
-                                Order.currency == tx.token_symbol,
-                                Order.expected_amount > tx.amount - amount_buffer,
-                                Order.expected_amount < tx.amount + amount_buffer,
-                            )
-                        elif tx.token_symbol == currency:
-                            # For other addresses, only match if currency matches
-                            matching_order = await Order.find_one(
-                                Order.status == OrderStatus.PENDING_PAYMENT,
-                                Order.currency == tx.token_symbol,
-                                Order.expected_amount > tx.amount - amount_buffer,
-                                Order.expected_amount < tx.amount + amount_buffer,
-                            )
-                        else:
-                            matching_order = None
-                        
-                        if matching_order:
-                            matching_order.status = OrderStatus.PAID
-                            matching_order.payment_txid = tx.tx_id
-                            matching_order.paid_amount = tx.amount
-                            matching_order.paid_at = datetime.utcnow()
-                            await matching_order.save()
-                            logging.info(f"订单 {matching_order.order_id} 支付成功！TxID: {tx.tx_id}")
-                            
-                            success_message = f"✅ 支付成功！\n您的订单({matching_order.order_type.value})已确认，正在为您处理..."
-                            try:
-                                await ptb_app.bot.send_message(chat_id=matching_order.chat_id, text=success_message)
-                            except Exception as e:
-                                logging.error(f"发送支付成功通知失败 (User: {matching_order.user_id}): {e}")
-                            
-                            # 将已支付的订单对象和 bot 实例传递给 EnergyService 进行处理
-                            await EnergyService.process_paid_order(matching_order, ptb_app)
-                            
-                            break
-                        else:
-                            # --- 金额不匹配！ ---
-                            # 在这里，我们可以查找是否有金额范围部分匹配的订单，
-                            # 以便给用户更友好的提示。
-                            # 例如，用户可能忘记了输入小数。
-                            # 查询所有待支付订单以便调试
-                            pending_orders = await Order.find(
-                                Order.status == OrderStatus.PENDING_PAYMENT,
-                                Order.currency == tx.token_symbol
-                            ).to_list()
-                            expected_amounts = [o.expected_amount for o in pending_orders]
-                            logging.warning(
-                                f"收到一笔金额为 {tx.amount} {tx.token_symbol} 的新交易 (TxID: {tx.tx_id[:10]}...), "
-                                f"但在待支付订单中找不到完全匹配的金额。待支付订单金额: {expected_amounts}"
-                            )
-
-                if latest_tx_timestamp_in_batch > last_timestamp:
-                    process_state.last_processed_timestamp = latest_tx_timestamp_in_batch
-                    await process_state.save()
-                    logging.info(f"收款地址 {address[:10]} 的处理进度已更新至时间戳: {latest_tx_timestamp_in_batch}")
-                
+                        try:
+                            await match_payment(ptb_app, event.address, currency, tx)
+                        except Exception:
+                            # 匹配失败时撤销认领，这笔交易稍后会被重新投递和匹配
+                            await processed_txs.release(tx.tx_id)
+                            raise
+                        cursors.advance(event.address, tx.timestamp)
+                    if event.watermark is not None:
+                        cursors.advance(event.address, event.watermark)
+                    await cursors.checkpoint()
+            except Exception:
+                # 进度停在失败的交易之前，让摄取任务从这里重新投递
+                subscription.rewind(event.address)
+                raise
+            finally:
+                subscription.task_done()
+
         except Exception as e:
             logging.error(f"支付轮询任务发生严重错误: {e}", exc_info=True)
-        
-        await asyncio.sleep(PAYMENT_POLL_INTERVAL_SECONDS)
\ No newline at end of file
+            await asyncio.sleep(PAYMENT_POLL_INTERVAL_SECONDS)
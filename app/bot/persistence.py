@@ -0,0 +1,213 @@
+import asyncio
+import copy
+import json
+import logging
+import time
+from datetime import datetime
+from typing import Dict, Optional, Set, Tuple
+
+from telegram.ext import Application, BasePersistence, PersistenceInput
+
+from app.db.models import BotState
+
+USER_DATA = "user_data"
+CHAT_DATA = "chat_data"
+CONVERSATION = "conversation"
+
+# 内存中的 user_data / chat_data 超过这么久没有被访问就从内存中淘汰 (持久化记录保留，再次访问时重新载入)
+BOT_STATE_IDLE_SECONDS = 60 * 60 * 24
+# 空的条目闲置这么久后淘汰；留出余量，避免淘汰正在处理中的 update 刚取到的空字典
+BOT_STATE_EMPTY_IDLE_SECONDS = 60 * 10
+# 淘汰检查的间隔
+BOT_STATE_EVICT_INTERVAL_SECONDS = 60 * 10
+
+
+class MongoPersistence(BasePersistence):
+    """
+    把 user_data、chat_data 和会话状态保存到 MongoDB 的 bot_state 集合。
+    - 数据未变化时不重复写入；变成空字典时直接删除记录；
+    - 只有会话状态带 TTL；user_data / chat_data 未变化时不会刷新 updated_at，不能按它过期；
+    - 记录每个用户/会话最后一次活跃的时间，供 bot_state_eviction_worker 淘汰内存中的闲置数据，
+      被淘汰的条目在该用户/会话下一次有 update 时 (refresh_*) 从数据库重新载入。
+    bot_data 和 callback_data 本项目未使用，不做持久化。
+    """
+
+    def __init__(self, update_interval: float = 60):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, callback_data=False),
+            update_interval=update_interval,
+        )
+        # (kind, key) -> 最后一次写入的数据，用于跳过未变化的写入
+        self._written: Dict[Tuple[str, int], dict] = {}
+        # (kind, key) -> 最后一次活跃的时间 (time.monotonic())
+        self._touched_at: Dict[Tuple[str, int], float] = {}
+        # 已从内存中淘汰、下次访问时需要重新载入的条目
+        self._evicted: Set[Tuple[str, int]] = set()
+
+    # --- 读取 (仅在启动时调用一次) ---
+    async def _load(self, kind: str) -> Dict[int, dict]:
+        records = await BotState.find(BotState.kind == kind).to_list()
+        now = time.monotonic()
+        loaded = {}
+        for record in records:
+            key = int(record.key)
+            loaded[key] = record.data or {}
+            self._written[(kind, key)] = copy.deepcopy(loaded[key])
+            self._touched_at[(kind, key)] = now
+        logging.info(f"从数据库载入 {len(loaded)} 条 {kind}。")
+        return loaded
+
+    async def get_user_data(self) -> Dict[int, dict]:
+        return await self._load(USER_DATA)
+
+    async def get_chat_data(self) -> Dict[int, dict]:
+        return await self._load(CHAT_DATA)
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> Dict[tuple, object]:
+        records = await BotState.find(BotState.kind == CONVERSATION, BotState.name == name).to_list()
+        return {tuple(json.loads(record.key)): record.state for record in records}
+
+    # --- 写入 ---
+    async def _save(self, kind: str, key: int, data: dict):
+        self._touched_at[(kind, key)] = time.monotonic()
+        if (kind, key) in self._evicted:
+            # 淘汰后被重新创建的空字典还没有载入数据库中的内容，不能用它覆盖 (删除) 持久化记录
+            if not data:
+                return
+            self._evicted.discard((kind, key))
+        if self._written.get((kind, key), {}) == data:
+            return
+
+        collection = BotState.get_pymongo_collection()
+        if data:
+            await collection.update_one(
+                {"kind": kind, "name": "", "key": str(key)},
+                {"$set": {"data": data, "updated_at": datetime.utcnow()}},
+                upsert=True,
+            )
+        else:
+            await collection.delete_one({"kind": kind, "name": "", "key": str(key)})
+        self._written[(kind, key)] = copy.deepcopy(data)
+
+    async def _drop(self, kind: str, key: int):
+        self._written.pop((kind, key), None)
+        self._touched_at.pop((kind, key), None)
+        self._evicted.discard((kind, key))
+        await BotState.get_pymongo_collection().delete_one({"kind": kind, "name": "", "key": str(key)})
+
+    def evict(self, kind: str, key: int):
+        """只从内存中淘汰 (由 bot_state_eviction_worker 调用)，持久化记录保留。"""
+        self._written.pop((kind, key), None)
+        self._touched_at.pop((kind, key), None)
+        self._evicted.add((kind, key))
+
+    async def _refresh(self, kind: str, key: int, data: dict):
+        """被淘汰过的条目再次被访问时，从数据库载入到 PTB 新建的空字典中。"""
+        if (kind, key) not in self._evicted:
+            return
+        record = await BotState.find_one(BotState.kind == kind, BotState.name == "", BotState.key == str(key))
+        self._evicted.discard((kind, key))
+        if record and record.data:
+            # 淘汰之后可能已经写入了新的键，以内存中的为准
+            for name, value in record.data.items():
+                data.setdefault(name, value)
+        self._written[(kind, key)] = copy.deepcopy(record.data or {}) if record else {}
+        self._touched_at[(kind, key)] = time.monotonic()
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        await self._save(USER_DATA, user_id, data)
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        await self._save(CHAT_DATA, chat_id, data)
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def update_conversation(self, name: str, key: tuple, new_state: Optional[object]) -> None:
+        collection = BotState.get_pymongo_collection()
+        query = {"kind": CONVERSATION, "name": name, "key": json.dumps(list(key))}
+        if new_state is None:
+            await collection.delete_one(query)
+        else:
+            await collection.update_one(
+                query, {"$set": {"state": new_state, "updated_at": datetime.utcnow()}}, upsert=True
+            )
+
+    async def drop_user_data(self, user_id: int) -> None:
+        await self._drop(USER_DATA, user_id)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        await self._drop(CHAT_DATA, chat_id)
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        await self._refresh(USER_DATA, user_id, user_data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        await self._refresh(CHAT_DATA, chat_id, chat_data)
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    async def flush(self) -> None:
+        # 所有写入都是即时的，没有需要在关闭时补写的缓冲
+        pass
+
+    def idle_seconds(self, kind: str, key: int) -> float:
+        # 还没有经过一次持久化周期的新条目，从第一次被检查时开始计时
+        touched_at = self._touched_at.setdefault((kind, key), time.monotonic())
+        return time.monotonic() - touched_at
+
+
+class BotApplication(Application):
+    """
+    本项目使用的 Application (通过 ApplicationBuilder.application_class 指定)。
+    公开的 user_data / chat_data 是只读映射，而 drop_user_data / drop_chat_data 除了释放内存，
+    还会在下一次 update_persistence 时调用持久化的 drop_* 删除数据库记录；
+    淘汰闲置数据只能释放内存，所以在这里提供只释放内存的版本。
+    """
+
+    def evict_user_data(self, user_id: int):
+        self._user_data.pop(user_id, None)
+        if isinstance(self.persistence, MongoPersistence):
+            self.persistence.evict(USER_DATA, user_id)
+
+    def evict_chat_data(self, chat_id: int):
+        self._chat_data.pop(chat_id, None)
+        if isinstance(self.persistence, MongoPersistence):
+            self.persistence.evict(CHAT_DATA, chat_id)
+
+
+async def bot_state_eviction_worker(ptb_app: BotApplication):
+    """
+    后台任务，定期从内存中淘汰空的或长期闲置的 user_data / chat_data，
+    保证进程内存不会随用户数量无限增长。数据库中的记录不受影响。
+    """
+    logging.info("--- Bot State Eviction Worker Started ---")
+    persistence: Optional[MongoPersistence] = ptb_app.persistence
+
+    while True:
+        await asyncio.sleep(BOT_STATE_EVICT_INTERVAL_SECONDS)
+        try:
+            evicted = 0
+            for kind, mapping, evict in (
+                (USER_DATA, ptb_app.user_data, ptb_app.evict_user_data),
+                (CHAT_DATA, ptb_app.chat_data, ptb_app.evict_chat_data),
+            ):
+                for key, data in list(mapping.items()):
+                    idle = persistence.idle_seconds(kind, key) if persistence else 0
+                    if idle > (BOT_STATE_IDLE_SECONDS if data else BOT_STATE_EMPTY_IDLE_SECONDS):
+                        evict(key)
+                        evicted += 1
+            if evicted:
+                logging.info(f"从内存中淘汰了 {evicted} 条空的或闲置的 user_data/chat_data。")
+        except Exception as e:
+            logging.error(f"淘汰闲置机器人状态时发生错误: {e}", exc_info=True)
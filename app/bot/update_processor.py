@@ -0,0 +1,65 @@
+import asyncio
+from typing import Any, Awaitable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from app.bot.middleware import FloodControl
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    并发处理不同用户的 update，同一用户的 update 仍按到达顺序逐个处理。
+    这样一个用户的慢查询不会阻塞其他用户，同时会话 (ConversationHandler)
+    和 user_data 的读写也不会因为同一用户的并发 update 而错乱。
+    进入按用户排队之前先经过 FloodControl，被限流或重复的 update 不会排队。
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._locks: Dict[int, asyncio.Lock] = {}
+        # 每个用户正在处理或排队的 update 数，归零时释放锁对象，避免字典无限增长
+        self._pending: Dict[int, int] = {}
+
+    @staticmethod
+    def _ordering_key(update: object) -> Optional[int]:
+        if not isinstance(update, Update):
+            return None
+        if update.effective_user:
+            return update.effective_user.id
+        if update.effective_chat:
+            return update.effective_chat.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        if not FloodControl.admit(update):
+            coroutine.close()
+            return
+
+        try:
+            await self._process_in_order(update, coroutine)
+        finally:
+            FloodControl.release(update)
+
+    async def _process_in_order(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self._ordering_key(update)
+        if key is None:
+            await coroutine
+            return
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._pending[key] = self._pending.get(key, 0) + 1
+        try:
+            async with lock:
+                await coroutine
+        finally:
+            self._pending[key] -= 1
+            if self._pending[key] == 0:
+                del self._pending[key]
+                del self._locks[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -1,36 +1,10 @@
 import logging
-from datetime import datetime
 from typing import Callable, Awaitable, Optional
 from telegram import Update
-from telegram.ext import ContextTypes, ConversationHandler
+from telegram.ext import ApplicationHandlerStop, ContextTypes, ConversationHandler
 from telegram.constants import ParseMode
 
 
-# 支付监听缓存（用于 payment_polling_worker）
-PROCESSED_TX_CACHE_PAYMENT: dict[str, float] = {}
-
-# 用户地址监听缓存（用于 address_listener_worker）
-PROCESSED_TX_CACHE_ADDRESS: dict[str, float] = {}
-
-CACHE_EXPIRATION_SECONDS = 60 * 5 # 缓存有效期5分钟
-
-def clear_expired_cache():
-    """清理两个缓存中的过期交易ID"""
-    now = datetime.now().timestamp()
-
-    def _clear(cache: dict[str, float], name: str):
-        expired_txs = [tx_id for tx_id, ts in cache.items() if now - ts > CACHE_EXPIRATION_SECONDS]
-        for tx_id in expired_txs:
-            try:
-                del cache[tx_id]
-            except KeyError:
-                pass
-        if expired_txs:
-            logging.debug(f"清理了 {len(expired_txs)} 个过期的缓存 TX ID ({name})。")
-
-    _clear(PROCESSED_TX_CACHE_PAYMENT, "payment")
-    _clear(PROCESSED_TX_CACHE_ADDRESS, "address")
-    
 def clear_pending_actions(context: ContextTypes.DEFAULT_TYPE):
     """一个辅助函数，用于清除所有待处理的文本输入状态。"""
     if 'next_action' in context.user_data:
@@ -71,7 +45,11 @@ async def cancel_conversation(
     
     # 如果提供了后续动作函数，则执行它
     if follow_up_action:
-        await follow_up_action(update, context)
+        try:
+            await follow_up_action(update, context)
+        except ApplicationHandlerStop:
+            # 菜单处理器会抛出它来阻止后续分组；这里必须返回 END，否则会话会停留在原状态
+            pass
     
     return ConversationHandler.END
 
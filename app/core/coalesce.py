@@ -0,0 +1,54 @@
+import asyncio
+import functools
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    请求合并：同一个 key 的调用正在进行时，后来的调用不再发起新的工作，
+    而是等待并共享第一个调用的结果 (或异常)。
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._in_flight
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._in_flight.get(key)
+        if future is not None:
+            # shield: 某个等待者被取消时不影响其他等待者和正在进行的工作
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            result = await func()
+        except BaseException as e:
+            future.set_exception(e)
+            # 没有其他等待者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._in_flight[key]
+
+
+def coalesce(key_func: Callable[..., Hashable]):
+    """
+    装饰异步函数，参数相同 (由 key_func 计算) 的并发调用只执行一次。
+    例如多个用户同时查询同一个地址时，只请求一次 TronGrid。
+    """
+    def decorator(func):
+        flights = SingleFlight()
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await flights.run(key_func(*args, **kwargs), lambda: func(*args, **kwargs))
+
+        return wrapper
+
+    return decorator
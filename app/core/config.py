@@ -1,5 +1,8 @@
+import os
+import socket
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from pydantic import field_validator
+from pydantic import Field, field_validator
 
 class Settings(BaseSettings):
     # 加载 .env 文件
@@ -25,10 +28,64 @@ class Settings(BaseSettings):
     KUAZU_API_KEY: str
     KUAZU_BALANCE_THRESHOLD: float = 20.0  # 余额告警阈值
     MONGO_URI: str
+    # --- MongoDB 连接池 ---
+    MONGO_MAX_POOL_SIZE: int = 100 # 每个副本的最大连接数
+    MONGO_MIN_POOL_SIZE: int = 0 # 保持的最少空闲连接数
+    MONGO_MAX_IDLE_TIME_MS: int | None = None # 空闲连接超过该时间后关闭
+    MONGO_CONNECT_TIMEOUT_MS: int = 10_000
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = 10_000 # 找不到可用节点时多久后报错
+    MONGO_SOCKET_TIMEOUT_MS: int | None = None # 单次读写的超时，不设置时不超时
+    MONGO_COMPRESSORS: str | None = None # 例如 "zstd,snappy,zlib" (zstd/snappy 需要额外安装依赖)
+    MONGO_READ_PREFERENCE: str = "primary" # primary / primaryPreferred / secondary / secondaryPreferred / nearest
+    MONGO_WRITE_CONCERN: str | None = None # 例如 "majority" 或 "1"，不设置时使用服务端默认值
+    MONGO_SLOW_QUERY_MS: int = 200 # 数据库命令超过该耗时时记录慢查询日志
     ADMIN_CHAT_ID: int
-    WEBHOOK_URL: str | None = None # Webhook可选
+    # Webhook 可选：填写指向本服务 /telegram/webhook 的公网地址即启用 webhook 模式，否则使用轮询
+    WEBHOOK_URL: str | None = None
+    WEBHOOK_SECRET_TOKEN: str | None = None # webhook 模式必填，Telegram 推送时会带在请求头中用于校验
+    TELEGRAM_CONCURRENT_UPDATES: int = 64 # 同时处理的 update 上限 (同一用户的 update 仍按顺序处理)
+    FLOOD_RATE_PER_SECOND: float = 1.0 # 每个用户每秒可以触发的操作数 (长期平均)
+    FLOOD_BURST: int = 5 # 每个用户允许的短时间连续操作数
     CUSTOMER_SERVICE_URL: str
 
+    # --- 多副本部署 ---
+    # 当前副本的唯一标识，默认使用 主机名-进程号
+    REPLICA_ID: str = Field(default_factory=lambda: f"{socket.gethostname()}-{os.getpid()}")
+    # 监听地址按哈希划分的分片数，每个分片同一时间只由一个副本租用
+    MONITOR_SHARD_COUNT: int = 8
+    LEASE_TTL_SECONDS: int = 30 # 租约有效期，副本失联超过该时间后由其他副本接管
+    LEASE_HEARTBEAT_SECONDS: int = 10 # 续约间隔
+    # 为 False 时 bot/API 进程不运行链上摄取、支付确认等任务，
+    # 需要另外启动 python -m app.workers.payments 和 python -m app.workers.ingest
+    RUN_WORKERS_IN_PROCESS: bool = True
+
+    # --- 停机后的追赶补数 ---
+    CATCHUP_THRESHOLD_SECONDS: int = 600 # 进度落后链头超过该时间时进入补数模式
+    BACKFILL_CONCURRENCY: int = 2 # 同时补数的监听地址数量 (收款地址不占用名额)
+    BACKFILL_REQUESTS_PER_SECOND: float = 5.0 # 补数请求 TronGrid 的速率预算
+    BACKFILL_MAX_LOOKBACK_HOURS: int = 24 # 最多往回补多久的交易
+
+    # --- 钱包查询缓存 ---
+    WALLET_QUERY_FRESH_SECONDS: int = 30 # 该时间内重复查询同一地址直接使用缓存，不请求链上
+    WALLET_QUERY_MAX_STALE_SECONDS: int = 600 # 超过新鲜期但未超过该时间的缓存先展示，同时后台刷新
+    WALLET_QUERY_REQUESTS_PER_SECOND: float = 5.0 # 钱包查询请求 TronGrid 的速率预算 (单个和批量查询共享)
+    WALLET_QUERY_BULK_MAX_ADDRESSES: int = 200 # 一条消息最多批量查询多少个地址
+
+    # --- 监听列表 ---
+    MONITOR_IMPORT_MAX_ADDRESSES: int = 1000 # 一次批量导入最多多少个地址
+    STATEMENT_MAX_DAYS: int = 90 # 账单导出最多覆盖多少天
+    STATEMENT_REQUESTS_PER_SECOND: float = 2.0 # 没有本地流水时，账单导出请求 TronGrid 的速率预算
+
+    # --- 订单归档 ---
+    ORDER_ARCHIVE_RETENTION_DAYS: int = 7 # 已过期/已取消的订单在 orders 中保留多久后移入 orders_archive
+    ORDER_ARCHIVE_COMPLETED_RETENTION_DAYS: int = 90 # 已完成的订单保留多久后归档 (耗时统计、客服查询需要)
+    ORDER_ARCHIVE_TTL_DAYS: int | None = None # 归档订单的保留天数，不设置时永久保留
+
+    # --- 运维诊断 ---
+    ADMIN_API_TOKEN: str | None = None # 管理接口的访问令牌 (请求头 X-Admin-Token)，未设置时管理接口关闭
+    LOOP_STALL_THRESHOLD_SECONDS: float = 0.5 # 事件循环被阻塞超过该时间时记录调用栈
+    SHUTDOWN_DRAIN_TIMEOUT_SECONDS: float = 10 # 关闭时等待消费者处理完队列中交易的最长时间
+
     @field_validator('KUAZU_BALANCE_THRESHOLD', mode='before')
     @classmethod
     def convert_balance_threshold(cls, v):
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import Counter as TallyCounter, deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.metrics import Counter, Gauge, Histogram, MetricsRegistry
+
+# 事件循环调度延迟的采样间隔
+LOOP_LAG_SAMPLE_INTERVAL_SECONDS = 0.25
+# 看门狗线程检查事件循环是否卡住的间隔
+WATCHDOG_CHECK_INTERVAL_SECONDS = 0.05
+# 保留最近多少次卡顿的调用栈
+MAX_RECORDED_STALLS = 20
+# 采样分析的单次最长时间
+MAX_PROFILE_SECONDS = 60
+
+LOOP_LAG_SECONDS = Histogram(
+    "event_loop_lag_seconds",
+    "Scheduling delay of a periodic event loop callback.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+LOOP_LAG_MAX_SECONDS = Gauge(
+    "event_loop_lag_max_seconds",
+    "Largest scheduling delay seen since the last scrape.",
+)
+LOOP_STALLS = Counter(
+    "event_loop_stalls_total",
+    "Times a single callback blocked the event loop for longer than the threshold.",
+)
+
+
+def _format_frame(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename}:{frame.f_lineno})"
+
+
+def _folded_stack(thread_name: str, frame) -> str:
+    """把一个调用栈折叠成 火焰图 (flamegraph.pl / speedscope) 需要的 'a;b;c' 格式，根在前。"""
+    frames = []
+    while frame is not None:
+        frames.append(_format_frame(frame))
+        frame = frame.f_back
+    return ";".join([thread_name] + frames[::-1])
+
+
+class LoopMonitor:
+    """
+    事件循环健康监控。Telegram 轮询、FastAPI 和所有后台任务共用一个事件循环，
+    任何同步阻塞都会拖慢所有人，这里提供三种手段定位它们：
+    - 调度延迟采样：定期 sleep 并测量实际醒来比预期晚了多久；
+    - 看门狗线程：事件循环超过阈值没有响应时，抓取事件循环线程当时的调用栈；
+    - 按需采样分析：在一段时间内反复抓取所有线程的调用栈，输出折叠格式供生成火焰图。
+    """
+    _loop_thread_id: Optional[int] = None
+    _last_tick = time.monotonic()
+    _max_lag = 0.0
+    _stalls: Deque[Dict] = deque(maxlen=MAX_RECORDED_STALLS)
+    _profile_lock = threading.Lock()
+    _sampler_task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def start():
+        """在事件循环中启动采样任务和看门狗线程。"""
+        if LoopMonitor._sampler_task is not None:
+            return
+        LoopMonitor._loop_thread_id = threading.get_ident()
+        LoopMonitor._last_tick = time.monotonic()
+        LoopMonitor._sampler_task = asyncio.create_task(LoopMonitor._sample_lag())
+        threading.Thread(target=LoopMonitor._watchdog, name="loop-watchdog", daemon=True).start()
+        logging.info("--- Event Loop Monitor Started ---")
+
+    @staticmethod
+    async def _sample_lag():
+        while True:
+            expected = time.monotonic() + LOOP_LAG_SAMPLE_INTERVAL_SECONDS
+            await asyncio.sleep(LOOP_LAG_SAMPLE_INTERVAL_SECONDS)
+            now = time.monotonic()
+            lag = max(now - expected, 0.0)
+            LoopMonitor._last_tick = now
+            LOOP_LAG_SECONDS.observe(lag)
+            LoopMonitor._max_lag = max(LoopMonitor._max_lag, lag)
+
+    @staticmethod
+    def collect_metrics():
+        LOOP_LAG_MAX_SECONDS.set(LoopMonitor._max_lag)
+        LoopMonitor._max_lag = 0.0
+
+    @staticmethod
+    def _watchdog():
+        """
+        运行在独立线程中。事件循环卡住时采样任务无法更新 _last_tick，
+        超过阈值后抓取一次事件循环线程的调用栈，同一次卡顿只记录一次。
+        """
+        threshold = LOOP_LAG_SAMPLE_INTERVAL_SECONDS + settings.LOOP_STALL_THRESHOLD_SECONDS
+        reported_tick = None
+        while True:
+            time.sleep(WATCHDOG_CHECK_INTERVAL_SECONDS)
+            last_tick = LoopMonitor._last_tick
+            stalled_for = time.monotonic() - last_tick
+            if stalled_for < threshold or reported_tick == last_tick:
+                continue
+
+            reported_tick = last_tick
+            frame = sys._current_frames().get(LoopMonitor._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "<no frame>"
+            LoopMonitor._stalls.append({
+                "detected_at": datetime.utcnow().isoformat(),
+                "stalled_seconds": round(stalled_for, 3),
+                "stack": stack,
+            })
+            LOOP_STALLS.inc()
+            logging.warning(f"事件循环已阻塞 {stalled_for:.2f}s，当前调用栈:\n{stack}")
+
+    @staticmethod
+    def recent_stalls() -> List[Dict]:
+        return list(LoopMonitor._stalls)
+
+    @staticmethod
+    def _sample_stacks(duration: float, interval: float) -> str:
+        """在当前线程中反复抓取其他所有线程的调用栈，返回折叠格式的统计结果。"""
+        own_id = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        tally: TallyCounter = TallyCounter()
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if thread_id not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                name = names.get(thread_id) or f"thread-{thread_id}"
+                tally[_folded_stack(name, frame)] += 1
+            time.sleep(interval)
+        return "\n".join(f"{stack} {count}" for stack, count in tally.most_common()) + "\n"
+
+    @staticmethod
+    async def profile(duration: float, interval: float = 0.005) -> Optional[str]:
+        """
+        在后台线程中做一次限时的采样分析，不阻塞事件循环。
+        已有分析在进行时返回 None。
+        """
+        if not LoopMonitor._profile_lock.acquire(blocking=False):
+            return None
+        try:
+            duration = min(duration, MAX_PROFILE_SECONDS)
+            logging.info(f"开始 {duration}s 的采样分析 (间隔 {interval * 1000:.0f}ms)...")
+            return await asyncio.to_thread(LoopMonitor._sample_stacks, duration, interval)
+        finally:
+            LoopMonitor._profile_lock.release()
+
+
+MetricsRegistry.register_collector("event_loop", LoopMonitor.collect_metrics)
@@ -0,0 +1,248 @@
+import inspect
+import logging
+import math
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, List, Sequence, Tuple, Union
+
+import httpx
+
+# 请求耗时直方图的默认桶 (秒)
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Metric:
+    """
+    Prometheus 文本格式的指标基类。
+    大部分更新发生在事件循环线程中，不需要加锁；在其他线程中更新的指标由调用方自行加锁，
+    输出时先复制一份数据，避免遍历过程中被其他线程修改。
+    """
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        MetricsRegistry.register(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"指标 {self.name} 需要标签 {self.labelnames}，实际为 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _format_labels(self, key: Tuple[str, ...], extra: Dict[str, str] | None = None) -> str:
+        pairs = list(zip(self.labelnames, key)) + list((extra or {}).items())
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{self._format_labels(key)} {value}" for key, value in list(self._values.items())]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def clear(self):
+        """清空所有标签组合，用于每次采集都重新计算全部取值的指标。"""
+        self._values.clear()
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{self._format_labels(key)} {value}" for key, value in list(self._values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # 标签组合 -> (各个桶的计数, 总和, 总数)
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        self._values[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        """统计一段代码的耗时 (秒)。"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in list(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == math.inf else repr(float(bound))
+                lines.append(f"{self.name}_bucket{self._format_labels(key, {'le': le})} {cumulative}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {count}")
+        return lines
+
+
+Collector = Callable[[], Union[None, Awaitable[None]]]
+
+
+class MetricsRegistry:
+    """
+    全局指标注册表。
+    队列长度、待支付订单数这类“当前值”不必在每次变化时更新，
+    而是注册一个采集函数，在 /metrics 被抓取时才计算。
+    """
+    _metrics: List[_Metric] = []
+    # 名称 -> 采集函数；同名重复注册 (例如 worker 重启) 时替换旧的
+    _collectors: Dict[str, Collector] = {}
+
+    @staticmethod
+    def register(metric: _Metric):
+        MetricsRegistry._metrics.append(metric)
+
+    @staticmethod
+    def register_collector(name: str, collector: Collector):
+        MetricsRegistry._collectors[name] = collector
+
+    @staticmethod
+    async def render() -> str:
+        for name, collector in list(MetricsRegistry._collectors.items()):
+            try:
+                result = collector()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logging.warning(f"指标采集函数 {name} 执行失败: {e}")
+        return "\n".join(metric.render() for metric in MetricsRegistry._metrics) + "\n"
+
+
+# --- 外部调用 ---
+EXTERNAL_REQUEST_SECONDS = Histogram(
+    "external_request_duration_seconds",
+    "Latency of calls to external APIs (TronGrid, kuaizu.io).",
+    ["service", "endpoint", "status"],
+)
+
+# --- 后台任务 ---
+WORKER_CYCLE_SECONDS = Histogram(
+    "worker_cycle_duration_seconds",
+    "Duration of one processing cycle of a background worker.",
+    ["worker"],
+)
+WORKER_UP = Gauge(
+    "worker_up",
+    "Whether a supervised background worker is currently running (1) or waiting to restart (0).",
+    ["worker"],
+)
+WORKER_RESTARTS = Counter(
+    "worker_restarts_total",
+    "Times a supervised background worker crashed or exited and was restarted.",
+    ["worker"],
+)
+CURSOR_LAG_SECONDS = Gauge(
+    "stream_cursor_lag_seconds",
+    "How far the slowest watched address of a consumer is behind the current time.",
+    ["consumer"],
+)
+EVENT_QUEUE_DEPTH = Gauge(
+    "event_bus_queue_depth",
+    "Transaction events waiting in a consumer's queue.",
+    ["consumer"],
+)
+DEDUP_CACHE_ENTRIES = Gauge(
+    "dedup_cache_entries",
+    "Entries in the in-memory tier of a processed-transaction store.",
+    ["consumer"],
+)
+PENDING_ORDERS = Gauge(
+    "orders_open",
+    "Orders waiting for payment or payment confirmation.",
+    ["status"],
+)
+ORDERS_FULFILLED = Counter(
+    "orders_fulfilled_total",
+    "Paid orders handed to fulfilment, by order type and result.",
+    ["order_type", "result"],
+)
+
+# --- 通知 ---
+NOTIFICATION_SEND_SECONDS = Histogram(
+    "notification_send_duration_seconds",
+    "Latency of sending a Telegram notification.",
+    ["kind", "result"],
+)
+NOTIFICATION_OUTBOX_PENDING = Gauge(
+    "notification_outbox_pending",
+    "Notifications written by worker processes and not yet sent by the bot.",
+)
+
+
+async def instrumented_request(
+    client: httpx.AsyncClient, method: str, url: str, *, service: str, endpoint: str, **kwargs
+) -> httpx.Response:
+    """发起 HTTP 请求并记录耗时；网络异常时 status 记为异常类型名。"""
+    started = time.perf_counter()
+    status = "error"
+    try:
+        response = await client.request(method, url, **kwargs)
+        status = str(response.status_code)
+        return response
+    except Exception as e:
+        status = type(e).__name__
+        raise
+    finally:
+        EXTERNAL_REQUEST_SECONDS.observe(
+            time.perf_counter() - started, service=service, endpoint=endpoint, status=status
+        )
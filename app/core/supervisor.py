@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+from app.core.metrics import WORKER_RESTARTS, WORKER_UP, MetricsRegistry
+
+# 崩溃后第一次重启前的等待时间，之后每次翻倍
+WORKER_RESTART_INITIAL_BACKOFF_SECONDS = 1
+WORKER_RESTART_MAX_BACKOFF_SECONDS = 60
+# 运行超过该时间后才崩溃的任务，退避时间从头计算
+WORKER_STABLE_SECONDS = 300
+# 停止任务时等待它们响应取消的时间
+WORKER_STOP_TIMEOUT_SECONDS = 5
+
+
+class SupervisedWorker:
+    """一个受监管的后台任务及其运行状态。"""
+
+    def __init__(self, name: str, factory: Callable[[], Awaitable[None]]):
+        self.name = name
+        # 每次 (重新) 启动时调用，返回任务的协程
+        self.factory = factory
+        self.task: Optional[asyncio.Task] = None
+        self.running = False
+        self.restarts = 0
+        self.started_at: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+        self.last_crash_at: Optional[datetime] = None
+
+    def status(self) -> Dict:
+        return {
+            "name": self.name,
+            "running": self.running,
+            "restarts": self.restarts,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "last_error": self.last_error,
+            "last_crash_at": self.last_crash_at.isoformat() if self.last_crash_at else None,
+        }
+
+
+class TaskSupervisor:
+    """
+    后台任务的监管者。
+    各个 worker 自己的循环会捕获单次处理中的错误，但循环之外的异常 (例如启动时数据库不可用)
+    或意外返回会让任务悄无声息地消失；这里负责按指数退避重启它们，
+    通过 worker_up / worker_restarts_total 指标和 /health 报告存活状态，
+    并在关闭时按顺序取消任务。
+    """
+    _workers: Dict[str, SupervisedWorker] = {}
+
+    @staticmethod
+    def start(name: str, factory: Callable[[], Awaitable[None]]) -> SupervisedWorker:
+        """启动一个受监管的任务；factory 在每次 (重新) 启动时被调用。"""
+        worker = SupervisedWorker(name, factory)
+        worker.task = asyncio.create_task(TaskSupervisor._supervise(worker), name=f"worker:{name}")
+        TaskSupervisor._workers[name] = worker
+        return worker
+
+    @staticmethod
+    async def _supervise(worker: SupervisedWorker):
+        backoff = WORKER_RESTART_INITIAL_BACKOFF_SECONDS
+        while True:
+            started = time.monotonic()
+            worker.running = True
+            worker.started_at = datetime.utcnow()
+            try:
+                await worker.factory()
+                worker.last_error = "任务意外退出"
+                logging.error(f"后台任务 {worker.name} 意外退出。")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                worker.last_error = repr(e)
+                logging.error(f"后台任务 {worker.name} 崩溃: {e}", exc_info=True)
+            finally:
+                worker.running = False
+
+            worker.last_crash_at = datetime.utcnow()
+            if time.monotonic() - started >= WORKER_STABLE_SECONDS:
+                backoff = WORKER_RESTART_INITIAL_BACKOFF_SECONDS
+            worker.restarts += 1
+            WORKER_RESTARTS.inc(worker=worker.name)
+            logging.warning(f"后台任务 {worker.name} 将在 {backoff}s 后重启 (第 {worker.restarts} 次)。")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, WORKER_RESTART_MAX_BACKOFF_SECONDS)
+
+    @staticmethod
+    async def stop(names: Optional[Iterable[str]] = None, timeout: float = WORKER_STOP_TIMEOUT_SECONDS):
+        """取消指定的任务 (默认全部) 并等待它们结束，不再重启。"""
+        names = list(TaskSupervisor._workers) if names is None else list(names)
+        tasks = []
+        for name in names:
+            worker = TaskSupervisor._workers.pop(name, None)
+            if worker is None or worker.task is None:
+                continue
+            worker.task.cancel()
+            tasks.append(worker.task)
+        if not tasks:
+            return
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            logging.warning(f"后台任务 {task.get_name()} 在 {timeout}s 内没有响应取消。")
+
+    @staticmethod
+    def status() -> List[Dict]:
+        return [worker.status() for worker in TaskSupervisor._workers.values()]
+
+    @staticmethod
+    def healthy() -> bool:
+        """所有受监管的任务都在运行 (没有处于崩溃后等待重启的状态)。"""
+        return all(worker.running for worker in TaskSupervisor._workers.values())
+
+    @staticmethod
+    def collect_metrics():
+        WORKER_UP.clear()
+        for worker in TaskSupervisor._workers.values():
+            WORKER_UP.set(1 if worker.running else 0, worker=worker.name)
+
+
+MetricsRegistry.register_collector("supervisor", TaskSupervisor.collect_metrics)
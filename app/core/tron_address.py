@@ -0,0 +1,28 @@
+import hashlib
+
+import base58
+
+# TRON 主网/测试网地址的版本字节
+TRON_ADDRESS_PREFIX = 0x41
+# 解码后的长度：1 字节前缀 + 20 字节地址 + 4 字节校验和
+DECODED_ADDRESS_LENGTH = 25
+ENCODED_ADDRESS_LENGTH = 34
+
+
+def is_valid_tron_address(address: str) -> bool:
+    """
+    在本地完整校验 TRON 的 base58check 地址，不发起任何网络请求：
+    base58 解码、0x41 前缀、以及 双重 SHA256 的前 4 字节校验和。
+    手误打错一个字符的地址会在这里被拒绝，而不是浪费一次 TronGrid 请求或生成无法完成的订单。
+    """
+    if not isinstance(address, str) or len(address) != ENCODED_ADDRESS_LENGTH or not address.startswith("T"):
+        return False
+    try:
+        decoded = base58.b58decode(address)
+    except ValueError:
+        # 包含 base58 字母表之外的字符 (0, O, I, l 等)
+        return False
+    if len(decoded) != DECODED_ADDRESS_LENGTH or decoded[0] != TRON_ADDRESS_PREFIX:
+        return False
+    payload, checksum = decoded[:-4], decoded[-4:]
+    return hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4] == checksum
@@ -1,14 +1,42 @@
 import motor.motor_asyncio
 from beanie import init_beanie
 from app.core.config import settings
-from app.db.models import User, Order, MonitorAddress,StreamState
+from app.db.models import User, Order, MonitorAddress,StreamState, ProcessedTransaction, LedgerEntry, LedgerCoverage, OrderRollup, Lease, BotState, Notification
+from app.db.monitoring import MongoCommandListener
+from app.services.stream_state_service import migrate_stream_state
 
-async def init_db():
+
+def _client_options() -> dict:
+    """连接池、超时、压缩、读偏好和写关注，未配置的选项使用驱动默认值。"""
+    options = {
+        "maxPoolSize": settings.MONGO_MAX_POOL_SIZE,
+        "minPoolSize": settings.MONGO_MIN_POOL_SIZE,
+        "connectTimeoutMS": settings.MONGO_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "readPreference": settings.MONGO_READ_PREFERENCE,
+        "event_listeners": [MongoCommandListener(settings.MONGO_SLOW_QUERY_MS)],
+    }
+    if settings.MONGO_MAX_IDLE_TIME_MS is not None:
+        options["maxIdleTimeMS"] = settings.MONGO_MAX_IDLE_TIME_MS
+    if settings.MONGO_SOCKET_TIMEOUT_MS is not None:
+        options["socketTimeoutMS"] = settings.MONGO_SOCKET_TIMEOUT_MS
+    if settings.MONGO_COMPRESSORS:
+        options["compressors"] = settings.MONGO_COMPRESSORS
+    if settings.MONGO_WRITE_CONCERN:
+        w = settings.MONGO_WRITE_CONCERN
+        options["w"] = int(w) if w.isdigit() else w
+    return options
+
+
+async def init_db() -> motor.motor_asyncio.AsyncIOMotorClient:
     """
-    初始化数据库连接和Beanie ODM
+    初始化数据库连接和Beanie ODM，返回客户端，由调用方在关闭时释放连接池
     """
-    client = motor.motor_asyncio.AsyncIOMotorClient(settings.MONGO_URI)
+    client = motor.motor_asyncio.AsyncIOMotorClient(settings.MONGO_URI, **_client_options())
     await init_beanie(
         database=client.get_default_database(), 
-        document_models=[User, Order, MonitorAddress,StreamState]
-    )
\ No newline at end of file
+        document_models=[User, Order, MonitorAddress,StreamState, ProcessedTransaction, LedgerEntry, LedgerCoverage, OrderRollup, Lease, BotState, Notification]
+    )
+    # 旧版 StreamState 仅按地址存储，迁移为按 (消费者, 地址) 存储
+    await migrate_stream_state()
+    return client
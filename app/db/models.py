@@ -1,14 +1,15 @@
 import uuid
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Any, Optional
 from beanie import Document, Indexed
 from pydantic import Field
 from enum import Enum
-from pymongo import IndexModel, ASCENDING
+from pymongo import IndexModel, ASCENDING, DESCENDING
 
 
 class OrderStatus(str, Enum):
     PENDING_PAYMENT = "待支付"
+    PAYMENT_SEEN = "待确认" # 已在链上看到付款，等待交易固化
     PAID = "已支付"
     COMPLETED = "已完成"
     EXPIRED = "已过期"
@@ -57,16 +58,29 @@ class Order(Document):
     # 例如: 对于智能笔数, details = {"receiver_address": "T...", "size": 10}
     #       对于特价能量, details = {}
 
-    # --- 时间戳 ---
+    # --- 时间戳 (同时用于分析每个阶段的耗时) ---
     created_at: datetime = Field(default_factory=datetime.utcnow)
     expires_at: datetime # 订单创建时必须指定过期时间
-    paid_at: Optional[datetime] = None
+    block_time: Optional[datetime] = None # 付款交易所在区块的时间
+    payment_seen_at: Optional[datetime] = None # 首次看到 (未固化的) 付款交易的时间，即检测到付款的时间
+    paid_at: Optional[datetime] = None # 交易固化、订单确认为已支付的时间
+    rental_started_at: Optional[datetime] = None # 开始调用能量租赁接口
+    rental_finished_at: Optional[datetime] = None # 能量租赁接口返回
+    notified_at: Optional[datetime] = None # 处理结果已通知用户
 
     def set_expiration(self):
         self.expires_at = datetime.utcnow() + timedelta(days=self.duration_days)
 
     class Settings:
         name = "orders"
+        indexes = [
+            # 支付匹配：按金额查找待支付订单
+            IndexModel([("status", ASCENDING), ("currency", ASCENDING), ("expected_amount", ASCENDING)]),
+            # 清理过期的待支付订单
+            IndexModel([("status", ASCENDING), ("expires_at", ASCENDING)]),
+            # 轮询计划 (最早/最新的待支付订单) 和订单归档
+            IndexModel([("status", ASCENDING), ("created_at", ASCENDING)]),
+        ]
 
 class MonitorAddress(Document):
     """
@@ -89,26 +103,202 @@ class MonitorAddress(Document):
     # 默认为None，表示从未检查过
     last_checked_tx_timestamp: Optional[int] = None
 
-    # TODO
-    # class Settings:
-    #     name = "orders"
-    #     # 2. 使用 IndexModel 来正确定义索引
-    #     # 为待支付订单和过期时间创建索引，加快轮询查询速度
-    #     indexes = [
-    #         # 为 status 字段创建一个普通索引，以加快按状态查询的速度
-    #         IndexModel([("status", ASCENDING)]),
-            
-    #         # 保留我们之前为支付轮询创建的高效复合索引
-    #         IndexModel([("status", ASCENDING), ("expires_at", ASCENDING)]),
-    #     ]
+    class Settings:
+        indexes = [
+            # 按用户查询监听列表、批量导入时按 (用户, 地址) 去重
+            IndexModel([("user_id", ASCENDING), ("address", ASCENDING)]),
+            # 按添加顺序分页展示监听列表
+            IndexModel([("user_id", ASCENDING), ("_id", ASCENDING)]),
+            # 收到交易时查找所有监听该地址的用户
+            IndexModel([("address", ASCENDING)]),
+        ]
 
 class StreamState(Document):
     """
-    用于为每个地址存储轮询任务的处理状态。
+    用于为每个 (消费者, 地址) 存储处理进度。
+    支付匹配、地址监听等消费者各自维护自己的游标，互不覆盖。
     """
-    address: Indexed(str, unique=True) # 被监听的 TRON 地址
-    last_processed_timestamp: int # 存储我们为这个地址处理过的最新交易的毫秒级时间戳
+    consumer: str # 消费者名称，例如 "payment"、"monitor"
+    address: str # 被监听的 TRON 地址
+    last_processed_timestamp: int # 该消费者在这个地址上处理过的最新交易的毫秒级时间戳
+    # 最后一次写入时持有的租约令牌，令牌更小的写入会被拒绝
+    fencing_token: int = 0
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
 
     class Settings:
         name = "stream_state"
-        indexes = []
+        indexes = [
+            IndexModel([("consumer", ASCENDING), ("address", ASCENDING)], unique=True),
+        ]
+
+
+# 已处理交易记录的保留时长 (由 MongoDB TTL 索引自动清理)
+PROCESSED_TX_RETENTION_SECONDS = 60 * 60 * 24 * 3
+
+class ProcessedTransaction(Document):
+    """
+    记录每个消费者已经处理过的交易，用于重启后和多副本之间的去重。
+    """
+    consumer: str # 消费者名称，例如 "payment"、"monitor"
+    tx_id: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "processed_transactions"
+        indexes = [
+            # 同一笔交易对不同消费者是独立的，因此唯一性按 (消费者, tx_id) 约束
+            IndexModel([("consumer", ASCENDING), ("tx_id", ASCENDING)], unique=True),
+            IndexModel([("created_at", ASCENDING)], expireAfterSeconds=PROCESSED_TX_RETENTION_SECONDS),
+        ]
+
+
+class LedgerEntry(Document):
+    """
+    本地交易流水：摄取任务拉取到的每一笔转账，按被拉取的地址 (监听地址或收款地址) 各记一条。
+    历史查询、对账和统计直接读这里，不必再请求 TronGrid。
+    """
+    address: str # 被拉取的地址
+    tx_id: str
+    direction: str # "in" 收入 / "out" 支出 (相对于 address)
+    counterparty: str # 交易对方地址
+    token_symbol: str # "TRX" 或 "USDT"
+    amount: float
+    timestamp: int # 交易的毫秒级时间戳
+    block_time: datetime # 同 timestamp，便于按时间段聚合
+    recorded_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "ledger_entries"
+        indexes = [
+            # 同一笔交易可能被多个副本、补数和常规轮询重复拉取，按 (地址, tx_id) 去重
+            IndexModel([("address", ASCENDING), ("tx_id", ASCENDING)], unique=True),
+            # 按地址查询最近的交易、按时间段统计
+            IndexModel([("address", ASCENDING), ("block_time", DESCENDING)]),
+        ]
+
+
+class LedgerCoverage(Document):
+    """
+    每个地址的交易流水已经确认完整的时间区间 [covered_from, covered_through] (毫秒)。
+    只有完整的拉取结果 (补数窗口、未被截断的常规轮询) 写入流水成功后才会扩展这个区间，
+    区间内的账单可以直接读流水，区间外的部分仍需从链上拉取。
+    """
+    address: Indexed(str, unique=True)
+    covered_from: int
+    covered_through: int
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "ledger_coverage"
+
+
+# 小时级统计的保留时长 (由 MongoDB TTL 索引自动清理)，天级统计永久保留
+HOURLY_ROLLUP_RETENTION_SECONDS = 60 * 60 * 24 * 90
+
+class OrderRollup(Document):
+    """
+    订单统计的物化汇总：按 (粒度, 时间段, 订单类型, 币种, 状态) 累计进入该状态的订单数和金额。
+    订单状态变化时用 $inc 增量更新，查询统计时只读这里，不再扫描 orders 集合。
+    """
+    granularity: str # "hour" 或 "day"
+    bucket: datetime # 时间段的起点 (UTC)
+    order_type: str
+    currency: str
+    status: str
+    order_count: int = 0
+    total_amount: float = 0.0 # 已支付及之后的状态为实付金额，其余为订单金额
+
+    class Settings:
+        name = "order_rollups"
+        indexes = [
+            IndexModel(
+                [("granularity", ASCENDING), ("bucket", ASCENDING), ("order_type", ASCENDING),
+                 ("currency", ASCENDING), ("status", ASCENDING)],
+                unique=True,
+            ),
+            IndexModel(
+                [("bucket", ASCENDING)],
+                expireAfterSeconds=HOURLY_ROLLUP_RETENTION_SECONDS,
+                partialFilterExpression={"granularity": "hour"},
+            ),
+        ]
+
+
+class Lease(Document):
+    """
+    多副本部署下的租约 (领导者选举、监听分片)。
+    持有者需要定期续约；过期后其他副本可以接管，接管时 fencing_token 递增，
+    旧持有者基于过期令牌的写入会被拒绝。
+    """
+    name: Indexed(str, unique=True) # 例如 "leader"、"monitor-shard:3"、"member:<replica>"
+    holder: str
+    fencing_token: int = 0
+    expires_at: datetime
+    heartbeat_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "leases"
+
+
+# 会话状态长期未变化时的保留时长 (由 MongoDB TTL 索引自动清理)
+BOT_STATE_RETENTION_SECONDS = 60 * 60 * 24 * 30
+
+class BotState(Document):
+    """
+    Telegram 机器人的持久化状态 (user_data、chat_data 和会话状态)，
+    由 MongoPersistence 读写，重启后不会丢失进行中的会话。
+    """
+    kind: str # "user_data"、"chat_data" 或 "conversation"
+    name: str = "" # 会话名称，仅 kind == "conversation" 时使用
+    key: str # 用户 ID、会话 ID，或会话键的 JSON
+    data: Optional[dict] = None
+    state: Optional[Any] = None # 会话状态
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "bot_state"
+        indexes = [
+            IndexModel([("kind", ASCENDING), ("name", ASCENDING), ("key", ASCENDING)], unique=True),
+            # 只清理长期无人继续的会话；user_data / chat_data 未变化时不刷新 updated_at，不能按它过期
+            IndexModel(
+                [("updated_at", ASCENDING)],
+                expireAfterSeconds=BOT_STATE_RETENTION_SECONDS,
+                partialFilterExpression={"kind": "conversation"},
+            ),
+        ]
+
+
+class NotificationStatus(str, Enum):
+    PENDING = "pending"
+    SENDING = "sending"
+    SENT = "sent"
+    FAILED = "failed"
+
+
+# 通知发件箱记录的保留时长 (由 MongoDB TTL 索引自动清理)
+NOTIFICATION_RETENTION_SECONDS = 60 * 60 * 24 * 7
+
+class Notification(Document):
+    """
+    通知发件箱：独立运行的 worker 进程没有 Telegram 连接，
+    要发给用户或管理员的消息先写到这里，由 bot 进程的发送任务取出并发送。
+    """
+    chat_id: int
+    text: str
+    parse_mode: Optional[str] = None
+    reply_markup: Optional[dict] = None # InlineKeyboardMarkup.to_dict()
+    status: NotificationStatus = NotificationStatus.PENDING
+    attempts: int = 0
+    last_error: Optional[str] = None
+    available_at: datetime = Field(default_factory=datetime.utcnow) # 发送失败后的下一次重试时间
+    claimed_at: Optional[datetime] = None
+    sent_at: Optional[datetime] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "notifications"
+        indexes = [
+            # 发送任务按 (状态, 可发送时间) 取出待发送的通知
+            IndexModel([("status", ASCENDING), ("available_at", ASCENDING)]),
+            IndexModel([("created_at", ASCENDING)], expireAfterSeconds=NOTIFICATION_RETENTION_SECONDS),
+        ]
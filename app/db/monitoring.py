@@ -0,0 +1,78 @@
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+from pymongo import monitoring
+
+from app.core.metrics import Histogram
+
+# 只统计读写数据的命令，忽略握手、心跳和认证等
+DATA_COMMANDS = {
+    "find", "getMore", "insert", "update", "delete", "findAndModify",
+    "aggregate", "count", "distinct", "createIndexes",
+}
+
+MONGO_COMMAND_SECONDS = Histogram(
+    "mongo_command_duration_seconds",
+    "Latency of MongoDB commands by command and collection.",
+    ["command", "collection", "status"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+
+
+def _collection_of(command_name: str, command: dict) -> str:
+    if command_name == "getMore":
+        return str(command.get("collection", ""))
+    value = command.get(command_name)
+    return value if isinstance(value, str) else ""
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """
+    记录每个集合上各类数据库命令的耗时，并对慢命令打日志。
+    Motor 在线程池中执行 PyMongo 调用，这些回调不在事件循环线程中，
+    因此更新指标时需要加锁。
+    """
+
+    def __init__(self, slow_query_ms: int):
+        self.slow_query_ms = slow_query_ms
+        self._lock = threading.Lock()
+        # (request_id, connection_id) -> (命令名, 数据库.集合)
+        self._pending: Dict[Tuple[int, object], Tuple[str, str, str]] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        if event.command_name not in DATA_COMMANDS:
+            return
+        collection = _collection_of(event.command_name, event.command)
+        with self._lock:
+            self._pending[(event.request_id, event.connection_id)] = (
+                event.command_name, event.database_name, collection
+            )
+
+    def _finished(self, event, status: str) -> Optional[Tuple[str, str, str]]:
+        with self._lock:
+            info = self._pending.pop((event.request_id, event.connection_id), None)
+            if info is None:
+                return None
+            command_name, _, collection = info
+            MONGO_COMMAND_SECONDS.observe(
+                event.duration_micros / 1_000_000, command=command_name, collection=collection, status=status
+            )
+        return info
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        info = self._finished(event, "ok")
+        if info is not None and event.duration_micros >= self.slow_query_ms * 1000:
+            command_name, database, collection = info
+            logging.warning(
+                f"MongoDB 慢查询: {command_name} {database}.{collection} 耗时 {event.duration_micros / 1000:.0f}ms"
+            )
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        info = self._finished(event, "error")
+        if info is not None:
+            command_name, database, collection = info
+            logging.warning(
+                f"MongoDB 命令失败: {command_name} {database}.{collection} "
+                f"耗时 {event.duration_micros / 1000:.0f}ms: {event.failure.get('errmsg', event.failure)}"
+            )
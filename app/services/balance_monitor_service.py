@@ -5,6 +5,8 @@ import httpx
 from telegram.ext import Application
 
 from app.core.config import settings
+from app.services.lease_service import LeaseService
+from app.core.metrics import WORKER_CYCLE_SECONDS, instrumented_request
 
 BALANCE_CHECK_INTERVAL_SECONDS = 15 * 60  # 15分钟
 
@@ -23,8 +25,9 @@ class BalanceMonitorService:
 
         try:
             async with httpx.AsyncClient(timeout=30) as client:
-                response = await client.post(
-                    BalanceMonitorService.KUAZU_BALANCE_API_URL, json=payload
+                response = await instrumented_request(
+                    client, "POST", BalanceMonitorService.KUAZU_BALANCE_API_URL,
+                    service="kuaizu", endpoint="balance", json=payload,
                 )
                 response.raise_for_status()
                 result = response.json()
@@ -50,6 +53,7 @@ class BalanceMonitorService:
 async def balance_monitor_worker(ptb_app: Application):
     """
     后台任务，定期检查 kuaizu.io 余额，余额不足时通知管理员（仅通知一次）
+    多副本部署时只有 leader 副本执行检查，避免重复告警。
     注意：在测试网模式下，此监控会被跳过（kuaizu.io 不支持测试网）
     """
     # 如果是测试网，跳过余额监控（kuaizu.io 只支持主网）
@@ -61,7 +65,12 @@ async def balance_monitor_worker(ptb_app: Application):
 
     while True:
         try:
-            balance = await BalanceMonitorService.get_balance()
+            if not LeaseService.is_leader():
+                await asyncio.sleep(settings.LEASE_HEARTBEAT_SECONDS)
+                continue
+
+            with WORKER_CYCLE_SECONDS.time(worker="balance_monitor"):
+                balance = await BalanceMonitorService.get_balance()
 
             if balance is not None:
                 if balance < settings.KUAZU_BALANCE_THRESHOLD:
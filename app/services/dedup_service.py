@@ -0,0 +1,105 @@
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+from app.db.models import ProcessedTransaction
+from app.core.metrics import DEDUP_CACHE_ENTRIES, MetricsRegistry
+
+# 内存层的有效期和容量上限
+DEDUP_MEMORY_TTL_SECONDS = 60 * 30
+DEDUP_MEMORY_MAX_ENTRIES = 50_000
+
+
+class ProcessedTxStore:
+    """
+    两级的已处理交易去重存储。
+    - 内存层：按插入顺序排列的 OrderedDict，过期项总在最前面，
+      因此每次只需从头部弹出，摊还 O(1)，不再需要线性扫描整个缓存。
+    - 持久层：processed_transactions 集合，(consumer, tx_id) 唯一索引 + TTL 索引。
+      重启后用它预热内存层，多副本同时处理时由唯一索引保证只有一个副本认领成功。
+    """
+
+    def __init__(
+        self,
+        consumer: str,
+        ttl_seconds: int = DEDUP_MEMORY_TTL_SECONDS,
+        max_entries: int = DEDUP_MEMORY_MAX_ENTRIES,
+    ):
+        self.consumer = consumer
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # tx_id -> 记入内存的时间 (time.monotonic())
+        self._seen: OrderedDict[str, float] = OrderedDict()
+        MetricsRegistry.register_collector(f"dedup:{consumer}", self._collect_metrics)
+
+    def _collect_metrics(self):
+        self._expire()
+        DEDUP_CACHE_ENTRIES.set(len(self), consumer=self.consumer)
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    async def warm_up(self):
+        """从数据库加载最近一段时间内已处理的交易到内存层。"""
+        since = datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+        records = await ProcessedTransaction.find(
+            ProcessedTransaction.consumer == self.consumer,
+            ProcessedTransaction.created_at > since,
+        ).sort("+created_at").limit(self.max_entries).to_list()
+
+        now = time.monotonic()
+        for record in records:
+            # 按记录的实际年龄换算，保证预热进来的条目按时过期
+            age = (datetime.utcnow() - record.created_at).total_seconds()
+            self._seen[record.tx_id] = now - age
+        logging.info(f"去重存储 {self.consumer} 预热完成，载入 {len(records)} 条已处理交易。")
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._seen:
+            _, seen_at = next(iter(self._seen.items()))
+            if now - seen_at <= self.ttl_seconds and len(self._seen) <= self.max_entries:
+                break
+            self._seen.popitem(last=False)
+
+    def contains(self, tx_id: str) -> bool:
+        """只查内存层，判断交易是否已处理过。"""
+        self._expire()
+        return tx_id in self._seen
+
+    async def claim(self, tx_id: str) -> bool:
+        """
+        认领一笔交易：返回 True 表示本进程应当处理它，
+        False 表示它已被处理过 (可能是本进程之前处理的，也可能是其他副本)。
+        """
+        if self.contains(tx_id):
+            return False
+
+        self._seen[tx_id] = time.monotonic()
+        try:
+            await ProcessedTransaction(consumer=self.consumer, tx_id=tx_id).insert()
+        except DuplicateKeyError:
+            logging.debug(f"交易 {tx_id} 已被其他进程认领 ({self.consumer})。")
+            return False
+        except Exception:
+            # 持久化失败时不能把它当作已处理，留给下一次重试
+            self._seen.pop(tx_id, None)
+            raise
+        return True
+
+    async def release(self, tx_id: str):
+        """
+        撤销一次认领 (处理失败时调用)，让这笔交易可以被重新处理。
+        数据库记录删除失败时只能记录日志：这笔交易会一直被视为已处理，需要人工介入。
+        """
+        self._seen.pop(tx_id, None)
+        try:
+            await ProcessedTransaction.find_one(
+                ProcessedTransaction.consumer == self.consumer,
+                ProcessedTransaction.tx_id == tx_id,
+            ).delete()
+        except Exception as e:
+            logging.error(f"撤销交易 {tx_id} 的认领失败 ({self.consumer})，该交易不会被重试: {e}")
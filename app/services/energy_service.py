@@ -1,10 +1,13 @@
 import logging
 import httpx
 import asyncio
+from datetime import datetime
 
 from app.db.models import Order, OrderType, OrderStatus
 from app.core.config import settings
 from app.services.tron_service import TronService
+from app.services.order_stats_service import OrderStatsService
+from app.core.metrics import ORDERS_FULFILLED, instrumented_request
 
 class EnergyService:
     """
@@ -31,15 +34,20 @@ class EnergyService:
             user_message = (f"您的 **{order.details.get('size', '')}笔** 智能笔数套餐已成功激活！\n"
                           f"能量将自动代理至地址: `{order.details.get('receiver_address')}`")
 
+        ORDERS_FULFILLED.inc(order_type=order.order_type.name, result="success" if success else "failure")
+
         # 无论成功与否，都更新订单状态
         order.status = OrderStatus.COMPLETED if success else order.status # 如果失败，可以保持 PAID 状态以便重试
         await order.save()
+        if success:
+            await OrderStatsService.record(order, OrderStatus.COMPLETED, amount=order.paid_amount)
         logging.info(f"订单 {order.order_id} 处理完成，状态: {order.status.value}")
         
         # 如果有需要通知给用户的特定消息，则发送
         if user_message:
             try:
                 await ptb_app.bot.send_message(chat_id=order.chat_id, text=user_message, parse_mode="Markdown")
+                await order.set({Order.notified_at: datetime.utcnow()})
             except Exception as e:
                 logging.error(f"发送订单处理结果通知失败: {e}")
 
@@ -93,11 +101,15 @@ class EnergyService:
 
         logging.info(f"正在为订单 {order.order_id} 调用 kuaizu.io API: {payload}")
         
+        order.rental_started_at = datetime.utcnow()
         try:
             async with httpx.AsyncClient(timeout=30) as client:
-                response = await client.post(EnergyService.KUAZU_API_URL, json=payload)
+                response = await instrumented_request(
+                    client, "POST", EnergyService.KUAZU_API_URL, service="kuaizu", endpoint="rent", json=payload
+                )
                 response.raise_for_status()
                 result = response.json()
+            order.rental_finished_at = datetime.utcnow()
             
             if result.get("code") == 1:
                 logging.info(f"kuaizu.io API 调用成功！响应: {result}")
@@ -113,8 +125,10 @@ class EnergyService:
                 return False, error_message
 
         except httpx.HTTPStatusError as e:
+            order.rental_finished_at = datetime.utcnow()
             logging.error(f"调用 kuaizu.io API 时发生 HTTP 错误: {e.response.status_code} - {e.response.text}")
             return False, "能量租赁服务暂时不可用，请联系客服。"
         except Exception as e:
+            order.rental_finished_at = datetime.utcnow()
             logging.error(f"调用 kuaizu.io API 时发生未知错误: {e}", exc_info=True)
             return False, "能量租赁服务出现未知错误，请联系客服。"
\ No newline at end of file
@@ -0,0 +1,307 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from pydantic import BaseModel
+
+from app.services.tron_service import TransactionData
+from app.services.stream_state_service import ConsumerCursors
+from app.core.metrics import CURSOR_LAG_SECONDS, EVENT_QUEUE_DEPTH, MetricsRegistry
+
+DEFAULT_SUBSCRIPTION_QUEUE_SIZE = 100
+DEFAULT_POLL_INTERVAL_SECONDS = 6
+
+
+class TransactionEvent(BaseModel):
+    """
+    一次摄取周期中，某个地址上新发现的一批交易 (已按时间戳升序排列)。
+    """
+    address: str
+    transactions: List[TransactionData]
+    # 补数时的水位线：该时间戳之前的交易都已经投递，消费者处理完后可以把进度推进到这里
+    watermark: Optional[int] = None
+    # 仅投递给被动订阅者：这批交易完整覆盖的时间区间 [起, 止] (毫秒)，
+    # 即该区间内该地址的全部交易都在这批里。常规轮询结果可能被截断或部分失败，此时为 None
+    covered: Optional[Tuple[int, int]] = None
+    # 投递时该地址的重投代数，消费者要求重投 (rewind) 之前排队的事件会被丢弃
+    generation: int = 0
+
+
+class Subscription:
+    """
+    一个消费者在事件总线上的订阅。
+    每个订阅拥有自己的有界队列，队列满时发布方会被阻塞 (背压)，
+    以免慢消费者让内存无限增长。
+    订阅还声明了自己期望的轮询间隔、优先级 (数值越小越优先) 和处理进度，
+    摄取任务据此决定每个地址多久拉取一次、从哪里开始拉取。
+    被动订阅 (cursors 为 None) 不声明关心的地址，也不影响拉取计划，
+    只旁听其他订阅触发拉取到的全部交易，见 TransactionEventBus.subscribe_passive。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        maxsize: int,
+        cursors: Optional[ConsumerCursors],
+        poll_interval: float,
+        priority: int,
+    ):
+        self.name = name
+        self.queue: asyncio.Queue[TransactionEvent] = asyncio.Queue(maxsize=maxsize)
+        self.cursors = cursors
+        self.poll_interval = poll_interval
+        self.priority = priority
+        # 该消费者关心的地址集合，由消费者自行维护
+        self.addresses: Set[str] = set()
+        # 每个地址已经投递给该订阅的最新交易时间戳。
+        # 游标可能落后于它 (事件还在队列中)，摄取任务用它避免重复投递。
+        self.published: Dict[str, int] = {}
+        # 每个地址最近一次成功拉取链上数据的时间 (毫秒)，用于计算该消费者的延迟
+        self.scanned: Dict[str, int] = {}
+        # 每个地址的重投代数，见 rewind
+        self.generations: Dict[str, int] = {}
+
+    @property
+    def passive(self) -> bool:
+        return self.cursors is None
+
+    def watch(self, addresses: Iterable[str]):
+        """替换该订阅关心的地址集合。"""
+        self.addresses = set(addresses)
+        self.cursors.forget(self.addresses)
+        for marks in (self.published, self.scanned):
+            for address in list(marks):
+                if address not in self.addresses:
+                    del marks[address]
+
+    def mark_scanned(self, address: str, timestamp: int):
+        """记录某地址的链上数据已经拉取到 timestamp (毫秒)。"""
+        self.scanned[address] = max(self.scanned.get(address, 0), timestamp)
+
+    def lag_seconds(self, now_ms: int) -> Optional[float]:
+        """
+        该消费者最落后的地址距离链上最新数据有多久。
+        已经处理完所有投递事件的地址以最近一次拉取的时间计，否则以处理进度计。
+        """
+        lags = []
+        for address in self.addresses:
+            position = self.cursors.position(address)
+            if position is None:
+                continue
+            if position >= self.published.get(address, 0) and address in self.scanned:
+                position = max(position, self.scanned[address])
+            lags.append(max(now_ms - position, 0) / 1000)
+        return max(lags) if lags else None
+
+    async def resume_position(self, address: str) -> int:
+        """该订阅在某地址上需要从哪个时间戳之后继续接收交易。"""
+        position = await self.cursors.ensure(address)
+        return max(position, self.published.get(address, position))
+
+    def rewind(self, address: str):
+        """
+        消费者处理某地址的交易失败时调用：丢弃该地址已经排队的事件，
+        并让摄取任务从消费者的处理进度 (游标) 重新拉取和投递，失败的交易会在下一轮重试。
+        """
+        self.generations[address] = self.generations.get(address, 0) + 1
+        self.published.pop(address, None)
+
+    def wants(self, address: str) -> bool:
+        return address in self.addresses
+
+    async def deliver(
+        self,
+        address: str,
+        transactions: List[TransactionData],
+        watermark: Optional[int] = None,
+        covered: Optional[Tuple[int, int]] = None,
+    ):
+        """
+        投递一批交易。队列已满时会等待消费者腾出空间，从而把压力传回摄取端。
+        """
+        if not transactions and watermark is None and covered is None:
+            return
+
+        event = TransactionEvent(
+            address=address,
+            transactions=transactions,
+            watermark=watermark,
+            covered=covered,
+            generation=self.generations.get(address, 0),
+        )
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            logging.warning(f"订阅 {self.name} 的队列已满，摄取任务等待消费者处理...")
+            await self.queue.put(event)
+        latest = max(tx.timestamp for tx in transactions) if transactions else 0
+        self.published[address] = max(self.published.get(address, 0), latest, watermark or 0)
+
+    async def get(
+        self,
+        timeout: Optional[float] = None,
+        wake_event: Optional[asyncio.Event] = None,
+    ) -> Optional[TransactionEvent]:
+        """
+        取出下一个事件；超时则返回 None，方便消费者在空闲时做周期性工作。
+        传入 wake_event 时，该事件被触发也会让等待提前结束并返回 None。
+        """
+        event = await self._get(timeout, wake_event)
+        if event is not None and event.generation != self.generations.get(event.address, 0):
+            # 消费者已经要求重投该地址，这个事件会被重新投递
+            self.queue.task_done()
+            return None
+        return event
+
+    async def _get(self, timeout: Optional[float], wake_event: Optional[asyncio.Event]) -> Optional[TransactionEvent]:
+        if wake_event is None:
+            try:
+                return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                return None
+
+        get_task = asyncio.ensure_future(self.queue.get())
+        wake_task = asyncio.ensure_future(wake_event.wait())
+        done, pending = await asyncio.wait(
+            {get_task, wake_task}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+        )
+        for task in pending:
+            task.cancel()
+        if get_task in done:
+            return get_task.result()
+        return None
+
+    def task_done(self):
+        self.queue.task_done()
+
+
+class TransactionEventBus:
+    """
+    进程内的交易发布/订阅总线。
+    摄取任务每个周期对每个地址只拉取一次链上数据并发布到这里，
+    支付匹配、监听通知等消费者各自订阅，互不重复请求 TronGrid。
+    生产者 (摄取和补数) 按每个订阅的进度调用 Subscription.deliver，再用 deliver_passive 投递给被动订阅者。
+    """
+    _subscriptions: Dict[str, Subscription] = {}
+    _passive_subscriptions: Dict[str, Subscription] = {}
+    # 消费者请求尽快拉取的地址 (不必等到下一个轮询间隔)
+    _poll_requests: Set[str] = set()
+
+    @staticmethod
+    def subscribe(
+        name: str,
+        cursors: ConsumerCursors,
+        poll_interval: float = DEFAULT_POLL_INTERVAL_SECONDS,
+        priority: int = 1,
+        maxsize: int = DEFAULT_SUBSCRIPTION_QUEUE_SIZE,
+    ) -> Subscription:
+        """注册一个消费者。同名订阅会被替换 (例如 worker 重启后重新订阅)。"""
+        subscription = Subscription(name, maxsize, cursors, poll_interval, priority)
+        TransactionEventBus._subscriptions[name] = subscription
+        logging.info(f"事件总线新增订阅: {name} (轮询间隔 {poll_interval}s, 队列上限 {maxsize})")
+        return subscription
+
+    @staticmethod
+    def subscribe_passive(name: str, maxsize: int = DEFAULT_SUBSCRIPTION_QUEUE_SIZE) -> Subscription:
+        """
+        注册一个被动消费者 (例如交易流水)：它收到摄取任务为其他订阅拉取到的每一批交易，
+        但不会让摄取任务多拉取任何地址，也不影响拉取的起点。
+        同一笔交易可能被投递多次，被动消费者需要自行保证幂等。
+        """
+        subscription = Subscription(name, maxsize, None, DEFAULT_POLL_INTERVAL_SECONDS, priority=1)
+        TransactionEventBus._passive_subscriptions[name] = subscription
+        logging.info(f"事件总线新增被动订阅: {name} (队列上限 {maxsize})")
+        return subscription
+
+    @staticmethod
+    def unsubscribe(name: str):
+        TransactionEventBus._subscriptions.pop(name, None)
+        TransactionEventBus._passive_subscriptions.pop(name, None)
+
+    @staticmethod
+    def watched_addresses() -> Set[str]:
+        """所有订阅者关心的地址并集，即摄取任务需要拉取的地址。"""
+        addresses: Set[str] = set()
+        for subscription in TransactionEventBus._subscriptions.values():
+            addresses |= subscription.addresses
+        return addresses
+
+    @staticmethod
+    def request_poll(addresses: Iterable[str]):
+        """请求摄取任务尽快拉取这些地址，例如刚刚创建了待支付订单时。"""
+        TransactionEventBus._poll_requests.update(addresses)
+
+    @staticmethod
+    def poll_requested(address: str) -> bool:
+        return address in TransactionEventBus._poll_requests
+
+    @staticmethod
+    def take_poll_request(address: str) -> bool:
+        """地址是否被请求立即拉取；返回 True 时同时清除该请求。"""
+        if address in TransactionEventBus._poll_requests:
+            TransactionEventBus._poll_requests.discard(address)
+            return True
+        return False
+
+    @staticmethod
+    def subscribers_for(address: str) -> List[Subscription]:
+        """关心某个地址的所有订阅。"""
+        return [s for s in TransactionEventBus._subscriptions.values() if s.wants(address)]
+
+    @staticmethod
+    def collect_metrics():
+        """/metrics 被抓取时更新各订阅的队列长度和处理延迟。"""
+        now_ms = int(time.time() * 1000)
+        CURSOR_LAG_SECONDS.clear()
+        for name, subscription in TransactionEventBus._passive_subscriptions.items():
+            EVENT_QUEUE_DEPTH.set(subscription.queue.qsize(), consumer=name)
+        for name, subscription in TransactionEventBus._subscriptions.items():
+            EVENT_QUEUE_DEPTH.set(subscription.queue.qsize(), consumer=name)
+            lag = subscription.lag_seconds(now_ms)
+            if lag is not None:
+                CURSOR_LAG_SECONDS.set(lag, consumer=name)
+
+    @staticmethod
+    async def drain(timeout: float) -> bool:
+        """
+        等待所有订阅队列中的事件都被处理完 (关闭时在停止摄取之后、停止消费者之前调用)。
+        超时返回 False，剩余的事件在重启后根据游标重新拉取。
+        """
+        subscriptions = list(TransactionEventBus._subscriptions.values()) + list(
+            TransactionEventBus._passive_subscriptions.values()
+        )
+        try:
+            await asyncio.wait_for(asyncio.gather(*(s.queue.join() for s in subscriptions)), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            remaining = {s.name: s.queue.qsize() for s in subscriptions if s.queue.qsize()}
+            logging.warning(f"事件总线在 {timeout}s 内未能处理完队列中的事件: {remaining}")
+            return False
+
+    @staticmethod
+    async def flush_cursors():
+        """把所有消费者在内存中推进过的进度立即写回数据库 (需在释放租约之前调用)。"""
+        for name, subscription in TransactionEventBus._subscriptions.items():
+            try:
+                await subscription.cursors.checkpoint(force=True)
+            except Exception as e:
+                logging.error(f"保存消费者 {name} 的处理进度失败: {e}", exc_info=True)
+
+    @staticmethod
+    async def deliver_passive(
+        address: str,
+        transactions: List[TransactionData],
+        covered: Optional[Tuple[int, int]] = None,
+    ):
+        """
+        把摄取任务拉取到的一批交易原样投递给所有被动订阅者。
+        拉取结果完整时传入 covered，即使没有交易也会投递，让被动订阅者知道该区间已经确认过。
+        """
+        if not transactions and covered is None:
+            return
+        for subscription in TransactionEventBus._passive_subscriptions.values():
+            await subscription.deliver(address, transactions, covered=covered)
+
+
+MetricsRegistry.register_collector("event_bus", TransactionEventBus.collect_metrics)
@@ -0,0 +1,211 @@
+import logging
+import math
+import time
+import zlib
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Set
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from telegram.ext import Application
+
+from app.core.config import settings
+from app.db.models import Lease
+
+LEADER_LEASE = "leader"
+MEMBER_LEASE_PREFIX = "member:"
+SHARD_LEASE_PREFIX = "monitor-shard:"
+
+
+class LeaseService:
+    """
+    基于 MongoDB 的租约，用于在多个副本之间分配后台任务：
+    - "leader" 租约：支付确认、余额告警等只能由一个副本执行的任务；
+    - "monitor-shard:N" 租约：监听地址按哈希分片，每个分片由一个副本负责；
+    - "member:<replica>" 租约：用于统计存活副本数，决定每个副本应持有多少分片。
+    """
+    replica_id: str = settings.REPLICA_ID
+    # 本进程参与竞争的租约类型，独立的 worker 进程只承担其中一种职责
+    contends_leader: bool = True
+    contends_shards: bool = True
+
+    # 本副本认为自己持有的租约: 名称 -> fencing token
+    _held: Dict[str, int] = {}
+    # 本地判定租约失效的时间 (time.monotonic())，比数据库中的过期时间更早，留出安全余量
+    _local_deadline: Dict[str, float] = {}
+
+    @staticmethod
+    def configure(leader: bool, shards: bool):
+        """
+        设置本进程参与哪些租约的竞争 (需在第一次 heartbeat 之前调用)。
+        不参与分片的进程也不登记为成员，不影响分片在监听副本之间的分配。
+        """
+        LeaseService.contends_leader = leader
+        LeaseService.contends_shards = shards
+
+    @staticmethod
+    async def acquire(name: str) -> Optional[int]:
+        """
+        获取或续约一个租约，成功时返回 fencing token，被其他副本持有时返回 None。
+        """
+        collection = Lease.get_pymongo_collection()
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=settings.LEASE_TTL_SECONDS)
+        started = time.monotonic()
+
+        # 1. 续约：仍由自己持有且未过期，令牌不变
+        lease = await collection.find_one_and_update(
+            {"name": name, "holder": LeaseService.replica_id, "expires_at": {"$gte": now}},
+            {"$set": {"expires_at": expires_at, "heartbeat_at": now}},
+            return_document=ReturnDocument.AFTER,
+        )
+
+        # 2. 接管：租约不存在或已过期，令牌递增
+        if lease is None:
+            try:
+                lease = await collection.find_one_and_update(
+                    {"name": name, "expires_at": {"$lt": now}},
+                    {
+                        "$set": {"holder": LeaseService.replica_id, "expires_at": expires_at, "heartbeat_at": now},
+                        "$inc": {"fencing_token": 1},
+                    },
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER,
+                )
+            except DuplicateKeyError:
+                # 租约存在且由其他副本持有
+                lease = None
+
+        if lease is None:
+            LeaseService._forget(name)
+            return None
+
+        if name not in LeaseService._held:
+            logging.info(f"副本 {LeaseService.replica_id} 获得租约 {name} (token={lease['fencing_token']})")
+        LeaseService._held[name] = lease["fencing_token"]
+        # 本地以请求发出的时刻计时，并提前一个续约周期判定失效
+        LeaseService._local_deadline[name] = (
+            started + settings.LEASE_TTL_SECONDS - settings.LEASE_HEARTBEAT_SECONDS
+        )
+        return lease["fencing_token"]
+
+    @staticmethod
+    async def release(name: str):
+        """主动释放租约，让其他副本无需等待过期即可接管。"""
+        LeaseService._held.pop(name, None)
+        LeaseService._local_deadline.pop(name, None)
+        await Lease.get_pymongo_collection().update_one(
+            {"name": name, "holder": LeaseService.replica_id},
+            {"$set": {"expires_at": datetime.utcnow()}},
+        )
+        logging.info(f"副本 {LeaseService.replica_id} 释放租约 {name}")
+
+    @staticmethod
+    async def release_all():
+        for name in list(LeaseService._held):
+            try:
+                await LeaseService.release(name)
+            except Exception as e:
+                logging.warning(f"释放租约 {name} 失败: {e}")
+
+    @staticmethod
+    def _forget(name: str):
+        if LeaseService._held.pop(name, None) is not None:
+            logging.warning(f"副本 {LeaseService.replica_id} 失去租约 {name}")
+        LeaseService._local_deadline.pop(name, None)
+
+    @staticmethod
+    def fencing_token(name: str) -> Optional[int]:
+        """返回本副本持有的有效租约令牌；租约未持有或本地已判定过期时返回 None。"""
+        if time.monotonic() >= LeaseService._local_deadline.get(name, 0):
+            return None
+        return LeaseService._held.get(name)
+
+    @staticmethod
+    def is_held(name: str) -> bool:
+        return LeaseService.fencing_token(name) is not None
+
+    @staticmethod
+    def is_leader() -> bool:
+        return LeaseService.is_held(LEADER_LEASE)
+
+    # --- 监听地址分片 ---
+    @staticmethod
+    def shard_of(address: str) -> int:
+        """地址所属的分片 (使用稳定的 crc32，保证所有副本计算结果一致)。"""
+        return zlib.crc32(address.encode()) % settings.MONITOR_SHARD_COUNT
+
+    @staticmethod
+    def shard_lease_name(address: str) -> str:
+        return f"{SHARD_LEASE_PREFIX}{LeaseService.shard_of(address)}"
+
+    @staticmethod
+    def owns_address(address: str) -> bool:
+        return LeaseService.is_held(LeaseService.shard_lease_name(address))
+
+    @staticmethod
+    def owned_shards() -> Set[int]:
+        return {
+            int(name[len(SHARD_LEASE_PREFIX):])
+            for name in LeaseService._held
+            if name.startswith(SHARD_LEASE_PREFIX) and LeaseService.is_held(name)
+        }
+
+    @staticmethod
+    async def count_live_members() -> int:
+        now = datetime.utcnow()
+        return await Lease.get_pymongo_collection().count_documents(
+            {"name": {"$regex": f"^{MEMBER_LEASE_PREFIX}"}, "expires_at": {"$gte": now}}
+        )
+
+    @staticmethod
+    async def heartbeat():
+        """
+        一次完整的续约周期：登记存活、竞选领导者、按存活副本数重新平衡分片。
+        """
+        if LeaseService.contends_shards:
+            await LeaseService.acquire(f"{MEMBER_LEASE_PREFIX}{LeaseService.replica_id}")
+        if LeaseService.contends_leader:
+            await LeaseService.acquire(LEADER_LEASE)
+        if not LeaseService.contends_shards:
+            return
+
+        shard_count = settings.MONITOR_SHARD_COUNT
+        members = max(await LeaseService.count_live_members(), 1)
+        target = math.ceil(shard_count / members)
+
+        # 先续约已持有的分片
+        owned = []
+        for shard in range(shard_count):
+            name = f"{SHARD_LEASE_PREFIX}{shard}"
+            if name in LeaseService._held and await LeaseService.acquire(name) is not None:
+                owned.append(shard)
+
+        # 持有过多时释放一部分，给新加入的副本
+        while len(owned) > target:
+            await LeaseService.release(f"{SHARD_LEASE_PREFIX}{owned.pop()}")
+
+        # 持有不足时尝试接管空闲的分片
+        for shard in range(shard_count):
+            if len(owned) >= target:
+                break
+            if shard in owned:
+                continue
+            if await LeaseService.acquire(f"{SHARD_LEASE_PREFIX}{shard}") is not None:
+                owned.append(shard)
+
+
+async def lease_keeper_worker(ptb_app: Application):
+    """
+    后台任务，定期续约本副本的租约。其他后台任务通过 LeaseService 判断自己该做哪些工作。
+    """
+    logging.info(f"--- Lease Keeper Worker Started (replica={LeaseService.replica_id}) ---")
+
+    while True:
+        try:
+            await LeaseService.heartbeat()
+        except Exception as e:
+            logging.error(f"租约续约任务发生错误: {e}", exc_info=True)
+
+        await asyncio.sleep(settings.LEASE_HEARTBEAT_SECONDS)
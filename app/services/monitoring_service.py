@@ -1,12 +1,47 @@
 import logging
+import time
 from datetime import datetime
-from typing import List, Optional
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 import httpx
+from pydantic import BaseModel
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from telegram.ext import Application
 from telegram.constants import ParseMode
 
-from app.db.models import MonitorAddress
+from app.db.models import LedgerCoverage, LedgerEntry, MonitorAddress
 from app.services.tron_service import TronService, TransactionData
+from app.core.metrics import NOTIFICATION_SEND_SECONDS
+
+# 监听列表每页显示的地址数
+MONITOR_LIST_PAGE_SIZE = 10
+# 用户监听地址总数的缓存时间；本副本内增删地址时会立即失效
+MONITOR_COUNT_CACHE_SECONDS = 60
+
+
+class MonitorListItem(BaseModel):
+    """渲染监听列表只需要地址和备注。"""
+    address: str
+    nickname: str = "未设置备注"
+
+
+# 按时间段统计流水时支持的粒度 -> $dateToString 格式
+LEDGER_PERIOD_FORMATS = {
+    "hour": "%Y-%m-%d %H:00",
+    "day": "%Y-%m-%d",
+    "month": "%Y-%m",
+}
+# MongoDB 重复键错误码
+DUPLICATE_KEY_ERROR = 11000
+
+
+class LedgerPeriodTotal(BaseModel):
+    """某个时间段内某种代币的收入/支出合计。"""
+    period: str
+    token_symbol: str
+    direction: str
+    total_amount: float
+    tx_count: int
+
 
 class MonitoringService:
     """
@@ -14,6 +49,8 @@ class MonitoringService:
     """
     # 这个类变量将在 main.py 启动时被注入，用于发送 Telegram 消息
     ptb_app: Optional[Application] = None
+    # 用户ID -> (监听地址总数, 缓存时间 time.monotonic())
+    _count_cache: Dict[int, Tuple[int, float]] = {}
 
     
     @staticmethod
@@ -81,12 +118,19 @@ class MonitoringService:
                     
                     message = f"{header}\n\n{body}"
 
+                    started = time.perf_counter()
+                    result = "ok"
                     try:
                         await MonitoringService.ptb_app.bot.send_message(
                             chat_id=entry.user_id, text=message, parse_mode=ParseMode.MARKDOWN
                         )
                     except Exception as e:
+                        result = "error"
                         logging.error(f"向用户 {entry.user_id} 发送格式化通知失败: {e}")
+                    finally:
+                        NOTIFICATION_SEND_SECONDS.observe(
+                            time.perf_counter() - started, kind="address_monitor", result=result
+                        )
 
     @staticmethod
     async def add_address(user_id: int, address: str, nickname: Optional[str] = None) -> MonitorAddress:
@@ -110,12 +154,42 @@ class MonitoringService:
             
             monitor_entry = MonitorAddress(**data_to_create)
             await monitor_entry.insert()
+            MonitoringService._count_cache.pop(user_id, None)
             
             # --- 不再需要调用任何注册函数 ---
             logging.info(f"新地址 {address} 已添加至数据库，等待后台监听任务扫描。")
             
         return monitor_entry
 
+    @staticmethod
+    async def bulk_add_addresses(user_id: int, entries: Dict[str, Optional[str]]) -> Tuple[int, int]:
+        """
+        批量添加监听地址 (地址 -> 备注，备注为 None 时使用默认值)。
+        只用一次 $in 查询找出用户已有的地址，其余的一次 insert_many 写入；
+        已存在的地址保持不变。返回 (新增数量, 已存在而跳过的数量)。
+        """
+        if not entries:
+            return 0, 0
+        existing = set(await MonitorAddress.distinct(
+            MonitorAddress.address, {"user_id": user_id, "address": {"$in": list(entries)}}
+        ))
+        new_entries = [
+            MonitorAddress(user_id=user_id, address=address, **({"nickname": nickname} if nickname else {}))
+            for address, nickname in entries.items()
+            if address not in existing
+        ]
+        if new_entries:
+            await MonitorAddress.insert_many(new_entries)
+            MonitoringService._count_cache.pop(user_id, None)
+            logging.info(f"用户 {user_id} 批量导入了 {len(new_entries)} 个监听地址，等待后台监听任务扫描。")
+        return len(new_entries), len(existing)
+
+    @staticmethod
+    async def iter_user_addresses(user_id: int) -> AsyncIterator[MonitorAddress]:
+        """按添加顺序逐条读取用户的监听地址，用于导出，不会一次性把整个列表加载到内存。"""
+        async for entry in MonitorAddress.find(MonitorAddress.user_id == user_id).sort(MonitorAddress.created_at):
+            yield entry
+
     @staticmethod
     async def delete_address(user_id: int, address: str) -> bool:
         """
@@ -130,14 +204,39 @@ class MonitoringService:
             return False
             
         await monitor_entry.delete()
+        MonitoringService._count_cache.pop(user_id, None)
         logging.info(f"地址 {address} 已从数据库移除，后台任务将不再扫描它 (如果无其他用户监听)。")
         return True
 
    # --- 辅助数据库查询方法 ---
     @staticmethod
-    async def get_user_addresses(user_id: int) -> List[MonitorAddress]:
-        """获取一个用户的所有监听地址。"""
-        return await MonitorAddress.find(MonitorAddress.user_id == user_id).project(MonitorAddress).to_list()
+    async def count_user_addresses(user_id: int) -> int:
+        """获取用户的监听地址总数 (带短时缓存，翻页时不必每次都 count)。"""
+        cached = MonitoringService._count_cache.get(user_id)
+        if cached is not None and time.monotonic() - cached[1] < MONITOR_COUNT_CACHE_SECONDS:
+            return cached[0]
+        total = await MonitorAddress.find(MonitorAddress.user_id == user_id).count()
+        MonitoringService._count_cache[user_id] = (total, time.monotonic())
+        return total
+
+    @staticmethod
+    async def get_user_addresses_page(user_id: int, page: int) -> Tuple[List[MonitorListItem], int, int]:
+        """
+        按添加顺序分页获取用户的监听地址，只读取地址和备注。
+        页码超出范围时自动调整到最后一页，返回 (当前页的地址, 总数, 实际页码)。
+        """
+        total = await MonitoringService.count_user_addresses(user_id)
+        last_page = max((total - 1) // MONITOR_LIST_PAGE_SIZE, 0)
+        page = min(max(page, 0), last_page)
+        items = await (
+            MonitorAddress.find(MonitorAddress.user_id == user_id)
+            .sort("_id")
+            .skip(page * MONITOR_LIST_PAGE_SIZE)
+            .limit(MONITOR_LIST_PAGE_SIZE)
+            .project(MonitorListItem)
+            .to_list()
+        )
+        return items, total, page
 
     @staticmethod
     async def get_monitor_entry(user_id: int, address: str) -> Optional[MonitorAddress]:
@@ -176,4 +275,112 @@ class MonitoringService:
             monitor_entry.nickname = nickname
             await monitor_entry.save()
             return monitor_entry
-        return None
\ No newline at end of file
+        return None
+
+    # --- 本地交易流水 ---
+    @staticmethod
+    async def record_ledger_entries(address: str, transactions: List[TransactionData]) -> int:
+        """
+        把拉取到的交易写入流水，已存在的 (地址, tx_id) 会被唯一索引忽略。
+        返回新写入的条数。
+        """
+        entries = [
+            LedgerEntry(
+                address=address,
+                tx_id=tx.tx_id,
+                direction="in" if tx.to_address == address else "out",
+                counterparty=tx.from_address if tx.to_address == address else tx.to_address,
+                token_symbol=tx.token_symbol,
+                amount=tx.amount,
+                timestamp=tx.timestamp,
+                block_time=datetime.utcfromtimestamp(tx.timestamp / 1000),
+            )
+            for tx in transactions
+            if address in (tx.from_address, tx.to_address)
+        ]
+        if not entries:
+            return 0
+        try:
+            # ordered=False: 遇到重复的交易继续写入其余的
+            await LedgerEntry.insert_many(entries, ordered=False)
+            return len(entries)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != DUPLICATE_KEY_ERROR for error in errors):
+                raise
+            return e.details.get("nInserted", 0)
+
+    @staticmethod
+    async def extend_ledger_coverage(address: str, start: int, end: int):
+        """
+        记录 [start, end] (毫秒) 内该地址的交易已经全部写入流水。
+        与已有区间相交或相接时合并；在已有区间之后且中间有缺口时，
+        只保留新的区间 (缺口内可能漏了交易)；在已有区间之前且不相接的旧区间直接忽略。
+        """
+        collection = LedgerCoverage.get_pymongo_collection()
+        now = datetime.utcnow()
+        # 1. 与已有区间相交或相接：合并
+        result = await collection.update_one(
+            {"address": address, "covered_from": {"$lte": end + 1}, "covered_through": {"$gte": start - 1}},
+            {"$min": {"covered_from": start}, "$max": {"covered_through": end}, "$set": {"updated_at": now}},
+        )
+        if result.matched_count:
+            return
+
+        # 2. 还没有记录，或新区间在已有区间之后：从新区间重新开始
+        try:
+            await collection.update_one(
+                {"address": address, "covered_through": {"$lt": start}},
+                {"$set": {"covered_from": start, "covered_through": end, "updated_at": now}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # 已有区间在新区间之后 (例如补数的旧窗口)，或者并发写入抢先了，保留已有区间
+            pass
+
+    @staticmethod
+    async def get_ledger_coverage(address: str) -> Optional[Tuple[int, int]]:
+        """该地址交易流水确认完整的时间区间 (毫秒)，没有记录时返回 None。"""
+        coverage = await LedgerCoverage.find_one(LedgerCoverage.address == address)
+        return (coverage.covered_from, coverage.covered_through) if coverage else None
+
+    @staticmethod
+    async def get_recent_activity(
+        address: str, limit: int = 20, before: Optional[datetime] = None, token_symbol: Optional[str] = None
+    ) -> List[LedgerEntry]:
+        """按时间倒序获取地址最近的交易流水；传入 before 可以继续往前翻页。"""
+        query = [LedgerEntry.address == address]
+        if before is not None:
+            query.append(LedgerEntry.block_time < before)
+        if token_symbol is not None:
+            query.append(LedgerEntry.token_symbol == token_symbol)
+        return await LedgerEntry.find(*query).sort(-LedgerEntry.block_time).limit(limit).to_list()
+
+    @staticmethod
+    async def get_period_totals(
+        address: str, since: datetime, until: Optional[datetime] = None, granularity: str = "day"
+    ) -> List[LedgerPeriodTotal]:
+        """按时间段 (hour/day/month，UTC) 统计地址在 [since, until) 内每种代币的收入和支出合计。"""
+        if granularity not in LEDGER_PERIOD_FORMATS:
+            raise ValueError(f"不支持的统计粒度: {granularity}")
+        time_filter = {"$gte": since}
+        if until is not None:
+            time_filter["$lt"] = until
+        pipeline = [
+            {"$match": {"address": address, "block_time": time_filter}},
+            {"$group": {
+                "_id": {
+                    "period": {"$dateToString": {"format": LEDGER_PERIOD_FORMATS[granularity], "date": "$block_time"}},
+                    "token_symbol": "$token_symbol",
+                    "direction": "$direction",
+                },
+                "total_amount": {"$sum": "$amount"},
+                "tx_count": {"$sum": 1},
+            }},
+            {"$sort": {"_id.period": 1, "_id.token_symbol": 1, "_id.direction": 1}},
+        ]
+        rows = await LedgerEntry.get_pymongo_collection().aggregate(pipeline).to_list(None)
+        return [
+            LedgerPeriodTotal(**row["_id"], total_amount=row["total_amount"], tx_count=row["tx_count"])
+            for row in rows
+        ]
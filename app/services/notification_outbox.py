@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from pymongo import ReturnDocument
+from telegram import InlineKeyboardMarkup
+from telegram.error import BadRequest, Forbidden, RetryAfter
+from telegram.ext import Application
+
+from app.core.metrics import NOTIFICATION_OUTBOX_PENDING, NOTIFICATION_SEND_SECONDS, MetricsRegistry
+from app.core.rate_limit import TokenBucket
+from app.db.models import Notification, NotificationStatus
+
+# 没有待发送通知时的轮询间隔
+NOTIFICATION_POLL_SECONDS = 1
+# 取出后超过该时间仍未标记完成的通知 (发送进程崩溃) 可以被重新取出
+NOTIFICATION_CLAIM_TIMEOUT_SECONDS = 60
+# 临时错误的最大尝试次数，以及重试间隔的上限
+NOTIFICATION_MAX_ATTEMPTS = 5
+NOTIFICATION_MAX_RETRY_SECONDS = 300
+# Telegram 对单个机器人的全局发送上限约为 30 条/秒
+NOTIFICATION_SEND_PER_SECOND = 25
+
+
+class OutboxBot:
+    """
+    在 worker 进程中代替 telegram.Bot：send_message 只把消息写入发件箱，
+    由 bot 进程的 notification_dispatcher_worker 实际发送。
+    """
+
+    async def send_message(
+        self,
+        chat_id: int,
+        text: str,
+        parse_mode: Optional[str] = None,
+        reply_markup: Optional[InlineKeyboardMarkup] = None,
+    ) -> Notification:
+        return await NotificationOutbox.enqueue(chat_id, text, parse_mode, reply_markup)
+
+
+class OutboxApplication:
+    """
+    worker 进程传给各个后台任务的 ptb_app：只提供 .bot，
+    后台任务通过 ptb_app.bot.send_message 发出的通知都进入发件箱。
+    """
+
+    def __init__(self):
+        self.bot = OutboxBot()
+
+
+class NotificationOutbox:
+    """
+    基于 MongoDB 的通知发件箱。
+    多个 bot 副本可以同时运行发送任务，每条通知由原子的 find_one_and_update 取出，只会被一个副本发送；
+    发送成功但还没来得及标记就崩溃时，超时后会被再次发送 (至少一次)。
+    """
+    _rate_limiter = TokenBucket(NOTIFICATION_SEND_PER_SECOND)
+
+    @staticmethod
+    async def enqueue(
+        chat_id: int,
+        text: str,
+        parse_mode: Optional[str] = None,
+        reply_markup: Optional[InlineKeyboardMarkup] = None,
+    ) -> Notification:
+        notification = Notification(
+            chat_id=chat_id,
+            text=text,
+            parse_mode=parse_mode,
+            reply_markup=reply_markup.to_dict() if reply_markup is not None else None,
+        )
+        await notification.insert()
+        return notification
+
+    @staticmethod
+    async def _claim() -> Optional[dict]:
+        now = datetime.utcnow()
+        return await Notification.get_pymongo_collection().find_one_and_update(
+            {"$or": [
+                {"status": NotificationStatus.PENDING.value, "available_at": {"$lte": now}},
+                {
+                    "status": NotificationStatus.SENDING.value,
+                    "claimed_at": {"$lt": now - timedelta(seconds=NOTIFICATION_CLAIM_TIMEOUT_SECONDS)},
+                },
+            ]},
+            {"$set": {"status": NotificationStatus.SENDING.value, "claimed_at": now}, "$inc": {"attempts": 1}},
+            sort=[("available_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    @staticmethod
+    async def _finish(notification: dict, update: dict):
+        await Notification.get_pymongo_collection().update_one(
+            {"_id": notification["_id"], "status": NotificationStatus.SENDING.value},
+            {"$set": update},
+        )
+
+    @staticmethod
+    async def _send(ptb_app: Application, notification: dict):
+        reply_markup = None
+        if notification.get("reply_markup"):
+            reply_markup = InlineKeyboardMarkup.de_json(notification["reply_markup"], ptb_app.bot)
+
+        started = time.perf_counter()
+        result = "ok"
+        try:
+            await ptb_app.bot.send_message(
+                chat_id=notification["chat_id"],
+                text=notification["text"],
+                parse_mode=notification.get("parse_mode"),
+                reply_markup=reply_markup,
+            )
+            await NotificationOutbox._finish(
+                notification, {"status": NotificationStatus.SENT.value, "sent_at": datetime.utcnow()}
+            )
+        except RetryAfter as e:
+            # 触发了 Telegram 的限流，按要求的时间之后重试，不计入失败次数
+            result = "retry"
+            retry_after = e.retry_after
+            seconds = retry_after.total_seconds() if isinstance(retry_after, timedelta) else retry_after
+            await NotificationOutbox._finish(notification, {
+                "status": NotificationStatus.PENDING.value,
+                "available_at": datetime.utcnow() + timedelta(seconds=seconds),
+                "attempts": notification["attempts"] - 1,
+            })
+            await asyncio.sleep(seconds)
+        except (BadRequest, Forbidden) as e:
+            # 消息格式错误或用户已屏蔽机器人，重试也不会成功
+            result = "error"
+            logging.error(f"通知发送失败，不再重试 (chat {notification['chat_id']}): {e}")
+            await NotificationOutbox._finish(
+                notification, {"status": NotificationStatus.FAILED.value, "last_error": str(e)}
+            )
+        except Exception as e:
+            result = "error"
+            attempts = notification["attempts"]
+            if attempts >= NOTIFICATION_MAX_ATTEMPTS:
+                logging.error(f"通知在 {attempts} 次尝试后仍发送失败 (chat {notification['chat_id']}): {e}")
+                update = {"status": NotificationStatus.FAILED.value, "last_error": str(e)}
+            else:
+                logging.warning(f"通知发送失败，稍后重试 (chat {notification['chat_id']}): {e}")
+                delay = min(2 ** attempts, NOTIFICATION_MAX_RETRY_SECONDS)
+                update = {
+                    "status": NotificationStatus.PENDING.value,
+                    "available_at": datetime.utcnow() + timedelta(seconds=delay),
+                    "last_error": str(e),
+                }
+            await NotificationOutbox._finish(notification, update)
+        finally:
+            NOTIFICATION_SEND_SECONDS.observe(time.perf_counter() - started, kind="outbox", result=result)
+
+    @staticmethod
+    async def dispatch_once(ptb_app: Application) -> int:
+        """发送当前所有可发送的通知，返回处理的条数。"""
+        handled = 0
+        while True:
+            await NotificationOutbox._rate_limiter.acquire()
+            notification = await NotificationOutbox._claim()
+            if notification is None:
+                return handled
+            await NotificationOutbox._send(ptb_app, notification)
+            handled += 1
+
+    @staticmethod
+    async def collect_metrics():
+        NOTIFICATION_OUTBOX_PENDING.set(
+            await Notification.find(Notification.status == NotificationStatus.PENDING).count()
+        )
+
+
+MetricsRegistry.register_collector("notification_outbox", NotificationOutbox.collect_metrics)
+
+
+async def notification_dispatcher_worker(ptb_app: Application):
+    """
+    后台任务 (bot 进程)，把独立 worker 进程写入发件箱的通知通过 Telegram 发送出去。
+    """
+    logging.info("--- Notification Dispatcher Worker Started ---")
+
+    while True:
+        try:
+            await NotificationOutbox.dispatch_once(ptb_app)
+        except Exception as e:
+            logging.error(f"通知发送任务发生错误: {e}", exc_info=True)
+        await asyncio.sleep(NOTIFICATION_POLL_SECONDS)
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import List, Tuple
+
+from pymongo.errors import BulkWriteError, OperationFailure
+from telegram.ext import Application
+
+from app.core.config import settings
+from app.db.models import Order, OrderStatus
+from app.services.lease_service import LeaseService
+
+ORDER_ARCHIVE_COLLECTION = "orders_archive"
+# 两次归档之间的间隔
+ORDER_ARCHIVE_INTERVAL_SECONDS = 60 * 60
+# 每批移动的订单数，以及批次之间的停顿，避免长时间占用数据库
+ORDER_ARCHIVE_BATCH_SIZE = 500
+ORDER_ARCHIVE_BATCH_PAUSE_SECONDS = 1
+# MongoDB 错误码：重复键；同名索引的选项不一致
+DUPLICATE_KEY_ERROR = 11000
+INDEX_OPTIONS_CONFLICT = 85
+
+
+class OrderArchiveService:
+    """
+    把早已结束的订单从 orders 移到 orders_archive，
+    让热集合只保留进行中和近期的订单，索引能常驻内存。
+    先写归档再删除原订单：中途失败时下一轮会重新移动，重复写入由 _id 去重。
+    """
+
+    @staticmethod
+    def _archive():
+        return Order.get_pymongo_collection().database[ORDER_ARCHIVE_COLLECTION]
+
+    @staticmethod
+    def _rules() -> List[Tuple[List[str], datetime]]:
+        """(状态列表, 早于该时间创建的订单可以归档)"""
+        now = datetime.utcnow()
+        return [
+            (
+                [OrderStatus.EXPIRED.value, OrderStatus.CANCELED.value],
+                now - timedelta(days=settings.ORDER_ARCHIVE_RETENTION_DAYS),
+            ),
+            (
+                [OrderStatus.COMPLETED.value],
+                now - timedelta(days=settings.ORDER_ARCHIVE_COMPLETED_RETENTION_DAYS),
+            ),
+        ]
+
+    @staticmethod
+    async def ensure_indexes():
+        """归档集合的索引：按订单号查询，以及可选的 TTL 自动清理。"""
+        archive = OrderArchiveService._archive()
+        await archive.create_index("order_id")
+        await archive.create_index([("user_id", 1), ("created_at", -1)])
+        if settings.ORDER_ARCHIVE_TTL_DAYS is None:
+            return
+        ttl_seconds = settings.ORDER_ARCHIVE_TTL_DAYS * 24 * 3600
+        try:
+            await archive.create_index("archived_at", name="archived_at_ttl", expireAfterSeconds=ttl_seconds)
+        except OperationFailure as e:
+            if e.code != INDEX_OPTIONS_CONFLICT:
+                raise
+            # 保留天数调整过，直接修改已有 TTL 索引的过期时间
+            await archive.database.command({
+                "collMod": ORDER_ARCHIVE_COLLECTION,
+                "index": {"name": "archived_at_ttl", "expireAfterSeconds": ttl_seconds},
+            })
+
+    @staticmethod
+    async def _move_batch(statuses: List[str], cutoff: datetime) -> int:
+        orders = Order.get_pymongo_collection()
+        documents = await orders.find(
+            {"status": {"$in": statuses}, "created_at": {"$lt": cutoff}}
+        ).limit(ORDER_ARCHIVE_BATCH_SIZE).to_list(None)
+        if not documents:
+            return 0
+
+        archived_at = datetime.utcnow()
+        for document in documents:
+            document["archived_at"] = archived_at
+        try:
+            await OrderArchiveService._archive().insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            # 上一轮已经写入归档但还没来得及删除的订单
+            if any(error.get("code") != DUPLICATE_KEY_ERROR for error in e.details.get("writeErrors", [])):
+                raise
+
+        # 再次带上状态条件，避免删除在这期间状态发生变化的订单
+        result = await orders.delete_many({
+            "_id": {"$in": [document["_id"] for document in documents]},
+            "status": {"$in": statuses},
+        })
+        return result.deleted_count
+
+    @staticmethod
+    async def archive_once() -> int:
+        """归档所有满足条件的订单，返回移动的数量。"""
+        moved = 0
+        for statuses, cutoff in OrderArchiveService._rules():
+            while True:
+                count = await OrderArchiveService._move_batch(statuses, cutoff)
+                moved += count
+                if count < ORDER_ARCHIVE_BATCH_SIZE:
+                    break
+                await asyncio.sleep(ORDER_ARCHIVE_BATCH_PAUSE_SECONDS)
+        return moved
+
+
+async def order_archive_worker(ptb_app: Application):
+    """
+    后台任务，定期把已结束的旧订单移入归档集合。
+    多副本部署时只有 leader 执行。
+    """
+    logging.info("--- Order Archive Worker Started ---")
+    indexes_ready = False
+
+    while True:
+        try:
+            if LeaseService.is_leader():
+                if not indexes_ready:
+                    await OrderArchiveService.ensure_indexes()
+                    indexes_ready = True
+                moved = await OrderArchiveService.archive_once()
+                if moved:
+                    logging.info(f"订单归档完成，本轮移动了 {moved} 个订单到 {ORDER_ARCHIVE_COLLECTION}。")
+        except Exception as e:
+            logging.error(f"订单归档任务发生错误: {e}", exc_info=True)
+        await asyncio.sleep(ORDER_ARCHIVE_INTERVAL_SECONDS)
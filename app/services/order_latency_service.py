@@ -0,0 +1,74 @@
+import math
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+from app.db.models import Order
+
+# 阶段名称 -> (起点字段, 终点字段, 说明)
+ORDER_STAGES = {
+    "user_payment": ("created_at", "block_time", "下单 → 付款上链"),
+    "detection": ("block_time", "payment_seen_at", "上链 → 检测到付款"),
+    "solidification": ("payment_seen_at", "paid_at", "检测 → 固化确认"),
+    "rental_queue": ("paid_at", "rental_started_at", "确认 → 调用租赁"),
+    "rental_call": ("rental_started_at", "rental_finished_at", "租赁接口耗时"),
+    "notification": ("rental_finished_at", "notified_at", "租赁返回 → 通知用户"),
+    "end_to_end": ("block_time", "notified_at", "上链 → 通知用户"),
+}
+LATENCY_PERCENTILES = (50, 90, 99)
+
+
+class OrderTimeline(BaseModel):
+    """统计耗时只需要订单的各个时间戳。"""
+    created_at: datetime
+    block_time: Optional[datetime] = None
+    payment_seen_at: Optional[datetime] = None
+    paid_at: Optional[datetime] = None
+    rental_started_at: Optional[datetime] = None
+    rental_finished_at: Optional[datetime] = None
+    notified_at: Optional[datetime] = None
+
+
+class StageLatency(BaseModel):
+    stage: str
+    description: str
+    count: int
+    # 百分位 -> 秒
+    percentiles: Dict[int, float]
+
+
+def _percentile(sorted_values: List[float], percentile: int) -> float:
+    """最近秩法 (nearest-rank) 计算百分位数。"""
+    rank = max(math.ceil(percentile / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+class OrderLatencyService:
+    """
+    按订单生命周期的各个阶段统计耗时，
+    用于判断慢订单是慢在链上、我们的轮询，还是 kuaizu.io。
+    """
+
+    @staticmethod
+    async def stage_percentiles(since: datetime, until: Optional[datetime] = None) -> List[StageLatency]:
+        """统计在 [since, until) 时间窗口内确认支付的订单，各阶段耗时的百分位数。"""
+        query = [Order.paid_at >= since]
+        if until is not None:
+            query.append(Order.paid_at < until)
+        timelines = await Order.find(*query).project(OrderTimeline).to_list()
+
+        results = []
+        for stage, (start_field, end_field, description) in ORDER_STAGES.items():
+            durations = sorted(
+                (getattr(t, end_field) - getattr(t, start_field)).total_seconds()
+                for t in timelines
+                if getattr(t, start_field) is not None and getattr(t, end_field) is not None
+            )
+            results.append(StageLatency(
+                stage=stage,
+                description=description,
+                count=len(durations),
+                percentiles={p: _percentile(durations, p) for p in LATENCY_PERCENTILES} if durations else {},
+            ))
+        return results
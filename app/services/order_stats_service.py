@@ -0,0 +1,95 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from app.db.models import Order, OrderRollup, OrderStatus
+
+ROLLUP_GRANULARITIES = ("hour", "day")
+
+
+def _bucket_start(at: datetime, granularity: str) -> datetime:
+    if granularity == "hour":
+        return at.replace(minute=0, second=0, microsecond=0)
+    return at.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class OrderStatsRow(BaseModel):
+    """某种订单类型和币种在统计时间段内各状态的合计。"""
+    order_type: str
+    currency: str
+    # 状态 -> (订单数, 金额)
+    statuses: Dict[str, Tuple[int, float]]
+
+
+class OrderStatsService:
+    """
+    订单统计的增量汇总 (order_rollups)。
+    每次订单状态变化成功后 (条件更新命中之后) 调用 record，
+    同时累加小时级和天级两条汇总；统计查询只读取覆盖的时间段，与订单总量无关。
+    """
+
+    @staticmethod
+    async def record(order: Order, status: OrderStatus, amount: Optional[float] = None, at: Optional[datetime] = None):
+        """
+        记录一个订单进入了 status 状态。统计失败只记录日志，不影响订单处理。
+        amount 默认取订单金额。
+        """
+        amount = order.expected_amount if amount is None else amount
+        await OrderStatsService._inc(order, status, 1, amount, at or datetime.utcnow())
+
+    @staticmethod
+    async def retract(order: Order, status: OrderStatus, amount: float, at: datetime):
+        """
+        撤销之前的一次 record (例如付款未能确认，订单从“待确认”撤回)。
+        amount 和 at 必须与当初 record 时相同，才能从同一个时间段中扣除。
+        """
+        await OrderStatsService._inc(order, status, -1, -amount, at)
+
+    @staticmethod
+    async def _inc(order: Order, status: OrderStatus, count: int, amount: float, at: datetime):
+        collection = OrderRollup.get_pymongo_collection()
+        try:
+            for granularity in ROLLUP_GRANULARITIES:
+                await collection.update_one(
+                    {
+                        "granularity": granularity,
+                        "bucket": _bucket_start(at, granularity),
+                        "order_type": order.order_type.value,
+                        "currency": order.currency,
+                        "status": status.value,
+                    },
+                    {"$inc": {"order_count": count, "total_amount": amount}},
+                    upsert=True,
+                )
+        except Exception as e:
+            logging.warning(f"更新订单 {order.order_id} 的统计汇总失败 ({status.value}): {e}")
+
+    @staticmethod
+    async def summary(since: datetime, until: Optional[datetime] = None, granularity: str = "day") -> List[OrderStatsRow]:
+        """汇总 [since, until) 内 (按 granularity 对齐) 的各时间段统计，按订单类型和币种分组。"""
+        query = [
+            OrderRollup.granularity == granularity,
+            OrderRollup.bucket >= _bucket_start(since, granularity),
+        ]
+        if until is not None:
+            query.append(OrderRollup.bucket < until)
+
+        rows: Dict[Tuple[str, str], OrderStatsRow] = {}
+        async for rollup in OrderRollup.find(*query):
+            row = rows.setdefault(
+                (rollup.order_type, rollup.currency),
+                OrderStatsRow(order_type=rollup.order_type, currency=rollup.currency, statuses={}),
+            )
+            count, amount = row.statuses.get(rollup.status, (0, 0.0))
+            row.statuses[rollup.status] = (count + rollup.order_count, amount + rollup.total_amount)
+        return [rows[key] for key in sorted(rows)]
+
+    @staticmethod
+    def window(days: int = 0, hours: int = 0) -> Tuple[datetime, str]:
+        """按小时查询时使用小时级汇总，否则使用天级汇总 (从今天 0 点往前数)。"""
+        now = datetime.utcnow()
+        if hours:
+            return now - timedelta(hours=hours - 1), "hour"
+        return _bucket_start(now, "day") - timedelta(days=days - 1), "day"
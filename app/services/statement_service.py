@@ -0,0 +1,131 @@
+import csv
+import io
+import logging
+import tempfile
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, List, Tuple
+
+from app.core.config import settings
+from app.core.rate_limit import TokenBucket
+from app.db.models import LedgerEntry
+from app.services.monitoring_service import MonitoringService
+from app.services.tron_service import TronService
+
+# 从链上补齐流水之前的历史时，每次拉取的时间窗口 (内存中最多只保留一个窗口的交易)
+STATEMENT_CHAIN_WINDOW = timedelta(days=1)
+# 账单文件超过该大小时从内存转存到临时文件
+STATEMENT_SPOOL_MAX_BYTES = 1024 * 1024
+
+STATEMENT_COLUMNS = ["time_utc", "tx_id", "direction", "token", "amount", "counterparty"]
+
+
+def _to_ms(value: datetime) -> int:
+    """数据库中的时间都是不带时区的 UTC 时间。"""
+    return int(value.replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+async def spool_csv(columns: List[str], rows: AsyncIterator[List]) -> Tuple[tempfile.SpooledTemporaryFile, int]:
+    """
+    把异步产出的行逐行写成 CSV，返回 (已回到开头的文件对象, 行数)。
+    文件较小时留在内存中，较大时自动转存到磁盘；调用方用完后负责关闭。
+    """
+    output = tempfile.SpooledTemporaryFile(max_size=STATEMENT_SPOOL_MAX_BYTES, mode="w+b")
+    # 带 BOM，方便 Excel 直接打开
+    text = io.TextIOWrapper(output, encoding="utf-8-sig", newline="", write_through=True)
+    writer = csv.writer(text)
+    writer.writerow(columns)
+    count = 0
+    async for row in rows:
+        writer.writerow(row)
+        count += 1
+    text.flush()
+    # 分离包装器，避免它被回收时关闭底层文件
+    text.detach()
+    output.seek(0)
+    return output, count
+
+
+def _from_ms(timestamp: int) -> datetime:
+    return datetime.utcfromtimestamp(timestamp / 1000)
+
+
+def _row(tx_id: str, timestamp: int, direction: str, token: str, amount: float, counterparty: str) -> List:
+    return [
+        _from_ms(timestamp).strftime("%Y-%m-%d %H:%M:%S"),
+        tx_id, "收入" if direction == "in" else "支出", token, amount, counterparty,
+    ]
+
+
+class StatementService:
+    """
+    生成某个地址在一段时间内的交易账单 (CSV)。
+    流水确认完整的时间段 (LedgerCoverage) 直接读 ledger_entries，其余部分按天分窗口从 TronGrid 翻页拉取；
+    各阶段都是异步生成器，逐行写入可溢出到磁盘的临时文件，整个时间段的数据不会同时留在内存中。
+    """
+    _rate_limiter = TokenBucket(settings.STATEMENT_REQUESTS_PER_SECOND)
+
+    @staticmethod
+    async def _plan(address: str, since: datetime, until: datetime) -> List[Tuple[str, datetime, datetime]]:
+        """
+        把 [since, until) 拆成按时间先后的若干段，每段标明数据来源 ("chain" 或 "ledger")。
+        只有覆盖区间内的流水是完整的：开始监听之前、停机期间和最近尚未确认的部分都要从链上拉取。
+        """
+        coverage = await MonitoringService.get_ledger_coverage(address)
+        if coverage is None:
+            return [("chain", since, until)]
+        # 覆盖区间的两端都包含在内，换成左闭右开的区间
+        ledger_since = max(since, _from_ms(coverage[0]))
+        ledger_until = min(until, _from_ms(coverage[1] + 1))
+        if ledger_since >= ledger_until:
+            return [("chain", since, until)]
+        parts = [("chain", since, ledger_since), ("ledger", ledger_since, ledger_until), ("chain", ledger_until, until)]
+        return [part for part in parts if part[1] < part[2]]
+
+    @staticmethod
+    async def _chain_rows(address: str, since: datetime, until: datetime) -> AsyncIterator[List]:
+        window_start = since
+        while window_start < until:
+            window_end = min(window_start + STATEMENT_CHAIN_WINDOW, until)
+            transactions = await TronService.get_transactions_in_range(
+                address,
+                _to_ms(window_start),
+                _to_ms(window_end) - 1,
+                rate_limiter=StatementService._rate_limiter,
+            )
+            for tx in transactions:
+                if address not in (tx.from_address, tx.to_address):
+                    continue
+                incoming = tx.to_address == address
+                yield _row(
+                    tx.tx_id, tx.timestamp, "in" if incoming else "out", tx.token_symbol, tx.amount,
+                    tx.from_address if incoming else tx.to_address,
+                )
+            window_start = window_end
+
+    @staticmethod
+    async def _ledger_rows(address: str, since: datetime, until: datetime) -> AsyncIterator[List]:
+        cursor = LedgerEntry.find(
+            LedgerEntry.address == address,
+            LedgerEntry.block_time >= since,
+            LedgerEntry.block_time < until,
+        ).sort(+LedgerEntry.block_time)
+        # 逐批从数据库游标读取，不会一次性加载整个时间段
+        async for entry in cursor:
+            yield _row(entry.tx_id, entry.timestamp, entry.direction, entry.token_symbol, entry.amount, entry.counterparty)
+
+    @staticmethod
+    async def iter_rows(address: str, since: datetime, until: datetime) -> AsyncIterator[List]:
+        """按时间正序逐行产出账单 (时间均为 UTC)。"""
+        for source, start, end in await StatementService._plan(address, since, until):
+            if source == "ledger":
+                rows = StatementService._ledger_rows(address, start, end)
+            else:
+                logging.info(f"地址 {address[:10]}... 的账单在 {start} ~ {end} 没有完整的本地流水，从链上拉取。")
+                rows = StatementService._chain_rows(address, start, end)
+            async for row in rows:
+                yield row
+
+    @staticmethod
+    async def build_csv(address: str, since: datetime, until: datetime) -> Tuple[tempfile.SpooledTemporaryFile, int]:
+        """生成账单 CSV，返回 (已回到开头的文件对象, 交易条数)，见 spool_csv。"""
+        return await spool_csv(STATEMENT_COLUMNS, StatementService.iter_rows(address, since, until))
@@ -0,0 +1,145 @@
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional, Set
+
+from pymongo.errors import DuplicateKeyError
+
+from app.db.models import StreamState
+from app.services.lease_service import LeaseService
+
+# 迁移旧数据时需要继承进度的消费者
+STREAM_CONSUMERS = ("payment", "monitor")
+
+
+class ConsumerCursors:
+    """
+    某个消费者在各个地址上的处理进度。
+    进度先在内存中推进，再按消费者自己的节奏持久化到 StreamState，
+    例如支付匹配每处理一批就落盘，而地址监听可以每隔几十秒落盘一次。
+    多副本部署时，每个地址的写入都带上对应租约的 fencing token，
+    已经失去租约的旧副本无法再覆盖新持有者的进度。
+    """
+
+    def __init__(
+        self,
+        consumer: str,
+        lease_for: Callable[[str], str],
+        checkpoint_interval: float = 0,
+        initial_lookback_seconds: int = 0,
+    ):
+        self.consumer = consumer
+        # 地址 -> 负责该地址的租约名称
+        self.lease_for = lease_for
+        self.checkpoint_interval = checkpoint_interval
+        # 首次见到一个地址时，从多久以前开始处理
+        self.initial_lookback_seconds = initial_lookback_seconds
+        self._positions: Dict[str, int] = {}
+        self._dirty: Set[str] = set()
+        self._last_checkpoint = time.monotonic()
+
+    async def ensure(self, address: str) -> int:
+        """返回某地址的处理进度，数据库中没有时创建一条。"""
+        if address in self._positions:
+            return self._positions[address]
+
+        state = await StreamState.find_one(
+            StreamState.consumer == self.consumer,
+            StreamState.address == address,
+        )
+        if not state:
+            now_ms = int(datetime.now(timezone.utc).timestamp() * 1000)
+            try:
+                state = StreamState(
+                    consumer=self.consumer,
+                    address=address,
+                    last_processed_timestamp=now_ms - self.initial_lookback_seconds * 1000,
+                )
+                await state.insert()
+                logging.info(f"为消费者 {self.consumer} 的地址 {address[:10]}... 首次创建处理状态。")
+            except DuplicateKeyError:
+                # 另一个副本或任务抢先创建了，重新查询即可
+                state = await StreamState.find_one(
+                    StreamState.consumer == self.consumer,
+                    StreamState.address == address,
+                )
+                if not state:
+                    raise
+
+        # 这期间内存中的进度可能已经被推进过
+        self._positions[address] = max(state.last_processed_timestamp, self._positions.get(address, 0))
+        return self._positions[address]
+
+    def position(self, address: str) -> Optional[int]:
+        return self._positions.get(address)
+
+    def advance(self, address: str, timestamp: int):
+        """在内存中推进进度，只会前进不会后退。"""
+        if timestamp > self._positions.get(address, 0):
+            self._positions[address] = timestamp
+            self._dirty.add(address)
+
+    async def checkpoint(self, force: bool = False):
+        """到达落盘间隔 (或 force=True) 时把推进过的进度写回数据库。"""
+        if not self._dirty:
+            return
+        if not force and time.monotonic() - self._last_checkpoint < self.checkpoint_interval:
+            return
+
+        dirty, self._dirty = self._dirty, set()
+        for address in dirty:
+            timestamp = self._positions[address]
+            token = LeaseService.fencing_token(self.lease_for(address))
+            if token is None:
+                logging.warning(f"消费者 {self.consumer} 已失去地址 {address[:10]}... 的租约，放弃保存进度。")
+                continue
+
+            # 使用 $max，即使有并发写入也不会让游标倒退；
+            # 令牌过滤保证旧持有者的延迟写入不会生效
+            result = await StreamState.find_one(
+                StreamState.consumer == self.consumer,
+                StreamState.address == address,
+                StreamState.fencing_token <= token,
+            ).update({
+                "$max": {StreamState.last_processed_timestamp: timestamp},
+                "$set": {StreamState.fencing_token: token, StreamState.updated_at: datetime.utcnow()},
+            })
+            if result is not None and result.matched_count == 0:
+                logging.warning(f"消费者 {self.consumer} 在地址 {address[:10]}... 的进度写入被更新的租约令牌拒绝。")
+        self._last_checkpoint = time.monotonic()
+        logging.debug(f"消费者 {self.consumer} 已保存 {len(dirty)} 个地址的处理进度。")
+
+    def forget(self, addresses: Set[str]):
+        """丢弃不再监听的地址的内存进度 (数据库中的记录保留)。"""
+        for address in list(self._positions):
+            if address not in addresses and address not in self._dirty:
+                del self._positions[address]
+
+
+async def migrate_stream_state():
+    """
+    将旧版仅按地址存储的 StreamState 迁移为按 (消费者, 地址) 存储。
+    旧记录的进度会复制给每个消费者，然后删除旧记录和旧的唯一索引。
+    """
+    collection = StreamState.get_pymongo_collection()
+
+    index_info = await collection.index_information()
+    if "address_1" in index_info:
+        await collection.drop_index("address_1")
+        logging.info("已删除 stream_state 上旧的 address 唯一索引。")
+
+    legacy_states = await collection.find({"consumer": {"$exists": False}}).to_list(length=None)
+    for doc in legacy_states:
+        for consumer in STREAM_CONSUMERS:
+            await collection.update_one(
+                {"consumer": consumer, "address": doc["address"]},
+                {"$setOnInsert": {
+                    "last_processed_timestamp": doc["last_processed_timestamp"],
+                    "updated_at": datetime.utcnow(),
+                }},
+                upsert=True,
+            )
+        await collection.delete_one({"_id": doc["_id"]})
+
+    if legacy_states:
+        logging.info(f"已将 {len(legacy_states)} 条旧版 StreamState 迁移为按消费者存储。")
@@ -2,15 +2,24 @@ import logging
 from datetime import datetime
 from pydantic import BaseModel
 import asyncio
+import time
 import httpx
 import requests  # For synchronous USDT balance query
-from typing import Optional, List 
+from typing import Optional, List, Tuple
 # --- 导入 Tronpy ---
 from tronpy import Tron
 from tronpy.providers import HTTPProvider
 from tronpy.exceptions import AddressNotFound
 
 from app.core.config import settings
+from app.core.rate_limit import TokenBucket
+from app.core.metrics import EXTERNAL_REQUEST_SECONDS, instrumented_request
+from app.core.coalesce import coalesce
+
+# TronGrid v1 接口单页允许的最大条数
+TRONGRID_PAGE_SIZE = 200
+# 常规轮询每个接口只取一页的条数
+POLL_PAGE_SIZE = 20
 
 # --- Pydantic 模型来规范化交易数据 ---
 class TransactionData(BaseModel):
@@ -68,10 +77,12 @@ class TronService:
     CRYPTO_APIS_BASE_URL = "https://rest.cryptoapis.io"
 
     @staticmethod
+    @coalesce(lambda address: address)
     async def get_account_details(address: str) -> TronAccountDetails | None:
         """
         异步获取账户详情。
         通过在线程池中运行同步的 tronpy 调用来避免阻塞事件循环。
+        同一地址的并发查询 (例如多个用户同时查询、同一地址的多条提醒) 只请求一次。
         """
         
         def _sync_fetch_details():
@@ -149,6 +160,8 @@ class TronService:
                 "last_operation_time": datetime.fromtimestamp(account_info.get("latest_opration_time", account_info["create_time"]) / 1000)
             }
 
+        started = time.perf_counter()
+        status = "ok"
         try:
             # 获取当前的 asyncio 事件循环
             loop = asyncio.get_running_loop()
@@ -156,7 +169,15 @@ class TronService:
             # --- 关键步骤 ---
             # 在默认的线程池执行器中运行同步函数 _sync_fetch_details
             # 这会防止它阻塞 FastAPI 和 Telegram Bot 的主事件循环
-            details_dict = await loop.run_in_executor(None, _sync_fetch_details)
+            try:
+                details_dict = await loop.run_in_executor(None, _sync_fetch_details)
+            except Exception as e:
+                status = type(e).__name__
+                raise
+            finally:
+                EXTERNAL_REQUEST_SECONDS.observe(
+                    time.perf_counter() - started, service="tronpy", endpoint="account_details", status=status
+                )
             
             # 使用验证过的字典创建 Pydantic 模型实例
             return TronAccountDetails(**details_dict)
@@ -174,7 +195,17 @@ class TronService:
         [重构] 使用 TronGrid 的免费 V1 API 获取一个地址在指定时间戳之后的新交易。
         支持主网和测试网。
         """
+        transactions, _ = await TronService.poll_transactions(address, since_timestamp)
+        return transactions
+
+    @staticmethod
+    async def poll_transactions(address: str, since_timestamp: int) -> Tuple[List[TransactionData], bool]:
+        """
+        与 get_new_transactions 相同，但同时返回这次结果是否完整：
+        两个接口都请求成功且都没有取满一页时，才能确定 since_timestamp 之后的交易已全部拿到。
+        """
         all_new_transactions = []
+        complete = True
         # 根据网络模式选择正确的 API 端点
         if TronService._is_testnet:
             base_url = "https://api.shasta.trongrid.io/v1/accounts"
@@ -188,49 +219,44 @@ class TronService:
         
         # 为了避免错过交易，我们给时间戳一个小的缓冲
         # "only_confirmed": True 移除 only_confirmed 意味着您可能会获取到一些最终因为分叉等原因未被区块链接受的交易。虽然在 TRON 上这种情况非常罕见，但理论上存在。
-        params = {"limit": 20, "min_timestamp": since_timestamp}
+        params = {"limit": POLL_PAGE_SIZE, "min_timestamp": since_timestamp}
 
         async with httpx.AsyncClient(timeout=15) as client:
             # --- 1. 获取 TRC20 (USDT) 交易 ---
             try:
                 # 只查询 USDT 合约
                 trc20_url = f"{base_url}/{address}/transactions/trc20?contract_address={TronService.USDT_CONTRACT_ADDRESS}"
-                resp = await client.get(trc20_url, headers=headers, params=params)
+                resp = await instrumented_request(
+                    client, "GET", trc20_url, service="trongrid", endpoint="account_trc20_transactions",
+                    headers=headers, params=params,
+                )
                 resp.raise_for_status()
                 
-                for tx in resp.json().get("data", []):
-                    all_new_transactions.append(TransactionData(
-                        tx_id=tx['transaction_id'],
-                        from_address=tx['from'],
-                        to_address=tx['to'],
-                        token_symbol='USDT',
-                        amount=int(tx['value']) / (10**TronService.USDT_DECIMALS),
-                        timestamp=tx['block_timestamp']
-                    ))
+                data = resp.json().get("data", [])
+                complete = complete and len(data) < POLL_PAGE_SIZE
+                for tx in data:
+                    all_new_transactions.append(TronService._parse_trc20_transfer(tx))
             except Exception as e:
+                complete = False
                 logging.warning(f"轮询 TRC20 交易失败 ({address[:6]}...): {e}")
 
             # --- 2. 获取 TRX 交易 ---
             try:
                 trx_url = f"{base_url}/{address}/transactions"
-                resp = await client.get(trx_url, headers=headers, params=params)
+                resp = await instrumented_request(
+                    client, "GET", trx_url, service="trongrid", endpoint="account_transactions",
+                    headers=headers, params=params,
+                )
                 resp.raise_for_status()
 
-                for tx in resp.json().get("data", []):
-                    contract_data = tx.get("raw_data", {}).get("contract", [{}])[0]
-                    if contract_data.get("type") == "TransferContract":
-                        value = contract_data.get("parameter", {}).get("value", {})
-                        amount = value.get('amount', 0) / 1_000_000
-                        if amount > 0:
-                            all_new_transactions.append(TransactionData(
-                                tx_id=tx['txID'],
-                                from_address=TronService.client.to_base58check_address(value.get('owner_address')),
-                                to_address=TronService.client.to_base58check_address(value.get('to_address')),
-                                token_symbol='TRX',
-                                amount=amount,
-                                timestamp=tx['block_timestamp'] 
-                            ))
+                data = resp.json().get("data", [])
+                complete = complete and len(data) < POLL_PAGE_SIZE
+                for tx in data:
+                    parsed = TronService._parse_trx_transfer(tx)
+                    if parsed:
+                        all_new_transactions.append(parsed)
             except Exception as e:
+                complete = False
                 logging.warning(f"轮询 TRX 交易失败 ({address[:6]}...): {e}")
 
         # 按时间戳排序并去重
@@ -238,7 +264,132 @@ class TronService:
         unique_transactions = {tx.tx_id: tx for tx in all_new_transactions}
         sorted_transactions = sorted(unique_transactions.values(), key=lambda t: t.timestamp)
         
-        return sorted_transactions
+        return sorted_transactions, complete
+
+    @staticmethod
+    def _api_base_url() -> str:
+        if TronService._is_testnet:
+            return "https://api.shasta.trongrid.io"
+        return "https://api.trongrid.io"
+
+    @staticmethod
+    def _accounts_base_url() -> str:
+        return f"{TronService._api_base_url()}/v1/accounts"
+
+    @staticmethod
+    def _parse_trc20_transfer(tx: dict) -> TransactionData:
+        """将 TronGrid TRC20 转账记录转换为 TransactionData。"""
+        return TransactionData(
+            tx_id=tx['transaction_id'],
+            from_address=tx['from'],
+            to_address=tx['to'],
+            token_symbol='USDT',
+            amount=int(tx['value']) / (10**TronService.USDT_DECIMALS),
+            timestamp=tx['block_timestamp']
+        )
+
+    @staticmethod
+    def _parse_trx_transfer(tx: dict) -> Optional[TransactionData]:
+        """将 TronGrid 交易记录转换为 TransactionData，非 TRX 转账返回 None。"""
+        contract_data = tx.get("raw_data", {}).get("contract", [{}])[0]
+        if contract_data.get("type") != "TransferContract":
+            return None
+        value = contract_data.get("parameter", {}).get("value", {})
+        amount = value.get('amount', 0) / 1_000_000
+        if amount <= 0:
+            return None
+        return TransactionData(
+            tx_id=tx['txID'],
+            from_address=TronService.client.to_base58check_address(value.get('owner_address')),
+            to_address=TronService.client.to_base58check_address(value.get('to_address')),
+            token_symbol='TRX',
+            amount=amount,
+            timestamp=tx['block_timestamp']
+        )
+
+    @staticmethod
+    async def get_transactions_in_range(
+        address: str,
+        min_timestamp: int,
+        max_timestamp: int,
+        rate_limiter: Optional[TokenBucket] = None,
+    ) -> List[TransactionData]:
+        """
+        获取一个地址在 [min_timestamp, max_timestamp] 区间内的全部 TRX 和 USDT 转账。
+        与 get_new_transactions 不同，这里会按 fingerprint 翻页直到取完，
+        出错时直接抛出异常，由调用方决定是否重试。用于停机后的追赶补数。
+        """
+        base_url = TronService._accounts_base_url()
+        headers = {"TRON-PRO-API-KEY": settings.TRONGRID_API_KEY}
+        endpoints = [
+            (f"{base_url}/{address}/transactions/trc20", "account_trc20_transactions",
+             {"contract_address": TronService.USDT_CONTRACT_ADDRESS}, TronService._parse_trc20_transfer),
+            (f"{base_url}/{address}/transactions", "account_transactions", {}, TronService._parse_trx_transfer),
+        ]
+
+        transactions = []
+        async with httpx.AsyncClient(timeout=15) as client:
+            for url, endpoint, extra_params, parse in endpoints:
+                params = {
+                    **extra_params,
+                    "limit": TRONGRID_PAGE_SIZE,
+                    "min_timestamp": min_timestamp,
+                    "max_timestamp": max_timestamp,
+                    "order_by": "block_timestamp,asc",
+                }
+                while True:
+                    if rate_limiter:
+                        await rate_limiter.acquire()
+                    resp = await instrumented_request(
+                        client, "GET", url, service="trongrid", endpoint=endpoint, headers=headers, params=params
+                    )
+                    resp.raise_for_status()
+                    body = resp.json()
+                    for tx in body.get("data", []):
+                        parsed = parse(tx)
+                        if parsed:
+                            transactions.append(parsed)
+
+                    fingerprint = body.get("meta", {}).get("fingerprint")
+                    if not fingerprint:
+                        break
+                    params["fingerprint"] = fingerprint
+
+        unique_transactions = {tx.tx_id: tx for tx in transactions}
+        return sorted(unique_transactions.values(), key=lambda t: t.timestamp)
+
+    @staticmethod
+    async def get_solidified_result(tx_id: str) -> Optional[bool]:
+        """
+        查询交易是否已进入固化区块 (solidified)。
+        返回 True 表示已固化且执行成功，False 表示已固化但执行失败，
+        None 表示节点确认尚未固化，稍后再查。
+        查询失败时抛出异常，调用方不能把它当作“未固化”。
+        """
+        url = f"{TronService._api_base_url()}/walletsolidity/gettransactioninfobyid"
+        headers = {"TRON-PRO-API-KEY": settings.TRONGRID_API_KEY}
+        try:
+            async with httpx.AsyncClient(timeout=15) as client:
+                resp = await instrumented_request(
+                    client, "POST", url, service="trongrid", endpoint="walletsolidity_gettransactioninfobyid",
+                    headers=headers, json={"value": tx_id},
+                )
+                resp.raise_for_status()
+                info = resp.json()
+        except Exception as e:
+            logging.warning(f"查询交易固化状态失败 ({tx_id[:10]}...): {e}")
+            raise
+
+        # 尚未固化时固化节点返回空对象
+        if not info or "blockNumber" not in info:
+            return None
+        # TRX 转账失败时 result 为 FAILED；TRC20 转账还需要看合约执行结果
+        if info.get("result") == "FAILED":
+            return False
+        receipt_result = info.get("receipt", {}).get("result")
+        if receipt_result is not None and receipt_result != "SUCCESS":
+            return False
+        return True
 
     # 根据交易哈希获取付款方地址
     @staticmethod
@@ -262,85 +413,10 @@ class TronService:
                 return None
 
         loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(None, _sync_fetch)        
-
-    @staticmethod
-    async def get_new_transactions333(address: str, since_timestamp: int) -> List[TransactionData]:
-        """
-        [调试版] 使用 TronGrid V1 API 获取新交易，并打印详细日志。
-        """
-        # --- 打印日志 1: 函数入口 ---
-        logging.info(f"[get_new_transactions] 正在为地址 {address} 查询时间戳 > {since_timestamp} 的交易...")
-        
-        all_new_transactions = []
-        # Use correct endpoint based on network mode
-        if TronService._is_testnet:
-            base_url = "https://api.shasta.trongrid.io/v1/accounts"
-            network_name = "Shasta Testnet"
-        else:
-            base_url = "https://api.trongrid.io/v1/accounts"
-            network_name = "Mainnet"
-        headers = {"TRON-PRO-API-KEY": settings.TRONGRID_API_KEY}
-        
-        params = {"limit": 20, "min_timestamp": since_timestamp}
-
-        async with httpx.AsyncClient(timeout=15) as client:
-            # --- 1. 获取 TRC20 (USDT) 交易 ---
-            try:
-                trc20_url = f"{base_url}/{address}/transactions/trc20?contract_address={TronService.USDT_CONTRACT_ADDRESS}"
-                resp = await client.get(trc20_url, headers=headers, params=params)
-                
-                # --- 打印日志 2: TRC20 API 的原始响应 ---
-                logging.info(f"[get_new_transactions] TRC20 API Response for {address[:6]}: Status={resp.status_code}, Body={resp.text}")
-
-                resp.raise_for_status()
-                
-                for tx in resp.json().get("data", []):
-                    # (解析逻辑不变)
-                    all_new_transactions.append(TransactionData(
-                        tx_id=tx['transaction_id'],
-                        from_address=tx['from'],
-                        to_address=tx['to'],
-                        token_symbol='USDT',
-                        amount=int(tx['value']) / (10**TronService.USDT_DECIMALS),
-                        timestamp=tx['block_timestamp']
-                    ))
-            except Exception as e:
-                logging.warning(f"轮询 TRC20 交易失败 ({address[:6]}...): {e}")
-
-            # --- 2. 获取 TRX 交易 ---
-            try:
-                trx_url = f"{base_url}/{address}/transactions"
-                resp = await client.get(trx_url, headers=headers, params=params)
-
-                # --- 打印日志 3: TRX API 的原始响应 ---
-                logging.info(f"[get_new_transactions] TRX API Response for {address[:6]}: Status={resp.status_code}, Body={resp.text}")
-
-                resp.raise_for_status()
-
-                for tx in resp.json().get("data", []):
-                    # (解析逻辑不变)
-                    contract_data = tx.get("raw_data", {}).get("contract", [{}])[0]
-                    if contract_data.get("type") == "TransferContract":
-                        value = contract_data.get("parameter", {}).get("value", {})
-                        amount = value.get('amount', 0) / 1_000_000
-                        if amount > 0:
-                            all_new_transactions.append(TransactionData(
-                                tx_id=tx['txID'],
-                                from_address=TronService.client.to_base58check_address(value.get('owner_address')),
-                                to_address=TronService.client.to_base58check_address(value.get('to_address')),
-                                token_symbol='TRX',
-                                amount=amount,
-                                timestamp=tx['raw_data']['timestamp']
-                            ))
-            except Exception as e:
-                logging.warning(f"轮询 TRX 交易失败 ({address[:6]}...): {e}")
-
-        # (去重和排序逻辑不变)
-        unique_transactions = {tx.tx_id: tx for tx in all_new_transactions}
-        sorted_transactions = sorted(unique_transactions.values(), key=lambda t: t.timestamp)
-        
-        # --- 打印日志 4: 函数出口 ---
-        logging.info(f"[get_new_transactions] 本次查询共找到 {len(sorted_transactions)} 笔唯一的、符合条件的交易。")
-        
-        return sorted_transactions
\ No newline at end of file
+        started = time.perf_counter()
+        sender = await loop.run_in_executor(None, _sync_fetch)
+        EXTERNAL_REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            service="tronpy", endpoint="get_transaction", status="ok" if sender else "error",
+        )
+        return sender        
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.rate_limit import TokenBucket
+from app.services.tron_service import TronService, TronAccountDetails
+
+# 最多缓存多少个地址的查询结果，超出时淘汰最久未使用的
+WALLET_QUERY_CACHE_MAX_ENTRIES = 5_000
+# 批量查询时同时进行的查询数
+BULK_QUERY_CONCURRENCY = 8
+
+
+class WalletQueryCache:
+    """
+    钱包查询结果缓存 (stale-while-revalidate)：
+    - 新鲜期内 (WALLET_QUERY_FRESH_SECONDS) 直接返回缓存，不请求链上；
+    - 过了新鲜期但未超过 WALLET_QUERY_MAX_STALE_SECONDS 时先返回旧数据，由调用方在后台刷新；
+    - 没有缓存或缓存太旧时同步查询。
+    所有钱包查询 (单个和批量) 共享一个请求 TronGrid 的速率预算。
+    """
+    # 地址 -> (账户详情, 查询时间 time.monotonic())
+    _entries: "OrderedDict[str, Tuple[TronAccountDetails, float]]" = OrderedDict()
+    _rate_limiter = TokenBucket(settings.WALLET_QUERY_REQUESTS_PER_SECOND)
+
+    @staticmethod
+    def peek(address: str) -> Optional[Tuple[TronAccountDetails, float]]:
+        """返回缓存的账户详情及其年龄 (秒)；没有可用缓存时返回 None。"""
+        entry = WalletQueryCache._entries.get(address)
+        if entry is None:
+            return None
+        details, fetched_at = entry
+        age = time.monotonic() - fetched_at
+        if age > settings.WALLET_QUERY_MAX_STALE_SECONDS:
+            del WalletQueryCache._entries[address]
+            return None
+        WalletQueryCache._entries.move_to_end(address)
+        return details, age
+
+    @staticmethod
+    def is_fresh(age_seconds: float) -> bool:
+        return age_seconds <= settings.WALLET_QUERY_FRESH_SECONDS
+
+    @staticmethod
+    async def refresh(address: str) -> Optional[TronAccountDetails]:
+        """从链上重新查询并更新缓存；查询失败时保留旧缓存。"""
+        await WalletQueryCache._rate_limiter.acquire()
+        details = await TronService.get_account_details(address)
+        if details is not None:
+            WalletQueryCache._entries[address] = (details, time.monotonic())
+            WalletQueryCache._entries.move_to_end(address)
+            while len(WalletQueryCache._entries) > WALLET_QUERY_CACHE_MAX_ENTRIES:
+                WalletQueryCache._entries.popitem(last=False)
+        else:
+            logging.debug(f"刷新地址 {address[:10]}... 的查询缓存失败，保留旧数据。")
+        return details
+
+    @staticmethod
+    async def get(address: str) -> Tuple[Optional[TronAccountDetails], float]:
+        """
+        返回 (账户详情, 数据年龄秒)。有可用缓存时直接返回 (可能已过新鲜期)，
+        否则同步查询，年龄为 0。
+        """
+        cached = WalletQueryCache.peek(address)
+        if cached is not None:
+            return cached
+        return await WalletQueryCache.refresh(address), 0.0
+
+
+class BulkWalletQuery:
+    """一次查询多个地址：并发查询，新鲜期内的缓存直接使用，每查完一个地址回调一次。"""
+
+    @staticmethod
+    async def run(
+        addresses: List[str],
+        on_result: Optional[Callable[[str, Optional[TronAccountDetails]], Awaitable[None]]] = None,
+    ) -> Dict[str, Optional[TronAccountDetails]]:
+        """返回 地址 -> 账户详情 (查询失败为 None)，顺序与传入的地址一致。"""
+        semaphore = asyncio.Semaphore(BULK_QUERY_CONCURRENCY)
+        results: Dict[str, Optional[TronAccountDetails]] = dict.fromkeys(addresses)
+
+        async def _query(address: str):
+            async with semaphore:
+                cached = WalletQueryCache.peek(address)
+                if cached is not None and WalletQueryCache.is_fresh(cached[1]):
+                    details = cached[0]
+                else:
+                    details = await WalletQueryCache.refresh(address)
+                    if details is None and cached is not None:
+                        # 刷新失败时退回到旧数据
+                        details = cached[0]
+            results[address] = details
+            if on_result is not None:
+                await on_result(address, details)
+
+        await asyncio.gather(*(_query(address) for address in addresses))
+        return results
@@ -0,0 +1,24 @@
+"""
+独立的链上摄取 worker 进程：python -m app.workers.ingest
+按分片租约分配用户监听的地址，负责拉取交易、写入流水和发送收支提醒。
+可以在多个核心或主机上启动多个实例，监听分片会在它们之间自动平衡。
+"""
+import asyncio
+
+from app.bot.address_listener_worker import address_listener_worker
+from app.bot.chain_ingest_worker import chain_ingest_worker
+from app.bot.ledger_worker import ledger_worker
+from app.services.lease_service import lease_keeper_worker
+from app.workers.runner import INGEST_WORKER, run_worker_process
+
+WORKERS = {
+    "lease_keeper": lease_keeper_worker,
+    # 消费本进程持有分片中的监听地址，收支提醒写入通知发件箱
+    "address_listener": address_listener_worker,
+    "ledger": ledger_worker,
+    INGEST_WORKER: chain_ingest_worker,
+}
+
+
+if __name__ == "__main__":
+    asyncio.run(run_worker_process("ingest", WORKERS, leader=False, shards=True))
@@ -0,0 +1,29 @@
+"""
+独立的支付 worker 进程：python -m app.workers.payments
+竞争 leader 租约，负责收款地址的摄取、支付匹配与确认、能量发放，以及其他只能由一个副本执行的任务。
+"""
+import asyncio
+
+from app.bot.chain_ingest_worker import chain_ingest_worker
+from app.bot.ledger_worker import ledger_worker
+from app.bot.payment_worker import payment_polling_worker
+from app.services.balance_monitor_service import balance_monitor_worker
+from app.services.lease_service import lease_keeper_worker
+from app.services.order_archive_service import order_archive_worker
+from app.workers.runner import INGEST_WORKER, run_worker_process
+
+WORKERS = {
+    "lease_keeper": lease_keeper_worker,
+    # 消费收款地址的交易，确认订单并发放服务
+    "payment": payment_polling_worker,
+    # 收款地址的交易也写入本地流水
+    "ledger": ledger_worker,
+    # 本进程自己的摄取任务，只拉取本进程订阅者关心的收款地址
+    INGEST_WORKER: chain_ingest_worker,
+    "balance_monitor": balance_monitor_worker,
+    "order_archive": order_archive_worker,
+}
+
+
+if __name__ == "__main__":
+    asyncio.run(run_worker_process("payments", WORKERS, leader=True, shards=False))
@@ -0,0 +1,69 @@
+import asyncio
+import logging
+import signal
+from typing import Awaitable, Callable, Dict
+
+from app.core.config import settings
+from app.core.loop_monitor import LoopMonitor
+from app.core.supervisor import TaskSupervisor
+from app.db.database import init_db
+from app.services.event_bus import TransactionEventBus
+from app.services.lease_service import LeaseService
+from app.services.monitoring_service import MonitoringService
+from app.services.notification_outbox import OutboxApplication
+
+# 发布交易的摄取任务，关闭时最先停止
+INGEST_WORKER = "chain_ingest"
+
+WorkerFunction = Callable[[object], Awaitable[None]]
+
+
+def start_workers(ptb_app, workers: Dict[str, WorkerFunction]):
+    """按顺序启动受监管的后台任务 (消费者需要排在摄取任务之前，保证摄取开始时已经完成订阅)。"""
+    for name, worker in workers.items():
+        TaskSupervisor.start(name, lambda worker=worker: worker(ptb_app))
+
+
+async def stop_workers():
+    """
+    关闭后台任务：先停止摄取 (连同补数)，再等消费者处理完已经投递的交易、发完对应的通知，
+    然后停止其余任务，并在释放租约之前把内存中的处理进度写回数据库。
+    """
+    await TaskSupervisor.stop([INGEST_WORKER])
+    await TransactionEventBus.drain(settings.SHUTDOWN_DRAIN_TIMEOUT_SECONDS)
+    await TaskSupervisor.stop()
+    await TransactionEventBus.flush_cursors()
+    # 主动释放租约，让其他副本立即接管
+    await LeaseService.release_all()
+
+
+async def run_worker_process(role: str, workers: Dict[str, WorkerFunction], leader: bool, shards: bool):
+    """
+    独立 worker 进程的主函数：不连接 Telegram，只运行后台任务，直到收到 SIGINT / SIGTERM。
+    与 bot 进程之间只通过 MongoDB 通信：订单状态，以及由 bot 进程发送的通知发件箱。
+    """
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
+    )
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    logging.info(f"--- Worker process ({role}) starting up ---")
+    LoopMonitor.start()
+
+    mongo_client = await init_db()
+    ptb_app = OutboxApplication()
+    MonitoringService.ptb_app = ptb_app
+
+    LeaseService.configure(leader=leader, shards=shards)
+    # 先完成一次租约竞选，其他任务据此决定本进程负责哪些工作
+    await LeaseService.heartbeat()
+    start_workers(ptb_app, workers)
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+    await stopping.wait()
+
+    logging.info(f"--- Worker process ({role}) shutting down ---")
+    await stop_workers()
+    mongo_client.close()
@@ -1,5 +1,4 @@
 import logging
-import asyncio
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request
@@ -29,6 +28,10 @@ from app.bot.handlers import (
     show_monitor_settings_callback,
     toggle_monitor_setting_callback,
     delete_monitor_address_callback,
+    export_monitor_addresses_callback,
+    statement_start_callback,
+    statement_range_callback,
+    statement_command,
     monitor_this_address_callback,
     # 会话处理器
     monitor_conv_handler,
@@ -51,11 +54,25 @@ from app.bot.handlers_smart_trx import (
     switch_currency_callback,
     cancel_order_callback
 )
+from app.bot.handlers_admin import latency_command, stats_command
 from app.bot import constants as const
+from app.bot.update_processor import PerUserUpdateProcessor
+from app.bot.persistence import BotApplication, MongoPersistence, bot_state_eviction_worker
 
 from app.bot.payment_worker import payment_polling_worker
 from app.bot.address_listener_worker import address_listener_worker
+from app.bot.chain_ingest_worker import chain_ingest_worker
+from app.bot.ledger_worker import ledger_worker
 from app.services.balance_monitor_service import balance_monitor_worker
+from app.services.lease_service import LeaseService, lease_keeper_worker
+from app.services.order_archive_service import order_archive_worker
+from app.api.metrics import router as metrics_router
+from app.api.admin import router as admin_router
+from app.api.telegram_webhook import router as telegram_webhook_router
+from app.core.loop_monitor import LoopMonitor
+from app.core.supervisor import TaskSupervisor
+from app.services.notification_outbox import notification_dispatcher_worker
+from app.workers.runner import INGEST_WORKER, stop_workers
 
 # --- 日志配置 ---
 logging.basicConfig(
@@ -75,12 +92,29 @@ async def lifespan(app: FastAPI):
     """
     global ptb_app
     logger.info("--- Application starting up ---")
+    # 尽早开始监控事件循环，启动过程中的阻塞也能被发现
+    LoopMonitor.start()
     
-    # 1. 初始化数据库
-    await init_db()
+    # 1. 初始化数据库，客户端保存在应用状态上，关闭时释放连接池
+    app.state.mongo_client = await init_db()
 
     # 2. 初始化 Telegram Bot Application
-    ptb_app = Application.builder().token(settings.TELEGRAM_TOKEN).build()
+    # 不同用户的 update 并发处理，同一用户的 update 按顺序处理
+    builder = (
+        Application.builder()
+        .token(settings.TELEGRAM_TOKEN)
+        .application_class(BotApplication)
+        .concurrent_updates(PerUserUpdateProcessor(settings.TELEGRAM_CONCURRENT_UPDATES))
+        # 会话状态和 user_data 持久化到 MongoDB，重启后不丢失
+        .persistence(MongoPersistence())
+    )
+    if settings.WEBHOOK_URL:
+        if not settings.WEBHOOK_SECRET_TOKEN:
+            raise RuntimeError("启用 webhook 模式 (WEBHOOK_URL) 时必须设置 WEBHOOK_SECRET_TOKEN")
+        # webhook 模式下 update 由 FastAPI 路由放入 update_queue，不需要 Updater
+        builder = builder.updater(None)
+    ptb_app = builder.build()
+    app.state.ptb_app = ptb_app
     
     # 3. 将 ptb_app 实例传递给需要它的服务层，以便发送消息
     MonitoringService.ptb_app = ptb_app
@@ -112,41 +146,76 @@ async def lifespan(app: FastAPI):
         CallbackQueryHandler(switch_currency_callback, pattern='^switch_currency:'),
         CallbackQueryHandler(cancel_order_callback, pattern='^cancel_order:'),
         CallbackQueryHandler(monitor_this_address_callback, pattern='^monitor_this:'),
-        CallbackQueryHandler(show_monitoring_list_callback, pattern='^show_monitoring_list$'),
+        CallbackQueryHandler(show_monitoring_list_callback, pattern='^(show_monitoring_list$|monitor_list_page:)'),
         CallbackQueryHandler(show_monitor_actions_callback, pattern='^monitor_actions:'),
         CallbackQueryHandler(show_monitor_settings_callback, pattern='^monitor_settings:'),
         CallbackQueryHandler(toggle_monitor_setting_callback, pattern='^toggle:'),
         CallbackQueryHandler(delete_monitor_address_callback, pattern='^delete_monitor:'),
+        CallbackQueryHandler(export_monitor_addresses_callback, pattern='^export_monitor_addresses$'),
+        CallbackQueryHandler(statement_start_callback, pattern='^statement:'),
+        CallbackQueryHandler(statement_range_callback, pattern='^statement_range:'),
     ]
     if callback_handlers:
         ptb_app.add_handlers(handlers={2: callback_handlers})
     
     # 最后的 CommandHandler，确保 start 命令总是可用
     ptb_app.add_handler(CommandHandler("start", start_command), group=3)
+    ptb_app.add_handler(CommandHandler("statement", statement_command), group=3)
+    # 管理员命令 (仅在 ADMIN_CHAT_ID 会话中响应)
+    ptb_app.add_handler(CommandHandler("latency", latency_command), group=3)
+    ptb_app.add_handler(CommandHandler("stats", stats_command), group=3)
    
     # 4. 初始化 PTB Application
     await ptb_app.initialize()
 
-    # 5. 启动与 Telegram 的通信 (轮询模式)
+    # 5. 启动与 Telegram 的通信
     # 这段代码负责接收用户的消息和命令，必须保留
-    logger.info("Starting bot in Polling mode...")
-    await ptb_app.updater.start_polling(drop_pending_updates=True) # drop_pending_updates 可以在重启时忽略旧消息
-    # start() 会启动所有组件，包括 JobQueue 的调度器
+    if settings.WEBHOOK_URL:
+        logger.info(f"Starting bot in Webhook mode ({settings.WEBHOOK_URL})...")
+        await ptb_app.bot.set_webhook(
+            url=settings.WEBHOOK_URL,
+            secret_token=settings.WEBHOOK_SECRET_TOKEN,
+            allowed_updates=Update.ALL_TYPES,
+            drop_pending_updates=True, # 重启时忽略旧消息
+        )
+    else:
+        logger.info("Starting bot in Polling mode...")
+        await ptb_app.updater.start_polling(drop_pending_updates=True) # drop_pending_updates 可以在重启时忽略旧消息
+    # start() 会启动所有组件，包括 JobQueue 的调度器和 update 处理
     await ptb_app.start()
-    logger.info("Bot polling has started.")
-    # --- 启动两个独立的后台任务 ---
-    # 任务1：监听支付地址，用于确认订单
-    asyncio.create_task(payment_polling_worker(ptb_app))
-    # 任务2：监听用户添加的地址，用于收入支出提醒
-    asyncio.create_task(address_listener_worker(ptb_app))
-    # 任务3：监控 kuaizu.io 余额，余额不足时通知管理员
-    asyncio.create_task(balance_monitor_worker(ptb_app))
-    
+    logger.info("Bot has started.")
+    # --- 启动后台任务 ---
+    # 所有后台任务都由 TaskSupervisor 启动：崩溃后按退避重启，存活状态见 /health
+    if settings.RUN_WORKERS_IN_PROCESS:
+        # 先完成一次租约竞选，其他任务据此决定本副本负责哪些工作
+        await LeaseService.heartbeat()
+        TaskSupervisor.start("lease_keeper", lambda: lease_keeper_worker(ptb_app))
+        # 任务1：消费收款地址的交易，用于确认订单
+        TaskSupervisor.start("payment", lambda: payment_polling_worker(ptb_app))
+        # 任务2：消费用户添加地址的交易，用于收入支出提醒
+        TaskSupervisor.start("address_listener", lambda: address_listener_worker(ptb_app))
+        # 把摄取到的所有交易写入本地流水 (被动订阅，不增加链上请求)
+        TaskSupervisor.start("ledger", lambda: ledger_worker(ptb_app))
+        # 摄取任务：每个地址每周期只拉取一次链上数据，发布给上面的消费者
+        # (在消费者之后启动，保证它们已经完成订阅)
+        TaskSupervisor.start(INGEST_WORKER, lambda: chain_ingest_worker(ptb_app))
+        # 任务3：监控 kuaizu.io 余额，余额不足时通知管理员
+        TaskSupervisor.start("balance_monitor", lambda: balance_monitor_worker(ptb_app))
+        # 把已结束的旧订单移入 orders_archive，保持 orders 集合精简
+        TaskSupervisor.start("order_archive", lambda: order_archive_worker(ptb_app))
+    else:
+        logger.info("后台任务由独立的 worker 进程运行 (app.workers.payments / app.workers.ingest)。")
+    # 淘汰内存中空的或长期闲置的 user_data / chat_data
+    TaskSupervisor.start("bot_state_eviction", lambda: bot_state_eviction_worker(ptb_app))
+    # 发送 worker 进程写入发件箱的通知
+    TaskSupervisor.start("notification_dispatcher", lambda: notification_dispatcher_worker(ptb_app))
+
 
     yield
 
     # --- 应用关闭时执行 ---
     logger.info("--- Application shutting down ---")
+    await stop_workers()
     if ptb_app:
         if ptb_app.updater and ptb_app.updater.running:
             logger.info("Stopping bot polling...")
@@ -155,11 +224,16 @@ async def lifespan(app: FastAPI):
              await ptb_app.stop()
         await ptb_app.shutdown()
         logger.info("Bot has been shut down.")
+    # 最后关闭数据库连接，上面的关闭步骤仍可能写库
+    app.state.mongo_client.close()
 
 # --- FastAPI 应用实例 ---
 app = FastAPI(lifespan=lifespan)
+app.include_router(metrics_router)
+app.include_router(admin_router)
+app.include_router(telegram_webhook_router)
 
 # --- API 根路由 ---
 @app.get("/")
 def read_root():
-    return {"status": "ok", "bot_mode": "polling", "chain_monitor": "websocket"}
\ No newline at end of file
+    return {"status": "ok", "bot_mode": "webhook" if settings.WEBHOOK_URL else "polling", "chain_monitor": "polling"}
\ No newline at end of file
@@ -0,0 +1,28 @@
+"""
+测试不连接真实的 Telegram、TronGrid 和 MongoDB。
+app.core.config 在导入时就读取必填的配置，这里为它们提供占位值 (已设置的环境变量优先)。
+"""
+import os
+
+_PLACEHOLDER_SETTINGS = {
+    "TELEGRAM_TOKEN": "123456:TEST",
+    "SPECIAL_OFFER_ADDRESS": "TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6t",
+    "SPECIAL_OFFER_PRICE": "1",
+    "TRX_EXCHANGE_ADDRESS": "TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6t",
+    "TRX_EXCHANGE_PRICE": "1",
+    "ENERGY_FLASH_ADDRESS": "TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6t",
+    "ENERGY_FLASH_PRICE": "1",
+    "ENERGY_STANDARD_ADDRESS": "TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6t",
+    "ENERGY_STANDARD_PRICE": "1",
+    "ENERGY_SMART_ADDRESS": "TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6t",
+    "ENERGY_SMART_PRICE": "1",
+    "ENERGY_SMART_PRICE_USDT": "1",
+    "TRONGRID_API_KEY": "test",
+    "KUAZU_API_KEY": "test",
+    "MONGO_URI": "mongodb://localhost:27017/test",
+    "ADMIN_CHAT_ID": "1",
+    "CUSTOMER_SERVICE_URL": "https://t.me/test",
+}
+
+for _name, _value in _PLACEHOLDER_SETTINGS.items():
+    os.environ.setdefault(_name, _value)
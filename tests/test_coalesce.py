@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from app.core.coalesce import SingleFlight, coalesce
+
+
+def test_concurrent_calls_share_one_execution():
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def scenario():
+        flights = SingleFlight()
+        results = await asyncio.gather(*(flights.run("key", work) for _ in range(5)))
+        assert results == ["result"] * 5
+        assert not flights.in_flight("key")
+
+    asyncio.run(scenario())
+    assert len(calls) == 1
+
+
+def test_different_keys_and_later_calls_run_separately():
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0)
+        return len(calls)
+
+    async def scenario():
+        flights = SingleFlight()
+        await asyncio.gather(flights.run("a", work), flights.run("b", work))
+        await flights.run("a", work)
+
+    asyncio.run(scenario())
+    assert len(calls) == 3
+
+
+def test_exception_is_shared_and_key_is_released():
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def scenario():
+        flights = SingleFlight()
+        results = await asyncio.gather(
+            flights.run("key", failing), flights.run("key", failing), return_exceptions=True
+        )
+        assert all(isinstance(result, ValueError) for result in results)
+        assert not flights.in_flight("key")
+        assert await flights.run("key", lambda: asyncio.sleep(0, result="ok")) == "ok"
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_does_not_cancel_the_work():
+    async def work():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def scenario():
+        flights = SingleFlight()
+        owner = asyncio.create_task(flights.run("key", work))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(flights.run("key", work))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert await owner == "done"
+
+    asyncio.run(scenario())
+
+
+def test_coalesce_decorator_keys_by_arguments():
+    calls = []
+
+    @coalesce(lambda address: address)
+    async def lookup(address):
+        calls.append(address)
+        await asyncio.sleep(0.01)
+        return address.upper()
+
+    async def scenario():
+        return await asyncio.gather(lookup("a"), lookup("a"), lookup("b"))
+
+    assert asyncio.run(scenario()) == ["A", "A", "B"]
+    assert sorted(calls) == ["a", "b"]
@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+from beanie import init_beanie
+
+from app.db.models import ProcessedTransaction
+from app.services import dedup_service
+from app.services.dedup_service import ProcessedTxStore
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可手动拨动的 time.monotonic。"""
+    now = [1000.0]
+    monkeypatch.setattr(dedup_service.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def run():
+    """在内存中的 MongoDB (mongomock) 上运行协程；持久层的唯一索引由它提供。"""
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+
+    def runner(coro_fn):
+        async def main():
+            client = mongomock_motor.AsyncMongoMockClient()
+            await init_beanie(database=client["test"], document_models=[ProcessedTransaction])
+            return await coro_fn()
+
+        return asyncio.run(main())
+
+    return runner
+
+
+def test_claim_is_granted_once(run):
+    async def scenario():
+        store = ProcessedTxStore("test")
+        assert await store.claim("tx1")
+        assert not await store.claim("tx1")
+        assert store.contains("tx1")
+
+    run(scenario)
+
+
+def test_expired_entries_are_dropped_from_the_front(run, clock):
+    async def scenario():
+        store = ProcessedTxStore("test", ttl_seconds=10)
+        await store.claim("old")
+        clock[0] += 5
+        await store.claim("new")
+        clock[0] += 6
+
+        assert not store.contains("old")
+        assert store.contains("new")
+        assert len(store) == 1
+
+    run(scenario)
+
+
+def test_capacity_evicts_oldest_but_database_still_dedups(run):
+    async def scenario():
+        store = ProcessedTxStore("test", max_entries=2)
+        for tx_id in ("a", "b", "c"):
+            assert await store.claim(tx_id)
+
+        # 超出容量的条目在下一次查询时从头部淘汰
+        assert not store.contains("a")
+        assert len(store) == 2
+        # 内存层已淘汰，但持久层的唯一索引仍然拒绝重复认领
+        assert not await store.claim("a")
+
+    run(scenario)
+
+
+def test_release_allows_the_transaction_to_be_claimed_again(run):
+    async def scenario():
+        store = ProcessedTxStore("test")
+        assert await store.claim("tx1")
+        await store.release("tx1")
+
+        assert not store.contains("tx1")
+        assert await store.claim("tx1")
+
+    run(scenario)
+
+
+def test_failed_insert_is_not_remembered(run, monkeypatch):
+    async def failing_insert(self, *args, **kwargs):
+        raise RuntimeError("database unavailable")
+
+    async def scenario():
+        store = ProcessedTxStore("test")
+        monkeypatch.setattr(ProcessedTransaction, "insert", failing_insert)
+        with pytest.raises(RuntimeError):
+            await store.claim("tx1")
+        assert not store.contains("tx1")
+
+    run(scenario)
@@ -0,0 +1,40 @@
+from app.bot.handlers import MONITOR_EXPORT_COLUMNS, _parse_import_lines
+
+ADDRESS_A = "TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6t"
+ADDRESS_B = "TG3XXyExBkPp9nzdajDZsozEu4BkaSJozs"
+
+
+def test_one_address_per_line_with_optional_nickname():
+    entries, invalid = _parse_import_lines(f"{ADDRESS_A},主钱包\n{ADDRESS_B}\n")
+    assert entries == {ADDRESS_A: "主钱包", ADDRESS_B: None}
+    assert invalid == []
+
+
+def test_blank_lines_and_whitespace_are_ignored():
+    entries, invalid = _parse_import_lines(f"\n  {ADDRESS_A} ,  备注  \n\n   \n")
+    assert entries == {ADDRESS_A: "备注"}
+    assert invalid == []
+
+
+def test_duplicate_address_keeps_the_first_nickname():
+    entries, _ = _parse_import_lines(f"{ADDRESS_A},第一次\n{ADDRESS_A},第二次\n")
+    assert entries == {ADDRESS_A: "第一次"}
+
+
+def test_invalid_lines_are_collected():
+    typo = ADDRESS_A[:-1] + "u"
+    entries, invalid = _parse_import_lines(f"{typo}\nhello,world\n{ADDRESS_B}\n")
+    assert entries == {ADDRESS_B: None}
+    assert invalid == [typo, "hello"]
+
+
+def test_exported_csv_can_be_imported_again():
+    header = ",".join(MONITOR_EXPORT_COLUMNS)
+    text = (
+        f"\ufeff{header}\r\n"
+        f"{ADDRESS_A},主钱包,True,True,True,True,2026-01-01 00:00:00\r\n"
+        f"{ADDRESS_B},,True,False,True,True,2026-01-02 00:00:00\r\n"
+    )
+    entries, invalid = _parse_import_lines(text)
+    assert entries == {ADDRESS_A: "主钱包", ADDRESS_B: None}
+    assert invalid == []
@@ -0,0 +1,34 @@
+import pytest
+
+from app.services.order_latency_service import _percentile
+
+TEN_VALUES = [float(v) for v in range(1, 11)]
+
+
+@pytest.mark.parametrize("percentile, expected", [
+    (50, 5.0),
+    (90, 9.0),
+    (95, 10.0),
+    (99, 10.0),
+    (100, 10.0),
+    (10, 1.0),
+    (11, 2.0),
+])
+def test_nearest_rank(percentile, expected):
+    # 最近秩：rank = ceil(p / 100 * n)，取排序后的第 rank 个值，不做插值
+    assert _percentile(TEN_VALUES, percentile) == expected
+
+
+def test_lowest_percentile_returns_the_minimum():
+    assert _percentile(TEN_VALUES, 0) == 1.0
+
+
+def test_single_value():
+    for percentile in (0, 50, 99, 100):
+        assert _percentile([3.5], percentile) == 3.5
+
+
+def test_result_is_always_an_observed_value():
+    values = [0.2, 0.4, 1.1, 7.9]
+    assert _percentile(values, 50) == 0.4
+    assert _percentile(values, 51) == 1.1
@@ -0,0 +1,35 @@
+from datetime import datetime
+
+import pytest
+
+from app.services import order_stats_service
+from app.services.order_stats_service import OrderStatsService, _bucket_start
+
+NOW = datetime(2026, 3, 15, 13, 45, 30)
+
+
+class _FrozenDatetime(datetime):
+    @classmethod
+    def utcnow(cls):
+        return NOW
+
+
+@pytest.fixture(autouse=True)
+def frozen_now(monkeypatch):
+    monkeypatch.setattr(order_stats_service, "datetime", _FrozenDatetime)
+
+
+def test_default_window_is_today():
+    assert OrderStatsService.window(days=1) == (datetime(2026, 3, 15), "day")
+
+
+def test_day_window_counts_today_as_the_first_day():
+    assert OrderStatsService.window(days=7) == (datetime(2026, 3, 9), "day")
+
+
+def test_hour_window_uses_hourly_rollups_including_the_current_hour():
+    since, granularity = OrderStatsService.window(hours=6)
+    assert granularity == "hour"
+    # summary 按小时对齐，覆盖 08:00 ~ 13:59 共 6 个小时段 (含当前小时)
+    assert _bucket_start(since, granularity) == datetime(2026, 3, 15, 8, 0)
+    assert since == datetime(2026, 3, 15, 8, 45, 30)
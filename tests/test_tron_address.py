@@ -0,0 +1,50 @@
+import base58
+import pytest
+
+from app.core.tron_address import is_valid_tron_address
+
+# 主网 USDT 合约地址
+VALID_ADDRESS = "TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6t"
+
+
+def _encode(prefix: int) -> str:
+    return base58.b58encode_check(bytes([prefix]) + bytes(range(20))).decode()
+
+
+def test_valid_address():
+    assert is_valid_tron_address(VALID_ADDRESS)
+    assert is_valid_tron_address(_encode(0x41))
+
+
+def test_bad_checksum_is_rejected():
+    # 只改最后一个字符，base58 仍然合法，但校验和对不上
+    typo = VALID_ADDRESS[:-1] + ("u" if VALID_ADDRESS[-1] != "u" else "v")
+    assert not is_valid_tron_address(typo)
+
+
+def test_wrong_prefix_is_rejected():
+    # 0x42 前缀编码后同样以 T 开头、长度 34，只能靠解码后的版本字节识别
+    address = _encode(0x42)
+    assert address.startswith("T") and len(address) == 34
+    assert not is_valid_tron_address(address)
+
+
+@pytest.mark.parametrize("address", [
+    VALID_ADDRESS[:-1] + "0",  # 0 不在 base58 字母表中
+    VALID_ADDRESS[:10] + "O" + VALID_ADDRESS[11:],
+    VALID_ADDRESS[:10] + "l" + VALID_ADDRESS[11:],
+])
+def test_non_base58_characters_are_rejected(address):
+    assert not is_valid_tron_address(address)
+
+
+@pytest.mark.parametrize("address", [
+    "",
+    VALID_ADDRESS[:-1],
+    VALID_ADDRESS + "1",
+    "0x" + "ab" * 20,
+    "A" + VALID_ADDRESS[1:],
+    None,
+])
+def test_malformed_input_is_rejected(address):
+    assert not is_valid_tron_address(address)